@@ -0,0 +1,53 @@
+-- Migration 032: Replace the per-row price history trigger with a statement-level trigger
+-- track_price_history() (migration 003) ran one UPDATE per inserted price, so a bulk load of
+-- N rows issued N UPDATEs against vendor_pricing. The replacement fires once per INSERT
+-- statement and retires every superseded current row with a single join against the
+-- statement's transition table.
+--
+-- The UPDATE branch of the old function only assigned NEW.updated_date inside an AFTER
+-- trigger, which has no effect, so it is not carried over. Callers already set updated_date.
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trigger_track_price_history ON takeoff.vendor_pricing;
+DROP FUNCTION IF EXISTS track_price_history();
+
+-- Supports the retire join and every "current price for vendor/product" lookup
+CREATE INDEX IF NOT EXISTS idx_vendor_pricing_current_vendor_product
+    ON takeoff.vendor_pricing(vendor_id, product_id)
+    WHERE is_current;
+
+CREATE OR REPLACE FUNCTION takeoff.retire_superseded_prices()
+RETURNS TRIGGER AS $$
+BEGIN
+    -- The newest inserted row per vendor/product stays current, matching the row-by-row
+    -- behaviour where each insert retired everything that came before it
+    UPDATE takeoff.vendor_pricing vp
+    SET is_current = false,
+        updated_date = CURRENT_TIMESTAMP
+    FROM (
+        SELECT vendor_id, product_id, MAX(pricing_id) AS pricing_id
+        FROM new_prices
+        GROUP BY vendor_id, product_id
+    ) latest
+    WHERE vp.vendor_id = latest.vendor_id
+    AND vp.product_id = latest.product_id
+    AND vp.pricing_id <> latest.pricing_id
+    AND vp.is_current = true;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trigger_retire_superseded_prices
+    AFTER INSERT ON takeoff.vendor_pricing
+    REFERENCING NEW TABLE AS new_prices
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.retire_superseded_prices();
+
+COMMENT ON FUNCTION takeoff.retire_superseded_prices() IS
+'Statement-level price history: marks prior current prices as not current for every vendor/product inserted by the statement';
+
+COMMIT;
+
+SELECT 'Migration 032 completed: statement-level price history trigger' as status;
@@ -0,0 +1,23 @@
+-- Migration 033: Let set-based imports bypass the per-row item_description trigger
+-- trg_set_item_description_from_item_name (migration 029) looks up items or plan options
+-- for every inserted product. The products import now derives item_description for the
+-- whole batch in a single INSERT ... SELECT, so the trigger gains a WHEN clause that skips
+-- it for the current transaction when the importer sets:
+--
+--     SET LOCAL takeoff.skip_item_description_trigger = 'on';
+--
+-- All other writes are unaffected and still go through the trigger.
+
+BEGIN;
+
+DROP TRIGGER IF EXISTS trg_set_item_description_from_item_name ON takeoff.products;
+
+CREATE TRIGGER trg_set_item_description_from_item_name
+BEFORE INSERT OR UPDATE ON takeoff.products
+FOR EACH ROW
+WHEN (current_setting('takeoff.skip_item_description_trigger', true) IS DISTINCT FROM 'on')
+EXECUTE FUNCTION takeoff.set_item_description_from_item_name();
+
+COMMIT;
+
+SELECT 'Migration 033 completed: item_description trigger can be skipped by bulk imports' as status;
@@ -0,0 +1,165 @@
+-- Migration 034: Per-table data versions for cache invalidation
+-- takeoff.data_versions gives one version per tracked table: the number of committed
+-- transactions that changed its rows. Statement-level triggers record a change once per
+-- writing transaction, and only when the statement changed at least one row (TRUNCATE always
+-- counts), so a bulk import of any size costs one change and a no-op sync UPDATE costs none.
+-- Export caches key their files on the versions of the tables a query reads: any committed
+-- write makes the old files unreachable, and an unchanged dataset keeps its key.
+--
+-- Changes are recorded as rows of takeoff.data_version_changes, one per (table, transaction),
+-- and the version is their sum, so it becomes visible exactly when the new rows do and grows
+-- by one at every commit whatever the commit order. Writers insert their own rows and never
+-- wait on each other: a transaction's first change to a table folds the committed rows of
+-- earlier transactions into its own row, skipping rows another transaction is folding, which
+-- keeps the sum and bounds the table at about one row per table and concurrent writer.
+
+BEGIN;
+
+-- An earlier revision kept data_versions as a table of counters; carry its versions over
+DO $$
+BEGIN
+    IF to_regclass('takeoff.data_versions') IS NOT NULL AND EXISTS (
+        SELECT 1 FROM pg_class WHERE oid = 'takeoff.data_versions'::regclass AND relkind = 'r'
+    ) THEN
+        ALTER TABLE takeoff.data_versions RENAME TO data_versions_old;
+    END IF;
+END $$;
+
+CREATE TABLE IF NOT EXISTS takeoff.data_version_changes (
+    table_name VARCHAR(63) NOT NULL,
+    -- Recording transaction (txid_current()); NULL for the initial row of a table
+    xact_id BIGINT,
+    changes BIGINT NOT NULL,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_data_version_changes_table_xact
+    ON takeoff.data_version_changes(table_name, xact_id);
+
+DO $$
+BEGIN
+    IF to_regclass('takeoff.data_versions_old') IS NOT NULL THEN
+        INSERT INTO takeoff.data_version_changes (table_name, changes, updated_at)
+        SELECT table_name, version, updated_at FROM takeoff.data_versions_old;
+        DROP TABLE takeoff.data_versions_old;
+    END IF;
+END $$;
+
+CREATE OR REPLACE VIEW takeoff.data_versions AS
+SELECT
+    table_name,
+    SUM(changes)::BIGINT AS version,
+    MAX(updated_at) AS updated_at
+FROM takeoff.data_version_changes
+GROUP BY table_name;
+
+CREATE OR REPLACE FUNCTION takeoff.record_data_change(p_table_name VARCHAR)
+RETURNS VOID AS $$
+BEGIN
+    -- Only this transaction can hold its key, so the insert never waits
+    INSERT INTO takeoff.data_version_changes (table_name, xact_id, changes)
+    VALUES (p_table_name, txid_current(), 1)
+    ON CONFLICT (table_name, xact_id) DO NOTHING;
+
+    IF NOT FOUND THEN
+        RETURN;
+    END IF;
+
+    WITH folded AS (
+        DELETE FROM takeoff.data_version_changes
+        WHERE ctid IN (
+            SELECT ctid FROM takeoff.data_version_changes
+            WHERE table_name = p_table_name
+            AND xact_id IS DISTINCT FROM txid_current()
+            FOR UPDATE SKIP LOCKED
+        )
+        RETURNING changes
+    )
+    UPDATE takeoff.data_version_changes
+    SET changes = changes + (SELECT COALESCE(SUM(changes), 0) FROM folded)
+    WHERE table_name = p_table_name
+    AND xact_id = txid_current();
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.bump_data_version()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        IF NOT EXISTS (SELECT 1 FROM new_rows) THEN
+            RETURN NULL;
+        END IF;
+    ELSIF TG_OP IN ('UPDATE', 'DELETE') THEN
+        IF NOT EXISTS (SELECT 1 FROM old_rows) THEN
+            RETURN NULL;
+        END IF;
+    END IF;
+
+    PERFORM takeoff.record_data_change(TG_TABLE_NAME);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    tracked TEXT;
+BEGIN
+    FOREACH tracked IN ARRAY ARRAY[
+        'takeoffs', 'products', 'items', 'cost_codes', 'cost_groups', 'plans',
+        'plan_elevations', 'plan_options', 'vendors', 'vendor_pricing', 'jobs', 'quotes'
+    ] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_bump_data_version ON takeoff.%I', tracked);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_bump_data_version_insert ON takeoff.%I', tracked);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_bump_data_version_update ON takeoff.%I', tracked);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_bump_data_version_delete ON takeoff.%I', tracked);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_bump_data_version_truncate ON takeoff.%I', tracked);
+
+        -- Transition tables allow one event per trigger; TRUNCATE has none
+        EXECUTE format(
+            'CREATE TRIGGER trg_bump_data_version_insert
+                AFTER INSERT ON takeoff.%I
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.bump_data_version()',
+            tracked
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_bump_data_version_update
+                AFTER UPDATE ON takeoff.%I
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.bump_data_version()',
+            tracked
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_bump_data_version_delete
+                AFTER DELETE ON takeoff.%I
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.bump_data_version()',
+            tracked
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_bump_data_version_truncate
+                AFTER TRUNCATE ON takeoff.%I
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.bump_data_version()',
+            tracked
+        );
+
+        INSERT INTO takeoff.data_version_changes (table_name, changes)
+        SELECT tracked, 0
+        WHERE NOT EXISTS (SELECT 1 FROM takeoff.data_version_changes WHERE table_name = tracked);
+    END LOOP;
+END $$;
+
+COMMENT ON TABLE takeoff.data_version_changes IS
+'Changes per table and writing transaction, folded together as transactions write; data_versions sums them';
+
+COMMENT ON VIEW takeoff.data_versions IS
+'Version per table: committed transactions that changed it; cache keys include the versions of the tables they read';
+
+COMMIT;
+
+SELECT 'Migration 034 completed: data versions tracked for ' || COUNT(*) || ' tables' as status
+FROM takeoff.data_versions;
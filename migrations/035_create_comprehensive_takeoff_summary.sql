@@ -0,0 +1,287 @@
+-- Migration 035: Incrementally maintained summary table for v_comprehensive_takeoff_analysis
+-- The comprehensive analysis grid read the view on every request: an eight-table join plus a
+-- DISTINCT ON over all of vendor_pricing, sorted twice. takeoff.comprehensive_takeoff_summary
+-- holds the same columns as a plain indexed table. Statement-level triggers on every table
+-- the view reads refresh just the takeoffs a statement touched, inside the same transaction,
+-- so the table always matches the view.
+--
+-- The view's current price subquery becomes a LATERAL lookup on a partial index, so asking
+-- the view for a few takeoffs no longer sorts the whole price table. Rows and columns are
+-- unchanged.
+--
+-- Full rebuild (e.g. after changing the view; recreate the table if its columns changed):
+--     python utils/rebuild_comprehensive_takeoff_summary.py
+
+BEGIN;
+
+CREATE INDEX IF NOT EXISTS idx_vendor_pricing_current_product_created
+    ON takeoff.vendor_pricing(product_id, created_date DESC)
+    WHERE is_current = true AND is_active = true;
+
+CREATE OR REPLACE VIEW takeoff.v_comprehensive_takeoff_analysis AS
+SELECT
+    t.takeoff_id,
+    -- Plan information
+    pe.plan_full_name,
+    po.option_name,
+    -- Cost and Item information
+    cc.cost_code,
+    i.item_name,
+    -- Use item_description from takeoffs table (editable) as primary, fallback to products
+    COALESCE(t.item_description, p.item_description, i.item_name) as item_description,
+    -- Quantity and pricing
+    COALESCE(t.quantity_source, 'Manual') as quantity_source,
+    COALESCE(t.quantity, 0) as quantity,
+    COALESCE(t.unit_price, vp_current.price, 0) as unit_price,
+    COALESCE(t.price_factor, 1.0) as price_factor,
+    COALESCE(t.unit_of_measure, p.unit_of_measure, i.default_unit, 'EA') as unit_of_measure,
+    -- Calculated quantity using formulas where applicable
+    CASE
+        WHEN i.qty_formula IS NOT NULL AND i.qty_formula != '' THEN
+            -- Try to evaluate the formula, fallback to manual quantity if formula fails
+            COALESCE(
+                CASE
+                    WHEN i.qty_formula = 'heated_sf_outside_studs' THEN po.heated_sf_outside_studs
+                    WHEN i.qty_formula = 'total_sf_outside_studs' THEN po.total_sf_outside_studs
+                    WHEN i.qty_formula = 'heated_sf_outside_veneer' THEN po.heated_sf_outside_veneer
+                    WHEN i.qty_formula = 'total_sf_outside_veneer' THEN po.total_sf_outside_veneer
+                    WHEN i.qty_formula = 'unheated_sf_outside_studs' THEN po.unheated_sf_outside_studs
+                    WHEN i.qty_formula = 'unheated_sf_outside_veneer' THEN po.unheated_sf_outside_veneer
+                    ELSE COALESCE(t.quantity, 0)
+                END,
+                COALESCE(t.quantity, 0)
+            )
+        ELSE COALESCE(t.quantity, 0)
+    END as calculated_quantity,
+    -- Extended price calculation
+    (COALESCE(t.quantity, 0) * COALESCE(t.unit_price, vp_current.price, 0) * COALESCE(t.price_factor, 1.0)) as extended_price,
+    -- Vendor information
+    v.vendor_name,
+    -- Job information
+    COALESCE(t.job_name, j.job_name) as job_name,
+    COALESCE(t.job_number, j.job_number) as job_number,
+    COALESCE(t.lot_number, j.lot_number) as lot_number,
+    COALESCE(t.customer_name, j.customer_name) as customer_name,
+    -- Additional details
+    COALESCE(t.room, '') as room,
+    COALESCE(t.spec_name, '') as spec_name,
+    COALESCE(t.notes, '') as notes,
+    -- Foreign key references for editing
+    t.job_id,
+    t.product_id,
+    t.vendor_id,
+    t.plan_option_id,
+    t.item_id,
+    t.cost_code_id,
+    -- Timestamps
+    t.created_date,
+    t.updated_date
+FROM takeoff.takeoffs t
+    -- Required joins for plan and option information
+    LEFT JOIN takeoff.plan_options po ON t.plan_option_id = po.plan_option_id
+    LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+    -- Item and cost code joins
+    LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+    LEFT JOIN takeoff.cost_codes cc ON COALESCE(t.cost_code_id, i.cost_code_id) = cc.cost_code_id
+    -- Product join for fallback data
+    LEFT JOIN takeoff.products p ON t.product_id = p.product_id
+    -- Current vendor pricing for price fallback (newest current price of the product)
+    LEFT JOIN LATERAL (
+        SELECT vp.vendor_id, vp.price, vp.unit_of_measure
+        FROM takeoff.vendor_pricing vp
+        WHERE vp.product_id = t.product_id
+        AND vp.is_current = true AND vp.is_active = true
+        ORDER BY vp.created_date DESC
+        LIMIT 1
+    ) vp_current ON true
+    -- Vendor information
+    LEFT JOIN takeoff.vendors v ON COALESCE(t.vendor_id, vp_current.vendor_id) = v.vendor_id
+    -- Job information
+    LEFT JOIN takeoff.jobs j ON t.job_id = j.job_id
+ORDER BY
+    pe.plan_full_name,
+    po.option_name,
+    cc.cost_code,
+    i.item_name,
+    t.takeoff_id;
+
+-- Same columns, in the same order, as the view
+DROP TABLE IF EXISTS takeoff.comprehensive_takeoff_summary;
+CREATE TABLE takeoff.comprehensive_takeoff_summary AS
+SELECT * FROM takeoff.v_comprehensive_takeoff_analysis WITH NO DATA;
+
+ALTER TABLE takeoff.comprehensive_takeoff_summary ADD PRIMARY KEY (takeoff_id);
+-- Grid order (cost code, item name)
+CREATE INDEX idx_comprehensive_takeoff_summary_cost_code_item
+    ON takeoff.comprehensive_takeoff_summary(cost_code, item_name, takeoff_id);
+CREATE INDEX idx_comprehensive_takeoff_summary_plan_option
+    ON takeoff.comprehensive_takeoff_summary(plan_option_id);
+CREATE INDEX idx_comprehensive_takeoff_summary_job
+    ON takeoff.comprehensive_takeoff_summary(job_id);
+
+-- Concurrent transactions refreshing the same takeoff take turns on its summary row: the
+-- refresh locks the existing rows FOR UPDATE (in key order, so two refreshes cannot deadlock
+-- on them) before reading the view, and writes with an upsert, so neither can fail on the
+-- primary key or leave a stale row. Row locks live in the rows themselves rather than the
+-- shared lock table, so a statement touching any number of takeoffs needs no more lock slots.
+-- A takeoff without a summary row yet was inserted by the refreshing transaction itself, so
+-- no other transaction can see it in the view.
+CREATE OR REPLACE FUNCTION takeoff.refresh_comprehensive_takeoff_summary(p_takeoff_ids INTEGER[])
+RETURNS INTEGER AS $$
+DECLARE
+    assignments TEXT;
+    refreshed INTEGER;
+BEGIN
+    IF p_takeoff_ids IS NULL OR cardinality(p_takeoff_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    PERFORM 1 FROM takeoff.comprehensive_takeoff_summary
+    WHERE takeoff_id = ANY(p_takeoff_ids)
+    ORDER BY takeoff_id
+    FOR UPDATE;
+
+    -- Every column but the key, so the upsert follows the table if it is recreated
+    SELECT string_agg(format('%1$I = EXCLUDED.%1$I', attname), ', ' ORDER BY attnum)
+    INTO assignments
+    FROM pg_attribute
+    WHERE attrelid = 'takeoff.comprehensive_takeoff_summary'::regclass
+    AND attnum > 0 AND NOT attisdropped AND attname <> 'takeoff_id';
+
+    EXECUTE format(
+        'INSERT INTO takeoff.comprehensive_takeoff_summary
+        SELECT * FROM takeoff.v_comprehensive_takeoff_analysis
+        WHERE takeoff_id = ANY($1)
+        ON CONFLICT (takeoff_id) DO UPDATE SET %s',
+        assignments
+    ) USING p_takeoff_ids;
+    GET DIAGNOSTICS refreshed = ROW_COUNT;
+
+    -- The view has one row per takeoff, so only deleted takeoffs are left to remove
+    DELETE FROM takeoff.comprehensive_takeoff_summary s
+    WHERE s.takeoff_id = ANY(p_takeoff_ids)
+    AND NOT EXISTS (SELECT 1 FROM takeoff.takeoffs t WHERE t.takeoff_id = s.takeoff_id);
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.rebuild_comprehensive_takeoff_summary()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    TRUNCATE takeoff.comprehensive_takeoff_summary;
+
+    INSERT INTO takeoff.comprehensive_takeoff_summary
+    SELECT * FROM takeoff.v_comprehensive_takeoff_analysis;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger arguments: the changed table's key column, and (for tables other than takeoffs)
+-- the condition selecting takeoffs that read those keys, with %1$s standing for the keys
+CREATE OR REPLACE FUNCTION takeoff.sync_comprehensive_takeoff_summary()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_keys TEXT;
+    affected INTEGER[];
+BEGIN
+    changed_keys := CASE TG_OP
+        WHEN 'INSERT' THEN format('SELECT %I FROM new_rows', TG_ARGV[0])
+        WHEN 'DELETE' THEN format('SELECT %I FROM old_rows', TG_ARGV[0])
+        ELSE format('SELECT %1$I FROM new_rows UNION SELECT %1$I FROM old_rows', TG_ARGV[0])
+    END;
+
+    IF TG_TABLE_NAME = 'takeoffs' THEN
+        EXECUTE format('SELECT array_agg(DISTINCT changed_key) FROM (%s) changed(changed_key)', changed_keys)
+        INTO affected;
+    ELSE
+        EXECUTE format('SELECT array_agg(t.takeoff_id) FROM takeoff.takeoffs t WHERE ' || TG_ARGV[1], changed_keys)
+        INTO affected;
+    END IF;
+
+    PERFORM takeoff.refresh_comprehensive_takeoff_summary(affected);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.truncate_comprehensive_takeoff_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE takeoff.comprehensive_takeoff_summary;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    source RECORD;
+BEGIN
+    FOR source IN
+        SELECT * FROM (VALUES
+            ('takeoffs', 'takeoff_id', ''),
+            ('vendor_pricing', 'product_id', 't.product_id IN (%1$s)'),
+            ('products', 'product_id', 't.product_id IN (%1$s)'),
+            ('items', 'item_id', 't.item_id IN (%1$s)'),
+            ('plan_options', 'plan_option_id', 't.plan_option_id IN (%1$s)'),
+            ('plan_elevations', 'plan_elevation_id',
+                't.plan_option_id IN (SELECT plan_option_id FROM takeoff.plan_options WHERE plan_elevation_id IN (%1$s))'),
+            ('cost_codes', 'cost_code_id',
+                '(t.cost_code_id IN (%1$s) OR t.item_id IN (SELECT item_id FROM takeoff.items WHERE cost_code_id IN (%1$s)))'),
+            ('vendors', 'vendor_id',
+                '(t.vendor_id IN (%1$s) OR t.product_id IN (SELECT product_id FROM takeoff.vendor_pricing WHERE vendor_id IN (%1$s)))'),
+            ('jobs', 'job_id', 't.job_id IN (%1$s)')
+        ) AS sources(table_name, key_column, takeoffs_condition)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_comprehensive_summary_insert ON takeoff.%I', source.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_comprehensive_summary_update ON takeoff.%I', source.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_comprehensive_summary_delete ON takeoff.%I', source.table_name);
+
+        -- Transition tables allow one event per trigger
+        EXECUTE format(
+            'CREATE TRIGGER trg_comprehensive_summary_insert
+                AFTER INSERT ON takeoff.%I
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary(%L, %L)',
+            source.table_name, source.key_column, source.takeoffs_condition
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_comprehensive_summary_update
+                AFTER UPDATE ON takeoff.%I
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary(%L, %L)',
+            source.table_name, source.key_column, source.takeoffs_condition
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_comprehensive_summary_delete
+                AFTER DELETE ON takeoff.%I
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary(%L, %L)',
+            source.table_name, source.key_column, source.takeoffs_condition
+        );
+    END LOOP;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_truncate ON takeoff.takeoffs;
+CREATE TRIGGER trg_comprehensive_summary_truncate
+    AFTER TRUNCATE ON takeoff.takeoffs
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.truncate_comprehensive_takeoff_summary();
+
+SELECT takeoff.rebuild_comprehensive_takeoff_summary();
+
+COMMENT ON TABLE takeoff.comprehensive_takeoff_summary IS
+'Materialized rows of v_comprehensive_takeoff_analysis, refreshed per statement by trg_comprehensive_summary_* triggers';
+
+COMMIT;
+
+ANALYZE takeoff.comprehensive_takeoff_summary;
+
+SELECT 'Migration 035 completed: comprehensive takeoff summary holds ' || COUNT(*) || ' rows' as status
+FROM takeoff.comprehensive_takeoff_summary;
@@ -0,0 +1,211 @@
+-- Migration 036: Long-form plan option measurements for qty formulas
+-- Migration 028 resolved an item's qty_formula with takeoff.get_plan_option_value(), a dynamic
+-- EXECUTE per takeoff row; migration 031 replaced it with a CASE over six hard-coded square
+-- footage columns. takeoff.plan_option_measurements holds every numeric plan_options column
+-- as a (plan_option_id, measure_name, measure_value) row, so the view resolves a formula
+-- with one primary-key join.
+--
+-- Measurements are read from the row itself (to_jsonb), so a numeric column added to
+-- plan_options later becomes a measurement without another migration. Foreign keys
+-- (*_id columns) are not measurements. A statement-level trigger upserts the measurements of
+-- inserted and updated options; deleted options cascade. Filling a new column through
+-- ALTER TABLE ... DEFAULT fires no triggers, so run this afterwards:
+--
+--     SELECT takeoff.rebuild_plan_option_measurements();
+
+BEGIN;
+
+CREATE TABLE IF NOT EXISTS takeoff.plan_option_measurements (
+    plan_option_id INTEGER NOT NULL REFERENCES takeoff.plan_options(plan_option_id)
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    measure_name VARCHAR(63) NOT NULL,
+    measure_value NUMERIC NOT NULL,
+    PRIMARY KEY (plan_option_id, measure_name)
+);
+
+-- Numeric, non-null, non-key columns of a plan_options row
+CREATE OR REPLACE FUNCTION takeoff.plan_option_measures(option_row JSONB)
+RETURNS TABLE (measure_name TEXT, measure_value NUMERIC) AS $$
+    SELECT key, (value #>> '{}')::NUMERIC
+    FROM jsonb_each(option_row)
+    WHERE jsonb_typeof(value) = 'number'
+    AND key NOT LIKE '%\_id'
+$$ LANGUAGE sql IMMUTABLE;
+
+CREATE OR REPLACE FUNCTION takeoff.rebuild_plan_option_measurements()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    DELETE FROM takeoff.plan_option_measurements;
+
+    INSERT INTO takeoff.plan_option_measurements (plan_option_id, measure_name, measure_value)
+    SELECT po.plan_option_id, m.measure_name, m.measure_value
+    FROM takeoff.plan_options po
+    CROSS JOIN LATERAL takeoff.plan_option_measures(to_jsonb(po)) m;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Only measurements whose value changed are written, so unrelated plan option edits
+-- leave the table (and everything refreshed from it) alone
+CREATE OR REPLACE FUNCTION takeoff.sync_plan_option_measurements()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM takeoff.plan_option_measurements pm
+    USING new_rows n
+    WHERE pm.plan_option_id = n.plan_option_id
+    AND NOT EXISTS (
+        SELECT 1 FROM takeoff.plan_option_measures(to_jsonb(n)) m
+        WHERE m.measure_name = pm.measure_name
+    );
+
+    INSERT INTO takeoff.plan_option_measurements (plan_option_id, measure_name, measure_value)
+    SELECT n.plan_option_id, m.measure_name, m.measure_value
+    FROM new_rows n
+    CROSS JOIN LATERAL takeoff.plan_option_measures(to_jsonb(n)) m
+    ON CONFLICT (plan_option_id, measure_name) DO UPDATE
+    SET measure_value = EXCLUDED.measure_value
+    WHERE takeoff.plan_option_measurements.measure_value IS DISTINCT FROM EXCLUDED.measure_value;
+
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_sync_plan_option_measurements_insert ON takeoff.plan_options;
+CREATE TRIGGER trg_sync_plan_option_measurements_insert
+    AFTER INSERT ON takeoff.plan_options
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_plan_option_measurements();
+
+DROP TRIGGER IF EXISTS trg_sync_plan_option_measurements_update ON takeoff.plan_options;
+CREATE TRIGGER trg_sync_plan_option_measurements_update
+    AFTER UPDATE ON takeoff.plan_options
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_plan_option_measurements();
+
+SELECT takeoff.rebuild_plan_option_measurements();
+
+-- Kept for callers of migration 028's function; now a primary-key lookup
+CREATE OR REPLACE FUNCTION takeoff.get_plan_option_value(plan_option_id INT, column_name TEXT)
+RETURNS NUMERIC AS $$
+    SELECT pm.measure_value
+    FROM takeoff.plan_option_measurements pm
+    WHERE pm.plan_option_id = $1
+    AND pm.measure_name = $2
+$$ LANGUAGE sql STABLE;
+
+-- Formula quantities come from one join on (plan_option_id, qty_formula); an unknown
+-- formula or a missing measurement falls back to the takeoff quantity, as before
+CREATE OR REPLACE VIEW takeoff.v_comprehensive_takeoff_analysis AS
+SELECT
+    t.takeoff_id,
+    -- Plan information
+    pe.plan_full_name,
+    po.option_name,
+    -- Cost and Item information
+    cc.cost_code,
+    i.item_name,
+    -- Use item_description from takeoffs table (editable) as primary, fallback to products
+    COALESCE(t.item_description, p.item_description, i.item_name) as item_description,
+    -- Quantity and pricing
+    COALESCE(t.quantity_source, 'Manual') as quantity_source,
+    COALESCE(t.quantity, 0) as quantity,
+    COALESCE(t.unit_price, vp_current.price, 0) as unit_price,
+    COALESCE(t.price_factor, 1.0) as price_factor,
+    COALESCE(t.unit_of_measure, p.unit_of_measure, i.default_unit, 'EA') as unit_of_measure,
+    -- Calculated quantity from the plan option measurement named by the item's formula
+    COALESCE(pm.measure_value, t.quantity, 0) as calculated_quantity,
+    -- Extended price calculation
+    (COALESCE(t.quantity, 0) * COALESCE(t.unit_price, vp_current.price, 0) * COALESCE(t.price_factor, 1.0)) as extended_price,
+    -- Vendor information
+    v.vendor_name,
+    -- Job information
+    COALESCE(t.job_name, j.job_name) as job_name,
+    COALESCE(t.job_number, j.job_number) as job_number,
+    COALESCE(t.lot_number, j.lot_number) as lot_number,
+    COALESCE(t.customer_name, j.customer_name) as customer_name,
+    -- Additional details
+    COALESCE(t.room, '') as room,
+    COALESCE(t.spec_name, '') as spec_name,
+    COALESCE(t.notes, '') as notes,
+    -- Foreign key references for editing
+    t.job_id,
+    t.product_id,
+    t.vendor_id,
+    t.plan_option_id,
+    t.item_id,
+    t.cost_code_id,
+    -- Timestamps
+    t.created_date,
+    t.updated_date
+FROM takeoff.takeoffs t
+    -- Required joins for plan and option information
+    LEFT JOIN takeoff.plan_options po ON t.plan_option_id = po.plan_option_id
+    LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+    -- Item and cost code joins
+    LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+    LEFT JOIN takeoff.cost_codes cc ON COALESCE(t.cost_code_id, i.cost_code_id) = cc.cost_code_id
+    -- Formula measurement (no row when the item has no formula)
+    LEFT JOIN takeoff.plan_option_measurements pm
+        ON pm.plan_option_id = t.plan_option_id
+        AND pm.measure_name = NULLIF(i.qty_formula, '')
+    -- Product join for fallback data
+    LEFT JOIN takeoff.products p ON t.product_id = p.product_id
+    -- Current vendor pricing for price fallback (newest current price of the product)
+    LEFT JOIN LATERAL (
+        SELECT vp.vendor_id, vp.price, vp.unit_of_measure
+        FROM takeoff.vendor_pricing vp
+        WHERE vp.product_id = t.product_id
+        AND vp.is_current = true AND vp.is_active = true
+        ORDER BY vp.created_date DESC
+        LIMIT 1
+    ) vp_current ON true
+    -- Vendor information
+    LEFT JOIN takeoff.vendors v ON COALESCE(t.vendor_id, vp_current.vendor_id) = v.vendor_id
+    -- Job information
+    LEFT JOIN takeoff.jobs j ON t.job_id = j.job_id
+ORDER BY
+    pe.plan_full_name,
+    po.option_name,
+    cc.cost_code,
+    i.item_name,
+    t.takeoff_id;
+
+-- Measurement changes refresh the comprehensive summary (migration 035) like any other
+-- source table. The plan_options summary triggers can fire before the measurement
+-- triggers, so this refresh is what keeps calculated_quantity current.
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_insert ON takeoff.plan_option_measurements;
+CREATE TRIGGER trg_comprehensive_summary_insert
+    AFTER INSERT ON takeoff.plan_option_measurements
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary('plan_option_id', 't.plan_option_id IN (%1$s)');
+
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_update ON takeoff.plan_option_measurements;
+CREATE TRIGGER trg_comprehensive_summary_update
+    AFTER UPDATE ON takeoff.plan_option_measurements
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary('plan_option_id', 't.plan_option_id IN (%1$s)');
+
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_delete ON takeoff.plan_option_measurements;
+CREATE TRIGGER trg_comprehensive_summary_delete
+    AFTER DELETE ON takeoff.plan_option_measurements
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary('plan_option_id', 't.plan_option_id IN (%1$s)');
+
+SELECT takeoff.rebuild_comprehensive_takeoff_summary();
+
+COMMENT ON TABLE takeoff.plan_option_measurements IS
+'Numeric plan_options columns as (plan_option_id, measure_name) rows; items.qty_formula names a measure';
+
+COMMIT;
+
+SELECT 'Migration 036 completed: ' || COUNT(*) || ' plan option measurements' as status
+FROM takeoff.plan_option_measurements;
@@ -0,0 +1,100 @@
+-- Migration 037: Store formula engine results on takeoffs
+-- Quantity formulas can now be arithmetic expressions over plan option measurements
+-- (e.g. "heated_sf_outside_studs * 1.1 / 32"), evaluated by the web app's formula engine:
+--
+--     POST /api/qty-takeoffs/recalculate {"plan_ids": [...]}
+--
+-- The engine writes takeoffs.calculated_quantity (NULL when the item has no formula) and,
+-- for takeoffs with a unit price, extended_price = calculated quantity x unit price x price
+-- factor; takeoffs whose formula cannot be evaluated are left unchanged. The view keeps
+-- resolving bare measurement names live through plan_option_measurements (migration 036),
+-- falls back to the stored result for expressions, and prices the calculated quantity.
+
+BEGIN;
+
+ALTER TABLE takeoff.takeoffs ADD COLUMN IF NOT EXISTS calculated_quantity NUMERIC(14,4);
+
+COMMENT ON COLUMN takeoff.takeoffs.calculated_quantity IS
+'Quantity from the item''s qty formula, written by the formula engine; NULL when the item has no formula';
+
+CREATE OR REPLACE VIEW takeoff.v_comprehensive_takeoff_analysis AS
+SELECT
+    t.takeoff_id,
+    -- Plan information
+    pe.plan_full_name,
+    po.option_name,
+    -- Cost and Item information
+    cc.cost_code,
+    i.item_name,
+    -- Use item_description from takeoffs table (editable) as primary, fallback to products
+    COALESCE(t.item_description, p.item_description, i.item_name) as item_description,
+    -- Quantity and pricing
+    COALESCE(t.quantity_source, 'Manual') as quantity_source,
+    COALESCE(t.quantity, 0) as quantity,
+    COALESCE(t.unit_price, vp_current.price, 0) as unit_price,
+    COALESCE(t.price_factor, 1.0) as price_factor,
+    COALESCE(t.unit_of_measure, p.unit_of_measure, i.default_unit, 'EA') as unit_of_measure,
+    -- Calculated quantity: the measurement a bare-name formula names, else the result stored
+    -- by the formula engine for expression formulas, else the entered quantity
+    COALESCE(pm.measure_value, t.calculated_quantity, t.quantity, 0) as calculated_quantity,
+    -- Extended price of the calculated quantity, as the formula engine stores it
+    (COALESCE(pm.measure_value, t.calculated_quantity, t.quantity, 0) * COALESCE(t.unit_price, vp_current.price, 0) * COALESCE(t.price_factor, 1.0)) as extended_price,
+    -- Vendor information
+    v.vendor_name,
+    -- Job information
+    COALESCE(t.job_name, j.job_name) as job_name,
+    COALESCE(t.job_number, j.job_number) as job_number,
+    COALESCE(t.lot_number, j.lot_number) as lot_number,
+    COALESCE(t.customer_name, j.customer_name) as customer_name,
+    -- Additional details
+    COALESCE(t.room, '') as room,
+    COALESCE(t.spec_name, '') as spec_name,
+    COALESCE(t.notes, '') as notes,
+    -- Foreign key references for editing
+    t.job_id,
+    t.product_id,
+    t.vendor_id,
+    t.plan_option_id,
+    t.item_id,
+    t.cost_code_id,
+    -- Timestamps
+    t.created_date,
+    t.updated_date
+FROM takeoff.takeoffs t
+    -- Required joins for plan and option information
+    LEFT JOIN takeoff.plan_options po ON t.plan_option_id = po.plan_option_id
+    LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+    -- Item and cost code joins
+    LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+    LEFT JOIN takeoff.cost_codes cc ON COALESCE(t.cost_code_id, i.cost_code_id) = cc.cost_code_id
+    -- Formula measurement (no row when the item has no formula)
+    LEFT JOIN takeoff.plan_option_measurements pm
+        ON pm.plan_option_id = t.plan_option_id
+        AND pm.measure_name = NULLIF(i.qty_formula, '')
+    -- Product join for fallback data
+    LEFT JOIN takeoff.products p ON t.product_id = p.product_id
+    -- Current vendor pricing for price fallback (newest current price of the product)
+    LEFT JOIN LATERAL (
+        SELECT vp.vendor_id, vp.price, vp.unit_of_measure
+        FROM takeoff.vendor_pricing vp
+        WHERE vp.product_id = t.product_id
+        AND vp.is_current = true AND vp.is_active = true
+        ORDER BY vp.created_date DESC
+        LIMIT 1
+    ) vp_current ON true
+    -- Vendor information
+    LEFT JOIN takeoff.vendors v ON COALESCE(t.vendor_id, vp_current.vendor_id) = v.vendor_id
+    -- Job information
+    LEFT JOIN takeoff.jobs j ON t.job_id = j.job_id
+ORDER BY
+    pe.plan_full_name,
+    po.option_name,
+    cc.cost_code,
+    i.item_name,
+    t.takeoff_id;
+
+SELECT takeoff.rebuild_comprehensive_takeoff_summary();
+
+COMMIT;
+
+SELECT 'Migration 037 completed: takeoffs.calculated_quantity added' as status;
@@ -0,0 +1,240 @@
+-- Migration 038: Incrementally maintained pricing summary per product
+-- The products grid ranked every current price with a window function, self-joined
+-- vendor_pricing against all older rows for the price change (with a LIMIT 1 that applied to
+-- the whole CTE, so only one product ever had a change), joined vendor_pricing again and
+-- grouped 23 columns, on every load. takeoff.product_price_summary holds one row per product
+-- with current prices: best price and vendor, vendor count, min/max/avg and the last price
+-- change. Statement-level triggers on vendor_pricing refresh only the products a statement
+-- touched, so the grid becomes a primary-key join.
+--
+-- The best vendor is kept as vendor_id and joined at read time, so renaming a vendor needs no
+-- refresh. The price change is that of the product's newest current price against the
+-- previous price from the same vendor; 0 when there is no earlier price, as before.
+--
+-- Full rebuild (e.g. after changing the view):
+--     SELECT takeoff.rebuild_product_price_summary();
+
+BEGIN;
+
+-- Best price (lowest, then oldest row) and min/max/avg over a product's current prices
+CREATE INDEX IF NOT EXISTS idx_vendor_pricing_current_product_price
+    ON takeoff.vendor_pricing(product_id, price, pricing_id)
+    WHERE is_current = true;
+
+CREATE OR REPLACE VIEW takeoff.v_product_price_summary AS
+SELECT
+    cur.product_id,
+    best.price AS best_price,
+    best.vendor_id AS best_vendor_id,
+    cur.vendor_count,
+    cur.min_price,
+    cur.max_price,
+    cur.avg_price,
+    latest.price_change,
+    latest.created_date AS last_price_change_date
+FROM (
+    SELECT
+        product_id,
+        COUNT(*) AS vendor_count,
+        MIN(price) AS min_price,
+        MAX(price) AS max_price,
+        AVG(price) AS avg_price
+    FROM takeoff.vendor_pricing
+    WHERE is_current = true
+    GROUP BY product_id
+) cur
+CROSS JOIN LATERAL (
+    SELECT vp.vendor_id, vp.price
+    FROM takeoff.vendor_pricing vp
+    WHERE vp.product_id = cur.product_id
+    AND vp.is_current = true
+    ORDER BY vp.price, vp.pricing_id
+    LIMIT 1
+) best
+CROSS JOIN LATERAL (
+    SELECT
+        vp.created_date,
+        CASE
+            WHEN prev.price > 0 THEN ((vp.price - prev.price) / prev.price * 100)
+            ELSE 0
+        END AS price_change
+    FROM takeoff.vendor_pricing vp
+    LEFT JOIN LATERAL (
+        SELECT old.price
+        FROM takeoff.vendor_pricing old
+        WHERE old.vendor_id = vp.vendor_id
+        AND old.product_id = vp.product_id
+        AND old.created_date < vp.created_date
+        ORDER BY old.created_date DESC
+        LIMIT 1
+    ) prev ON true
+    WHERE vp.product_id = cur.product_id
+    AND vp.is_current = true
+    ORDER BY vp.created_date DESC, vp.pricing_id DESC
+    LIMIT 1
+) latest;
+
+CREATE TABLE IF NOT EXISTS takeoff.product_price_summary (
+    product_id INTEGER PRIMARY KEY REFERENCES takeoff.products(product_id)
+        ON DELETE CASCADE ON UPDATE CASCADE,
+    best_price NUMERIC(12,4),
+    best_vendor_id INTEGER,
+    vendor_count INTEGER NOT NULL,
+    min_price NUMERIC(12,4),
+    max_price NUMERIC(12,4),
+    avg_price NUMERIC,
+    price_change NUMERIC,
+    last_price_change_date TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Concurrent refreshes of the same product take turns on its summary row, as in migration
+-- 035. A product's first current price can arrive from two transactions at once, so every
+-- existing product first gets a placeholder row if it has none (a second inserter waits for
+-- the first to commit), then all of them are locked FOR UPDATE in key order before the view
+-- is read. Placeholders of products still without a current price are deleted again. No
+-- slot of the shared lock table is used, however many products a statement touches.
+CREATE OR REPLACE FUNCTION takeoff.refresh_product_price_summary(p_product_ids INTEGER[])
+RETURNS INTEGER AS $$
+DECLARE
+    refreshed_ids INTEGER[];
+BEGIN
+    IF p_product_ids IS NULL OR cardinality(p_product_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    INSERT INTO takeoff.product_price_summary (product_id, vendor_count)
+    SELECT product_id, 0
+    FROM takeoff.products
+    WHERE product_id = ANY(p_product_ids)
+    ORDER BY product_id
+    ON CONFLICT (product_id) DO NOTHING;
+
+    PERFORM 1 FROM takeoff.product_price_summary
+    WHERE product_id = ANY(p_product_ids)
+    ORDER BY product_id
+    FOR UPDATE;
+
+    WITH upserted AS (
+        INSERT INTO takeoff.product_price_summary (
+            product_id, best_price, best_vendor_id, vendor_count, min_price, max_price,
+            avg_price, price_change, last_price_change_date
+        )
+        SELECT s.product_id, s.best_price, s.best_vendor_id, s.vendor_count, s.min_price, s.max_price,
+            s.avg_price, s.price_change, s.last_price_change_date
+        FROM takeoff.v_product_price_summary s
+        -- A price row may name a product that was deleted in the same statement
+        JOIN takeoff.products p ON p.product_id = s.product_id
+        WHERE s.product_id = ANY(p_product_ids)
+        ON CONFLICT (product_id) DO UPDATE SET
+            best_price = EXCLUDED.best_price,
+            best_vendor_id = EXCLUDED.best_vendor_id,
+            vendor_count = EXCLUDED.vendor_count,
+            min_price = EXCLUDED.min_price,
+            max_price = EXCLUDED.max_price,
+            avg_price = EXCLUDED.avg_price,
+            price_change = EXCLUDED.price_change,
+            last_price_change_date = EXCLUDED.last_price_change_date,
+            updated_at = CURRENT_TIMESTAMP
+        RETURNING product_id
+    )
+    SELECT COALESCE(array_agg(product_id), '{}') INTO refreshed_ids FROM upserted;
+
+    -- Products left without a current price lose their row (or placeholder)
+    DELETE FROM takeoff.product_price_summary
+    WHERE product_id = ANY(p_product_ids)
+    AND NOT product_id = ANY(refreshed_ids);
+
+    RETURN cardinality(refreshed_ids);
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.rebuild_product_price_summary()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    TRUNCATE takeoff.product_price_summary;
+
+    INSERT INTO takeoff.product_price_summary (
+        product_id, best_price, best_vendor_id, vendor_count, min_price, max_price,
+        avg_price, price_change, last_price_change_date
+    )
+    SELECT s.product_id, s.best_price, s.best_vendor_id, s.vendor_count, s.min_price, s.max_price,
+        s.avg_price, s.price_change, s.last_price_change_date
+    FROM takeoff.v_product_price_summary s
+    JOIN takeoff.products p ON p.product_id = s.product_id;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- An insert fires this before trigger_retire_superseded_prices (migration 032) runs; the
+-- retire UPDATE fires it again for the same products, so the summary ends up current
+CREATE OR REPLACE FUNCTION takeoff.sync_product_price_summary()
+RETURNS TRIGGER AS $$
+DECLARE
+    affected INTEGER[];
+BEGIN
+    IF TG_OP = 'INSERT' THEN
+        SELECT array_agg(DISTINCT product_id) INTO affected FROM new_rows;
+    ELSIF TG_OP = 'DELETE' THEN
+        SELECT array_agg(DISTINCT product_id) INTO affected FROM old_rows;
+    ELSE
+        SELECT array_agg(product_id) INTO affected
+        FROM (SELECT product_id FROM new_rows UNION SELECT product_id FROM old_rows) changed;
+    END IF;
+
+    PERFORM takeoff.refresh_product_price_summary(affected);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.truncate_product_price_summary()
+RETURNS TRIGGER AS $$
+BEGIN
+    TRUNCATE takeoff.product_price_summary;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Transition tables allow one event per trigger
+DROP TRIGGER IF EXISTS trg_product_price_summary_insert ON takeoff.vendor_pricing;
+CREATE TRIGGER trg_product_price_summary_insert
+    AFTER INSERT ON takeoff.vendor_pricing
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_product_price_summary();
+
+DROP TRIGGER IF EXISTS trg_product_price_summary_update ON takeoff.vendor_pricing;
+CREATE TRIGGER trg_product_price_summary_update
+    AFTER UPDATE ON takeoff.vendor_pricing
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_product_price_summary();
+
+DROP TRIGGER IF EXISTS trg_product_price_summary_delete ON takeoff.vendor_pricing;
+CREATE TRIGGER trg_product_price_summary_delete
+    AFTER DELETE ON takeoff.vendor_pricing
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_product_price_summary();
+
+DROP TRIGGER IF EXISTS trg_product_price_summary_truncate ON takeoff.vendor_pricing;
+CREATE TRIGGER trg_product_price_summary_truncate
+    AFTER TRUNCATE ON takeoff.vendor_pricing
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.truncate_product_price_summary();
+
+SELECT takeoff.rebuild_product_price_summary();
+
+COMMENT ON TABLE takeoff.product_price_summary IS
+'Rows of v_product_price_summary per product, refreshed per statement by trg_product_price_summary_* triggers on vendor_pricing';
+
+COMMIT;
+
+ANALYZE takeoff.product_price_summary;
+
+SELECT 'Migration 038 completed: pricing summary for ' || COUNT(*) || ' products' as status
+FROM takeoff.product_price_summary;
@@ -0,0 +1,466 @@
+-- Migration 039: One physical current price book for vendor pricing and quotes
+-- v_current_vendor_pricing (migration 021) was a UNION ALL of current vendor prices and
+-- quotes, evaluated per request: the quotes branch joined back through v_quotes (six more
+-- tables, joined per product of the item a second time), and both branches compared
+-- expiration_date with CURRENT_DATE. The comprehensive takeoff view repeated its own current
+-- price lookup on vendor_pricing. takeoff.current_price_book holds the rows of the union,
+-- with vendor, product, item and cost code columns resolved, and is now what both read.
+--
+-- A row is identified by (source, source_id, product_id): source is 'vendor_pricing' or
+-- 'quote' and source_id the pricing or quote id. One vendor can have several current quotes
+-- for an item (one per plan option), and a quote's item may have no product, so
+-- (product_id, vendor_id, source) alone is not unique. pricing_id keeps the old view's
+-- convention of negative ids for quotes.
+--
+-- Statement-level triggers on vendor_pricing and quotes, and on the tables whose columns the
+-- book copies, refresh just the rows a statement touched. Expired rows are removed by
+--
+--     python utils/expire_current_price_book.py
+--
+-- run nightly (e.g. from cron at 00:05); v_current_vendor_pricing also hides rows that expired
+-- since the last run. Full rebuild: SELECT takeoff.rebuild_current_price_book();
+
+BEGIN;
+
+-- Rows of the book, with quote descriptions resolved like v_quotes against the branch's own
+-- product row
+CREATE OR REPLACE VIEW takeoff.v_current_price_book AS
+SELECT
+    'vendor_pricing'::VARCHAR(20) AS source,
+    vp.pricing_id AS source_id,
+    vp.pricing_id,
+    vp.vendor_id,
+    v.vendor_name,
+    vp.product_id,
+    p.item_description AS product_description,
+    i.item_id,
+    i.item_name,
+    cc.cost_code_id,
+    cc.cost_code,
+    vp.price::NUMERIC AS price,
+    vp.unit_of_measure,
+    vp.effective_date,
+    vp.expiration_date,
+    vp.price_type,
+    vp.minimum_quantity,
+    vp.notes,
+    vp.created_date
+-- Every current price is kept, including those of products without an item: the
+-- comprehensive takeoff view prices takeoffs from here by product alone
+FROM takeoff.vendor_pricing vp
+LEFT JOIN takeoff.vendors v ON vp.vendor_id = v.vendor_id
+LEFT JOIN takeoff.products p ON vp.product_id = p.product_id
+LEFT JOIN takeoff.items i ON p.item_id = i.item_id
+LEFT JOIN takeoff.cost_codes cc ON i.cost_code_id = cc.cost_code_id
+WHERE vp.is_current = true
+    AND vp.is_active = true
+    AND (vp.expiration_date IS NULL OR vp.expiration_date >= CURRENT_DATE)
+
+UNION ALL
+
+SELECT
+    'quote'::VARCHAR(20) AS source,
+    q.quote_id AS source_id,
+    -q.quote_id AS pricing_id,
+    v.vendor_id,
+    v.vendor_name,
+    p.product_id,
+    CASE
+        WHEN p.item_type = 'Product' THEN i.item_name
+        WHEN p.item_type = 'Quote' AND q.plan_option_id IS NOT NULL THEN
+            CONCAT('Quote_', pe.plan_full_name, po.option_name)
+        WHEN p.item_type = 'Quote' THEN 'Quote'
+        ELSE i.item_name
+    END AS product_description,
+    i.item_id,
+    i.item_name,
+    cc.cost_code_id,
+    cc.cost_code,
+    q.price::NUMERIC AS price,
+    'SF' AS unit_of_measure,
+    q.effective_date,
+    q.expiration_date,
+    'quote' AS price_type,
+    NULL AS minimum_quantity,
+    q.notes,
+    q.created_date
+FROM takeoff.quotes q
+JOIN takeoff.vendors v ON q.vendor_id = v.vendor_id
+JOIN takeoff.items i ON q.item_id = i.item_id
+LEFT JOIN takeoff.products p ON i.item_id = p.item_id
+LEFT JOIN takeoff.cost_codes cc ON q.cost_code_id = cc.cost_code_id
+LEFT JOIN takeoff.plan_options po ON q.plan_option_id = po.plan_option_id
+LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+WHERE (q.expiration_date IS NULL OR q.expiration_date >= CURRENT_DATE);
+
+DROP TABLE IF EXISTS takeoff.current_price_book;
+CREATE TABLE takeoff.current_price_book AS
+SELECT * FROM takeoff.v_current_price_book WITH NO DATA;
+
+CREATE UNIQUE INDEX idx_current_price_book_row
+    ON takeoff.current_price_book(source, source_id, COALESCE(product_id, 0));
+-- Newest current vendor price of a product (comprehensive takeoff view)
+CREATE INDEX idx_current_price_book_product_created
+    ON takeoff.current_price_book(product_id, created_date DESC)
+    WHERE source = 'vendor_pricing';
+CREATE INDEX idx_current_price_book_vendor
+    ON takeoff.current_price_book(vendor_id);
+-- Vendor pricing grid order
+CREATE INDEX idx_current_price_book_cost_code
+    ON takeoff.current_price_book(cost_code, vendor_name, item_name);
+
+-- Concurrent refreshes of the same pricing row or quote take turns on the source row itself:
+-- it is locked FOR NO KEY UPDATE (in key order) before the view is read, and the book is
+-- upserted, as in migration 035. A statement that edited the row already holds that lock, and
+-- foreign key checks (FOR KEY SHARE) are not blocked by it. Row locks use no slot of the
+-- shared lock table, however many rows a statement touches. Book rows of those sources that
+-- the view no longer returns (expired, superseded, deleted, or a product that left the
+-- quote's item) are deleted.
+CREATE OR REPLACE FUNCTION takeoff.refresh_current_price_book(p_source VARCHAR, p_source_ids INTEGER[])
+RETURNS INTEGER AS $$
+DECLARE
+    assignments TEXT;
+    refreshed INTEGER;
+BEGIN
+    IF p_source_ids IS NULL OR cardinality(p_source_ids) = 0 THEN
+        RETURN 0;
+    END IF;
+
+    IF p_source = 'quote' THEN
+        PERFORM 1 FROM takeoff.quotes
+        WHERE quote_id = ANY(p_source_ids)
+        ORDER BY quote_id
+        FOR NO KEY UPDATE;
+    ELSE
+        PERFORM 1 FROM takeoff.vendor_pricing
+        WHERE pricing_id = ANY(p_source_ids)
+        ORDER BY pricing_id
+        FOR NO KEY UPDATE;
+    END IF;
+
+    -- Every column but the row key, so the upsert follows the table if it is recreated
+    SELECT string_agg(format('%1$I = EXCLUDED.%1$I', attname), ', ' ORDER BY attnum)
+    INTO assignments
+    FROM pg_attribute
+    WHERE attrelid = 'takeoff.current_price_book'::regclass
+    AND attnum > 0 AND NOT attisdropped
+    AND attname NOT IN ('source', 'source_id', 'product_id');
+
+    EXECUTE format(
+        'WITH upserted AS (
+            INSERT INTO takeoff.current_price_book
+            SELECT * FROM takeoff.v_current_price_book
+            WHERE source = $1
+            AND source_id = ANY($2)
+            ON CONFLICT (source, source_id, COALESCE(product_id, 0)) DO UPDATE SET %s
+            RETURNING source_id, product_id
+        ), removed AS (
+            DELETE FROM takeoff.current_price_book book
+            WHERE book.source = $1
+            AND book.source_id = ANY($2)
+            AND NOT EXISTS (
+                SELECT 1 FROM upserted u
+                WHERE u.source_id = book.source_id
+                AND u.product_id IS NOT DISTINCT FROM book.product_id
+            )
+        )
+        SELECT COUNT(*) FROM upserted',
+        assignments
+    ) INTO refreshed USING p_source, p_source_ids;
+
+    RETURN refreshed;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.rebuild_current_price_book()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    DELETE FROM takeoff.current_price_book;
+
+    INSERT INTO takeoff.current_price_book
+    SELECT * FROM takeoff.v_current_price_book;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Nightly: rows whose expiration date has passed leave the book (and, through its triggers,
+-- the comprehensive takeoff summary)
+CREATE OR REPLACE FUNCTION takeoff.expire_current_price_book()
+RETURNS INTEGER AS $$
+DECLARE
+    expired INTEGER;
+BEGIN
+    DELETE FROM takeoff.current_price_book
+    WHERE expiration_date < CURRENT_DATE;
+
+    GET DIAGNOSTICS expired = ROW_COUNT;
+    RETURN expired;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Trigger arguments: the changed table's key column, then the conditions selecting the
+-- vendor_pricing rows (vp) and quotes (q) that read those keys, with %1$s standing for the
+-- keys ('' when the table does not feed that source). vendor_pricing and quotes refresh
+-- their own keys directly, so deleted rows leave the book.
+CREATE OR REPLACE FUNCTION takeoff.sync_current_price_book()
+RETURNS TRIGGER AS $$
+DECLARE
+    changed_keys TEXT;
+    pricing_ids INTEGER[];
+    quote_ids INTEGER[];
+BEGIN
+    changed_keys := CASE TG_OP
+        WHEN 'INSERT' THEN format('SELECT %I FROM new_rows', TG_ARGV[0])
+        WHEN 'DELETE' THEN format('SELECT %I FROM old_rows', TG_ARGV[0])
+        ELSE format('SELECT %1$I FROM new_rows UNION SELECT %1$I FROM old_rows', TG_ARGV[0])
+    END;
+
+    IF TG_TABLE_NAME = 'vendor_pricing' THEN
+        EXECUTE format('SELECT array_agg(DISTINCT changed_key) FROM (%s) changed(changed_key)', changed_keys)
+        INTO pricing_ids;
+    ELSIF TG_TABLE_NAME = 'quotes' THEN
+        EXECUTE format('SELECT array_agg(DISTINCT changed_key) FROM (%s) changed(changed_key)', changed_keys)
+        INTO quote_ids;
+    ELSE
+        IF TG_ARGV[1] <> '' THEN
+            -- Superseded prices never enter the book
+            EXECUTE format('SELECT array_agg(vp.pricing_id) FROM takeoff.vendor_pricing vp WHERE vp.is_current = true AND (' || TG_ARGV[1] || ')', changed_keys)
+            INTO pricing_ids;
+        END IF;
+        IF TG_ARGV[2] <> '' THEN
+            EXECUTE format('SELECT array_agg(q.quote_id) FROM takeoff.quotes q WHERE ' || TG_ARGV[2], changed_keys)
+            INTO quote_ids;
+        END IF;
+    END IF;
+
+    PERFORM takeoff.refresh_current_price_book('vendor_pricing', pricing_ids);
+    PERFORM takeoff.refresh_current_price_book('quote', quote_ids);
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.truncate_current_price_book()
+RETURNS TRIGGER AS $$
+BEGIN
+    DELETE FROM takeoff.current_price_book
+    WHERE source = CASE TG_TABLE_NAME WHEN 'quotes' THEN 'quote' ELSE 'vendor_pricing' END;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DO $$
+DECLARE
+    source RECORD;
+BEGIN
+    FOR source IN
+        SELECT * FROM (VALUES
+            ('vendor_pricing', 'pricing_id', '', ''),
+            ('quotes', 'quote_id', '', ''),
+            ('vendors', 'vendor_id', 'vp.vendor_id IN (%1$s)', 'q.vendor_id IN (%1$s)'),
+            -- A product's item can change, so quotes are matched through the book's old rows too
+            ('products', 'product_id', 'vp.product_id IN (%1$s)',
+                '(q.quote_id IN (SELECT source_id FROM takeoff.current_price_book WHERE source = ''quote'' AND product_id IN (%1$s))
+                  OR q.item_id IN (SELECT item_id FROM takeoff.products WHERE product_id IN (%1$s)))'),
+            ('items', 'item_id',
+                'vp.product_id IN (SELECT product_id FROM takeoff.products WHERE item_id IN (%1$s))',
+                'q.item_id IN (%1$s)'),
+            ('cost_codes', 'cost_code_id',
+                'vp.product_id IN (SELECT p.product_id FROM takeoff.products p JOIN takeoff.items i ON i.item_id = p.item_id WHERE i.cost_code_id IN (%1$s))',
+                'q.cost_code_id IN (%1$s)'),
+            ('plan_options', 'plan_option_id', '', 'q.plan_option_id IN (%1$s)'),
+            ('plan_elevations', 'plan_elevation_id', '',
+                'q.plan_option_id IN (SELECT plan_option_id FROM takeoff.plan_options WHERE plan_elevation_id IN (%1$s))')
+        ) AS sources(table_name, key_column, pricing_condition, quote_condition)
+    LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_current_price_book_insert ON takeoff.%I', source.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_current_price_book_update ON takeoff.%I', source.table_name);
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_current_price_book_delete ON takeoff.%I', source.table_name);
+
+        -- Transition tables allow one event per trigger
+        EXECUTE format(
+            'CREATE TRIGGER trg_current_price_book_insert
+                AFTER INSERT ON takeoff.%I
+                REFERENCING NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.sync_current_price_book(%L, %L, %L)',
+            source.table_name, source.key_column, source.pricing_condition, source.quote_condition
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_current_price_book_update
+                AFTER UPDATE ON takeoff.%I
+                REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.sync_current_price_book(%L, %L, %L)',
+            source.table_name, source.key_column, source.pricing_condition, source.quote_condition
+        );
+        EXECUTE format(
+            'CREATE TRIGGER trg_current_price_book_delete
+                AFTER DELETE ON takeoff.%I
+                REFERENCING OLD TABLE AS old_rows
+                FOR EACH STATEMENT
+                EXECUTE FUNCTION takeoff.sync_current_price_book(%L, %L, %L)',
+            source.table_name, source.key_column, source.pricing_condition, source.quote_condition
+        );
+    END LOOP;
+END $$;
+
+DROP TRIGGER IF EXISTS trg_current_price_book_truncate ON takeoff.vendor_pricing;
+CREATE TRIGGER trg_current_price_book_truncate
+    AFTER TRUNCATE ON takeoff.vendor_pricing
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.truncate_current_price_book();
+
+DROP TRIGGER IF EXISTS trg_current_price_book_truncate ON takeoff.quotes;
+CREATE TRIGGER trg_current_price_book_truncate
+    AFTER TRUNCATE ON takeoff.quotes
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.truncate_current_price_book();
+
+SELECT takeoff.rebuild_current_price_book();
+
+-- The vendor pricing grid reads the book; rows that expired since the nightly run are hidden,
+-- and prices without a vendor, product or item are left out as before
+DROP VIEW IF EXISTS takeoff.v_current_vendor_pricing;
+CREATE VIEW takeoff.v_current_vendor_pricing AS
+SELECT
+    pricing_id,
+    vendor_name,
+    vendor_id,
+    product_description,
+    product_id,
+    item_name,
+    cost_code,
+    price,
+    unit_of_measure,
+    effective_date,
+    expiration_date,
+    price_type,
+    minimum_quantity,
+    notes,
+    created_date
+FROM takeoff.current_price_book
+WHERE (expiration_date IS NULL OR expiration_date >= CURRENT_DATE)
+AND (source = 'quote' OR (vendor_id IS NOT NULL AND product_id IS NOT NULL AND item_id IS NOT NULL));
+
+COMMENT ON VIEW takeoff.v_current_vendor_pricing IS
+'Current vendor pricing and quotes for the vendor pricing grid, read from current_price_book';
+
+-- The comprehensive view takes its fallback price from the book
+CREATE OR REPLACE VIEW takeoff.v_comprehensive_takeoff_analysis AS
+SELECT
+    t.takeoff_id,
+    -- Plan information
+    pe.plan_full_name,
+    po.option_name,
+    -- Cost and Item information
+    cc.cost_code,
+    i.item_name,
+    -- Use item_description from takeoffs table (editable) as primary, fallback to products
+    COALESCE(t.item_description, p.item_description, i.item_name) as item_description,
+    -- Quantity and pricing
+    COALESCE(t.quantity_source, 'Manual') as quantity_source,
+    COALESCE(t.quantity, 0) as quantity,
+    COALESCE(t.unit_price, vp_current.price, 0) as unit_price,
+    COALESCE(t.price_factor, 1.0) as price_factor,
+    COALESCE(t.unit_of_measure, p.unit_of_measure, i.default_unit, 'EA') as unit_of_measure,
+    -- Calculated quantity: the measurement a bare-name formula names, else the result stored
+    -- by the formula engine for expression formulas, else the entered quantity
+    COALESCE(pm.measure_value, t.calculated_quantity, t.quantity, 0) as calculated_quantity,
+    -- Extended price of the calculated quantity, as the formula engine stores it
+    (COALESCE(pm.measure_value, t.calculated_quantity, t.quantity, 0) * COALESCE(t.unit_price, vp_current.price, 0) * COALESCE(t.price_factor, 1.0)) as extended_price,
+    -- Vendor information
+    v.vendor_name,
+    -- Job information
+    COALESCE(t.job_name, j.job_name) as job_name,
+    COALESCE(t.job_number, j.job_number) as job_number,
+    COALESCE(t.lot_number, j.lot_number) as lot_number,
+    COALESCE(t.customer_name, j.customer_name) as customer_name,
+    -- Additional details
+    COALESCE(t.room, '') as room,
+    COALESCE(t.spec_name, '') as spec_name,
+    COALESCE(t.notes, '') as notes,
+    -- Foreign key references for editing
+    t.job_id,
+    t.product_id,
+    t.vendor_id,
+    t.plan_option_id,
+    t.item_id,
+    t.cost_code_id,
+    -- Timestamps
+    t.created_date,
+    t.updated_date
+FROM takeoff.takeoffs t
+    -- Required joins for plan and option information
+    LEFT JOIN takeoff.plan_options po ON t.plan_option_id = po.plan_option_id
+    LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+    -- Item and cost code joins
+    LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+    LEFT JOIN takeoff.cost_codes cc ON COALESCE(t.cost_code_id, i.cost_code_id) = cc.cost_code_id
+    -- Formula measurement (no row when the item has no formula)
+    LEFT JOIN takeoff.plan_option_measurements pm
+        ON pm.plan_option_id = t.plan_option_id
+        AND pm.measure_name = NULLIF(i.qty_formula, '')
+    -- Product join for fallback data
+    LEFT JOIN takeoff.products p ON t.product_id = p.product_id
+    -- Current vendor pricing for price fallback (newest current price of the product)
+    LEFT JOIN LATERAL (
+        SELECT pb.vendor_id, pb.price, pb.unit_of_measure
+        FROM takeoff.current_price_book pb
+        WHERE pb.product_id = t.product_id
+        AND pb.source = 'vendor_pricing'
+        ORDER BY pb.created_date DESC
+        LIMIT 1
+    ) vp_current ON true
+    -- Vendor information
+    LEFT JOIN takeoff.vendors v ON COALESCE(t.vendor_id, vp_current.vendor_id) = v.vendor_id
+    -- Job information
+    LEFT JOIN takeoff.jobs j ON t.job_id = j.job_id
+ORDER BY
+    pe.plan_full_name,
+    po.option_name,
+    cc.cost_code,
+    i.item_name,
+    t.takeoff_id;
+
+-- The book now carries vendor pricing changes to the comprehensive summary (migration 035):
+-- its triggers fire after the book has been refreshed, unlike the vendor_pricing ones
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_insert ON takeoff.vendor_pricing;
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_update ON takeoff.vendor_pricing;
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_delete ON takeoff.vendor_pricing;
+
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_insert ON takeoff.current_price_book;
+CREATE TRIGGER trg_comprehensive_summary_insert
+    AFTER INSERT ON takeoff.current_price_book
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary('product_id', 't.product_id IN (%1$s)');
+
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_update ON takeoff.current_price_book;
+CREATE TRIGGER trg_comprehensive_summary_update
+    AFTER UPDATE ON takeoff.current_price_book
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary('product_id', 't.product_id IN (%1$s)');
+
+DROP TRIGGER IF EXISTS trg_comprehensive_summary_delete ON takeoff.current_price_book;
+CREATE TRIGGER trg_comprehensive_summary_delete
+    AFTER DELETE ON takeoff.current_price_book
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT
+    EXECUTE FUNCTION takeoff.sync_comprehensive_takeoff_summary('product_id', 't.product_id IN (%1$s)');
+
+SELECT takeoff.rebuild_comprehensive_takeoff_summary();
+
+COMMENT ON TABLE takeoff.current_price_book IS
+'Current vendor prices and unexpired quotes (rows of v_current_price_book), refreshed per statement by trg_current_price_book_* triggers';
+
+COMMIT;
+
+ANALYZE takeoff.current_price_book;
+
+SELECT 'Migration 039 completed: current price book holds ' || COUNT(*) || ' rows' as status
+FROM takeoff.current_price_book;
@@ -0,0 +1,75 @@
+-- Migration 040: Data version for the nightly current price book expiry
+-- Caches keyed on data versions (migration 034) of the source tables see every change to the
+-- trigger-maintained summaries but one: the nightly price book expiry (migration 039) changes
+-- comprehensive takeoff prices through current_price_book alone. The expiry and the full
+-- rebuild now bump a 'current_price_book' version, once per run, and readers of the
+-- comprehensive summary key on it together with the summary's source tables.
+--
+-- The summaries themselves get no bump trigger: every refresh a source statement causes
+-- would record a change in the same transaction as the source table's own, so their versions
+-- would add nothing for readers that also key on the source tables.
+
+BEGIN;
+
+DO $$
+DECLARE
+    summary TEXT;
+BEGIN
+    FOREACH summary IN ARRAY ARRAY[
+        'comprehensive_takeoff_summary', 'product_price_summary', 'current_price_book'
+    ] LOOP
+        EXECUTE format('DROP TRIGGER IF EXISTS trg_bump_data_version ON takeoff.%I', summary);
+    END LOOP;
+END $$;
+
+DELETE FROM takeoff.data_version_changes
+WHERE table_name IN ('comprehensive_takeoff_summary', 'product_price_summary');
+
+INSERT INTO takeoff.data_version_changes (table_name, changes)
+SELECT 'current_price_book', 0
+WHERE NOT EXISTS (SELECT 1 FROM takeoff.data_version_changes WHERE table_name = 'current_price_book');
+
+CREATE OR REPLACE FUNCTION takeoff.bump_current_price_book_version()
+RETURNS VOID AS $$
+BEGIN
+    PERFORM takeoff.record_data_change('current_price_book');
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.rebuild_current_price_book()
+RETURNS INTEGER AS $$
+DECLARE
+    rebuilt INTEGER;
+BEGIN
+    DELETE FROM takeoff.current_price_book;
+
+    INSERT INTO takeoff.current_price_book
+    SELECT * FROM takeoff.v_current_price_book;
+
+    GET DIAGNOSTICS rebuilt = ROW_COUNT;
+    PERFORM takeoff.bump_current_price_book_version();
+    RETURN rebuilt;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE FUNCTION takeoff.expire_current_price_book()
+RETURNS INTEGER AS $$
+DECLARE
+    expired INTEGER;
+BEGIN
+    DELETE FROM takeoff.current_price_book
+    WHERE expiration_date < CURRENT_DATE;
+
+    GET DIAGNOSTICS expired = ROW_COUNT;
+    IF expired > 0 THEN
+        PERFORM takeoff.bump_current_price_book_version();
+    END IF;
+    RETURN expired;
+END;
+$$ LANGUAGE plpgsql;
+
+COMMIT;
+
+SELECT 'Migration 040 completed: current_price_book at data version ' || version as status
+FROM takeoff.data_versions
+WHERE table_name = 'current_price_book';
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Benchmark the row-level price history trigger (migration 003) against the
+statement-level transition-table trigger (migration 032).
+
+Both variants run against scratch copies of vendor_pricing inside a single
+transaction that is rolled back, so the live tables are never touched.
+
+Usage: python utils/benchmark_price_history_trigger.py [row_count ...]
+       (defaults to 10000 and 100000 rows)
+"""
+
+import os
+import sys
+import time
+import psycopg2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DB_CONFIG_DICT as DB_CONFIG
+
+TABLE_SQL = """
+    CREATE TEMP TABLE {table} (
+        pricing_id SERIAL PRIMARY KEY,
+        vendor_id INTEGER,
+        product_id INTEGER,
+        price NUMERIC(12,4) NOT NULL,
+        is_current BOOLEAN DEFAULT true,
+        updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    ) ON COMMIT DROP
+"""
+
+VARIANTS = {
+    'row': """
+        CREATE INDEX ON {table}(vendor_id, product_id);
+
+        CREATE FUNCTION pg_temp.{table}_row_history() RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE {table}
+            SET is_current = false, updated_date = CURRENT_TIMESTAMP
+            WHERE vendor_id = NEW.vendor_id
+            AND product_id = NEW.product_id
+            AND pricing_id != NEW.pricing_id
+            AND is_current = true;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER {table}_history AFTER INSERT ON {table}
+            FOR EACH ROW EXECUTE FUNCTION pg_temp.{table}_row_history();
+    """,
+    'statement': """
+        CREATE INDEX ON {table}(vendor_id, product_id) WHERE is_current;
+
+        CREATE FUNCTION pg_temp.{table}_statement_history() RETURNS TRIGGER AS $$
+        BEGIN
+            UPDATE {table} vp
+            SET is_current = false, updated_date = CURRENT_TIMESTAMP
+            FROM (
+                SELECT vendor_id, product_id, MAX(pricing_id) AS pricing_id
+                FROM new_prices
+                GROUP BY vendor_id, product_id
+            ) latest
+            WHERE vp.vendor_id = latest.vendor_id
+            AND vp.product_id = latest.product_id
+            AND vp.pricing_id <> latest.pricing_id
+            AND vp.is_current = true;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql;
+
+        CREATE TRIGGER {table}_history AFTER INSERT ON {table}
+            REFERENCING NEW TABLE AS new_prices
+            FOR EACH STATEMENT EXECUTE FUNCTION pg_temp.{table}_statement_history();
+    """
+}
+
+def run_variant(cursor, variant, row_count):
+    """Seed row_count current prices, then time a bulk reprice of all of them"""
+    table = f"bench_{variant}_{row_count}"
+    cursor.execute(TABLE_SQL.format(table=table))
+
+    # Seed one current price per vendor/product pair before the trigger exists
+    cursor.execute(f"""
+        INSERT INTO {table} (vendor_id, product_id, price)
+        SELECT g %% 50, g, 10 + (g %% 100)
+        FROM generate_series(1, %s) AS g
+    """, (row_count,))
+    cursor.execute(VARIANTS[variant].format(table=table))
+    cursor.execute(f"ANALYZE {table}")
+
+    start = time.perf_counter()
+    cursor.execute(f"""
+        INSERT INTO {table} (vendor_id, product_id, price)
+        SELECT g %% 50, g, 11 + (g %% 100)
+        FROM generate_series(1, %s) AS g
+    """, (row_count,))
+    elapsed = time.perf_counter() - start
+
+    cursor.execute(f"SELECT COUNT(*) FROM {table} WHERE is_current")
+    current_rows = cursor.fetchone()[0]
+    if current_rows != row_count:
+        raise RuntimeError(f"{variant} trigger left {current_rows} current rows, expected {row_count}")
+
+    return elapsed
+
+def main():
+    row_counts = [int(arg) for arg in sys.argv[1:]] or [10000, 100000]
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    try:
+        print(f"{'rows':>10} {'row trigger':>14} {'statement':>14} {'speedup':>9}")
+        for row_count in row_counts:
+            row_time = run_variant(cursor, 'row', row_count)
+            statement_time = run_variant(cursor, 'statement', row_count)
+            print(f"{row_count:>10} {row_time:>13.3f}s {statement_time:>13.3f}s {row_time / statement_time:>8.1f}x")
+    finally:
+        conn.rollback()
+        cursor.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
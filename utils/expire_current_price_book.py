@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+"""
+Remove expired rows from takeoff.current_price_book (migration 039).
+
+Triggers keep the price book current as pricing and quotes change, but a
+price expiring at midnight changes nothing, so this runs nightly, e.g.
+
+    5 0 * * * cd /path/to/postgresql-docker && python utils/expire_current_price_book.py
+
+Deleting the rows refreshes the comprehensive takeoff summary for the
+affected products in the same transaction.
+
+Usage: python utils/expire_current_price_book.py [--rebuild]
+       --rebuild replaces the whole book with the rows of v_current_price_book
+"""
+
+import os
+import sys
+import time
+import psycopg2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DB_CONFIG_DICT as DB_CONFIG
+
+def main():
+    rebuild = '--rebuild' in sys.argv[1:]
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    try:
+        start = time.perf_counter()
+        if rebuild:
+            cursor.execute("SELECT takeoff.rebuild_current_price_book()")
+        else:
+            cursor.execute("SELECT takeoff.expire_current_price_book()")
+        row_count = cursor.fetchone()[0]
+        conn.commit()
+        action = 'Rebuilt current_price_book' if rebuild else 'Expired from current_price_book'
+        print(f"{action}: {row_count} rows in {time.perf_counter() - start:.2f}s")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
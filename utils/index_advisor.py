@@ -0,0 +1,319 @@
+#!/usr/bin/env python3
+"""
+Index advisor: replay the web app's SQL, find sequential scans and sorts in
+the query plans, try an index for each and keep the ones that help.
+
+Every literal SQL statement in web_ui/app.py (execute() calls and *_SQL
+constants) is prepared with its %s placeholders as parameters and planned
+generically, so a plan does not depend on any one value. A sequential scan
+with a filter, or a sort fed by one, on a table of at least --min-rows rows
+gives a candidate index: the equality columns of the filter, then one range
+column, then the sort keys, with boolean filter columns as a partial index
+predicate. Each candidate is created, the statements that suggested it are
+timed again (EXPLAIN ANALYZE, best of --runs, NULL parameters), and it is
+dropped. Candidates that change the plan or cut the time by 10% or more are
+reported and, with --write, emitted as the next migrations/NNN_*.sql.
+
+Everything runs in one transaction that is rolled back, but CREATE INDEX
+blocks writes to the table while it runs: point --dsn at a representative
+local copy of the database, not production.
+
+Usage: python utils/index_advisor.py [--dsn DSN] [--min-rows N] [--runs N] [--write]
+"""
+
+import argparse
+import ast
+import json
+import os
+import re
+import sys
+import psycopg2
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+from config import DB_CONFIG_DICT as DB_CONFIG
+
+APP_PATH = os.path.join(ROOT, 'web_ui', 'app.py')
+MIGRATIONS_DIR = os.path.join(ROOT, 'migrations')
+SCHEMA = 'takeoff'
+STATEMENT_KINDS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+MIN_IMPROVEMENT = 0.9  # Keep an index that brings a statement to 90% of its time or less
+
+def app_statements(path=APP_PATH):
+    """Literal SQL of execute()/mogrify() calls and *_SQL constants, deduplicated, with a count of f-strings skipped"""
+    tree = ast.parse(open(path).read())
+    statements, dynamic = {}, 0
+
+    def add(node):
+        nonlocal dynamic
+        if isinstance(node, ast.JoinedStr):
+            dynamic += 1
+        elif isinstance(node, ast.Constant) and isinstance(node.value, str):
+            sql = ' '.join(node.value.split())
+            if sql.upper().startswith(STATEMENT_KINDS):
+                statements.setdefault(sql, node.lineno)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) \
+                and node.func.attr in ('execute', 'mogrify') and node.args:
+            add(node.args[0])
+        elif isinstance(node, ast.Assign) and any(
+            isinstance(target, ast.Name) and target.id.endswith('_SQL') for target in node.targets
+        ):
+            add(node.value)
+    return sorted(statements.items(), key=lambda item: item[1]), dynamic
+
+def to_prepared(sql):
+    """psycopg2 placeholders (%s, %(name)s) -> $n parameters; returns (sql, parameter count)"""
+    names = {}
+
+    def number(match):
+        if match.group(0) == '%%':
+            return '%'
+        key = match.group(1) or f'#{len(names)}'
+        names.setdefault(key, len(names) + 1)
+        return f'${names[key]}'
+
+    return re.sub(r'%%|%\((\w+)\)s|%s', number, sql), len(names)
+
+class Advisor:
+    def __init__(self, conn, min_rows, runs):
+        self.conn = conn
+        self.cursor = conn.cursor()
+        self.min_rows = min_rows
+        self.runs = runs
+        self.tables = {}
+
+    def table(self, name):
+        """Row estimate, column types and existing index keys of a table (cached)"""
+        if name not in self.tables:
+            self.cursor.execute("""
+                SELECT c.reltuples,
+                    (SELECT json_object_agg(a.attname, format_type(a.atttypid, a.atttypmod))
+                     FROM pg_attribute a WHERE a.attrelid = c.oid AND a.attnum > 0 AND NOT a.attisdropped),
+                    (SELECT json_agg(pg_get_indexdef(i.indexrelid)) FROM pg_index i WHERE i.indrelid = c.oid)
+                FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND c.relname = %s
+            """, (SCHEMA, name))
+            row = self.cursor.fetchone()
+            self.tables[name] = {'rows': row[0], 'columns': row[1] or {}, 'indexes': row[2] or []} if row else None
+        return self.tables[name]
+
+    def explain(self, sql, params, analyze):
+        """Plan (and with analyze, the best execution time in ms) of a prepared statement"""
+        self.cursor.execute("SAVEPOINT advisor")
+        try:
+            # Prepared statements outlive ROLLBACK TO SAVEPOINT, so one PREPARE serves every run
+            self.cursor.execute(f"PREPARE advisor_statement AS {sql}")
+            args = f"({', '.join(['NULL'] * params)})" if params else ''
+            options = 'ANALYZE, FORMAT JSON' if analyze else 'FORMAT JSON'
+            best, plan = None, None
+            for _ in range(self.runs if analyze else 1):
+                self.cursor.execute(f"EXPLAIN ({options}) EXECUTE advisor_statement{args}")
+                result = self.cursor.fetchone()[0]
+                result = json.loads(result) if isinstance(result, str) else result
+                plan = result[0]['Plan']
+                if analyze:
+                    elapsed = result[0]['Execution Time']
+                    best = elapsed if best is None else min(best, elapsed)
+                # Undo writes between runs so every run sees the same data
+                self.cursor.execute("ROLLBACK TO SAVEPOINT advisor")
+            return plan, best
+        except psycopg2.Error:
+            self.cursor.execute("ROLLBACK TO SAVEPOINT advisor")
+            raise
+        finally:
+            self.cursor.execute("DEALLOCATE ALL")
+            self.cursor.execute("RELEASE SAVEPOINT advisor")
+
+    def candidates(self, node, found=None):
+        """Walk a plan for filtered sequential scans and sorts over them on large tables"""
+        found = [] if found is None else found
+        children = node.get('Plans', [])
+        if node['Node Type'] == 'Sort' and children and children[0]['Node Type'] == 'Seq Scan':
+            candidate = self.candidate(children[0], node.get('Sort Key', []))
+            if candidate:
+                found.append(candidate)
+            children = children[0].get('Plans', [])
+        elif node['Node Type'] == 'Seq Scan' and node.get('Filter'):
+            candidate = self.candidate(node, [])
+            if candidate:
+                found.append(candidate)
+        for child in children:
+            self.candidates(child, found)
+        return found
+
+    def candidate(self, scan, sort_keys):
+        """(table, columns, predicate) for one scan, or None when it is small or unindexable"""
+        name = scan.get('Relation Name')
+        table = self.table(name) if name else None
+        if not table or table['rows'] < self.min_rows:
+            return None
+        text = scan.get('Filter', '')
+        equality, ranges, predicate = [], [], []
+        for column, column_type in table['columns'].items():
+            reference = rf'(?:\b{scan["Alias"]}\.)?\b{column}\b\)?(?:::[a-z ]+)?\)?'
+            if column_type == 'boolean' and re.search(rf'(?<![=<>] ){reference}(?! *(?:=|<>|IS))', text):
+                predicate.append(column)
+            elif re.search(rf'lower\(\(?{reference} = ', text):
+                equality.append(f'lower({column})')
+            elif re.search(rf'{reference} = ', text):
+                equality.append(column)
+            elif re.search(rf'{reference} [<>]=? ', text):
+                ranges.append(column)
+        columns = equality + ranges[:1]
+        for key in sort_keys:
+            column = re.sub(rf'^{scan["Alias"]}\.', '', key.replace(' DESC', '').strip('()'))
+            if column not in table['columns']:
+                break
+            if column not in columns:
+                columns.append(column + (' DESC' if key.endswith(' DESC') else ''))
+        if not columns:
+            return None
+        return name, tuple(columns), ' AND '.join(predicate) or None
+
+    def covered(self, name, columns, predicate):
+        """
+        True when an existing index has these columns as its leading key columns and no
+        predicate, or this one
+        """
+        wanted = [normalize_key(column) for column in columns]
+        for definition in self.table(name)['indexes']:
+            keys, index_predicate = index_keys(definition)
+            if keys[:len(wanted)] == wanted and (
+                index_predicate is None or predicate_terms(index_predicate) == predicate_terms(predicate)
+            ):
+                return True
+        return False
+
+    def measure(self, name, columns, predicate, statements):
+        """Create the index, time its statements again, drop it; returns [(line, sql, before, after, uses index)]"""
+        where = f' WHERE {predicate}' if predicate else ''
+        self.cursor.execute(f"CREATE INDEX advisor_index ON {SCHEMA}.{name} ({', '.join(columns)}){where}")
+        self.cursor.execute(f"ANALYZE {SCHEMA}.{name}")
+        try:
+            timings = []
+            for line, sql, params, before in statements:
+                plan, after = self.explain(sql, params, analyze=True)
+                timings.append((line, sql, before, after, 'advisor_index' in json.dumps(plan)))
+            return timings
+        finally:
+            self.cursor.execute("DROP INDEX advisor_index")
+
+def normalize_key(key):
+    """Compare index keys as written here and by pg_get_indexdef: no casts, quotes or doubled parentheses"""
+    key = re.sub(r'::[a-z ]+?(?=[,)]|$| DESC)', '', key.replace('"', ''))
+    while re.search(r'\(\(([^()]*)\)\)', key):
+        key = re.sub(r'\(\(([^()]*)\)\)', r'(\1)', key)
+    return key.strip()
+
+def predicate_terms(predicate):
+    """The AND-ed terms of a partial index predicate, in a comparable order"""
+    return sorted(normalize_key(term.strip('() ')) for term in predicate.split(' AND ')) if predicate else None
+
+def index_keys(definition):
+    """(key columns, predicate) of a pg_get_indexdef definition, keys split at top-level commas"""
+    start = re.search(r'USING \w+ \(', definition)
+    if not start:
+        return [], None
+    keys, depth, current = [], 0, ''
+    position = start.end()
+    for position in range(start.end(), len(definition)):
+        char = definition[position]
+        if char == ')' and depth == 0:
+            break
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        if char == ',' and depth == 0:
+            keys.append(current)
+            current = ''
+        else:
+            current += char
+    keys.append(current)
+    predicate = re.search(r' WHERE \((.*)\)$', definition[position:])
+    return [normalize_key(key) for key in keys], predicate and predicate.group(1)
+
+def index_name(name, columns, predicate):
+    parts = [re.sub(r'\W+', '_', column.replace(' DESC', '')).strip('_') for column in columns]
+    if predicate:
+        parts.append(re.sub(r'\W+', '_', predicate.lower()).replace('_and_', '_'))
+    return f"idx_{name}_{'_'.join(parts)}"[:63]
+
+def write_migration(accepted):
+    """Write the accepted indexes as the next numbered migration; returns its path"""
+    numbers = [int(name[:3]) for name in os.listdir(MIGRATIONS_DIR) if name[:3].isdigit()]
+    number = max(numbers, default=0) + 1
+    path = os.path.join(MIGRATIONS_DIR, f'{number:03d}_advisor_indexes.sql')
+    lines = [
+        f'-- Migration {number:03d}: Indexes proposed by utils/index_advisor.py',
+        '-- Each index lists the app statements (web_ui/app.py line) it was measured on, as',
+        '-- best-of EXPLAIN ANALYZE times with generic plans, before -> after.',
+        '',
+        'BEGIN;',
+        ''
+    ]
+    for (name, columns, predicate), timings in accepted:
+        for line, sql, before, after, uses in timings:
+            lines.append(f'-- app.py:{line} {before:.2f} ms -> {after:.2f} ms{"" if uses else " (index unused)"}: {sql[:70]}')
+        where = f'\n    WHERE {predicate}' if predicate else ''
+        lines.append(f'CREATE INDEX IF NOT EXISTS {index_name(name, columns, predicate)}')
+        lines.append(f'    ON {SCHEMA}.{name}({", ".join(columns)}){where};')
+        lines.append('')
+    lines += [
+        'COMMIT;',
+        '',
+        f"SELECT 'Migration {number:03d} completed: {len(accepted)} advisor indexes' as status;",
+        ''
+    ]
+    with open(path, 'w') as f:
+        f.write('\n'.join(lines))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--dsn', help='connection string of a representative local database (default: config.py)')
+    parser.add_argument('--min-rows', type=int, default=1000, help='ignore scans of smaller tables')
+    parser.add_argument('--runs', type=int, default=3, help='EXPLAIN ANALYZE runs per statement (best is kept)')
+    parser.add_argument('--write', action='store_true', help='write the accepted indexes as a migration')
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(args.dsn) if args.dsn else psycopg2.connect(**DB_CONFIG)
+    advisor = Advisor(conn, args.min_rows, args.runs)
+    try:
+        advisor.cursor.execute("SET LOCAL plan_cache_mode = force_generic_plan")
+        advisor.cursor.execute("SET LOCAL statement_timeout = '60s'")
+
+        statements, dynamic = app_statements()
+        proposals, failed = {}, 0
+        for sql, line in statements:
+            prepared, params = to_prepared(sql)
+            try:
+                plan, before = advisor.explain(prepared, params, analyze=True)
+            except psycopg2.Error as e:
+                failed += 1
+                print(f"app.py:{line} skipped: {str(e).splitlines()[0]}")
+                continue
+            for candidate in advisor.candidates(plan):
+                if not advisor.covered(*candidate):
+                    proposals.setdefault(candidate, []).append((line, prepared, params, before))
+        print(f"{len(statements)} statements replayed ({failed} failed, {dynamic} f-string statements not replayed), "
+              f"{len(proposals)} candidate indexes")
+
+        accepted = []
+        for (name, columns, predicate), found in sorted(proposals.items()):
+            timings = advisor.measure(name, columns, predicate, found)
+            keep = any(uses or after <= before * MIN_IMPROVEMENT for _, _, before, after, uses in timings)
+            print(f"\n{'ACCEPT' if keep else 'reject'} {name}({', '.join(columns)}){' WHERE ' + predicate if predicate else ''}")
+            for line, sql, before, after, uses in timings:
+                print(f"  app.py:{line:<5} {before:9.2f} ms -> {after:9.2f} ms {'index scan' if uses else 'unused':<10} {sql[:60]}")
+            if keep:
+                accepted.append(((name, columns, predicate), timings))
+
+        if args.write and accepted:
+            print(f"\nWrote {write_migration(accepted)}")
+    finally:
+        conn.rollback()
+        advisor.cursor.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Rebuild takeoff.comprehensive_takeoff_summary (migration 035) from
+v_comprehensive_takeoff_analysis.
+
+Triggers keep the summary current row by row; a full rebuild is only needed
+after changing the view or to repair drift. The rebuild runs in one
+transaction, so readers see the old rows until it commits.
+
+Usage: python utils/rebuild_comprehensive_takeoff_summary.py [--check]
+       --check only compares the summary with the view and exits non-zero
+       when they differ
+"""
+
+import os
+import sys
+import time
+import psycopg2
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from config import DB_CONFIG_DICT as DB_CONFIG
+
+DIFF_SQL = """
+    SELECT
+        (SELECT COUNT(*) FROM (
+            SELECT * FROM takeoff.v_comprehensive_takeoff_analysis
+            EXCEPT ALL
+            SELECT * FROM takeoff.comprehensive_takeoff_summary
+        ) missing) AS missing_rows,
+        (SELECT COUNT(*) FROM (
+            SELECT * FROM takeoff.comprehensive_takeoff_summary
+            EXCEPT ALL
+            SELECT * FROM takeoff.v_comprehensive_takeoff_analysis
+        ) stale) AS stale_rows
+"""
+
+def check(cursor):
+    """Print how many view rows the summary lacks or has out of date; True when in sync"""
+    cursor.execute(DIFF_SQL)
+    missing_rows, stale_rows = cursor.fetchone()
+    print(f"missing or changed rows: {missing_rows}, stale rows: {stale_rows}")
+    return missing_rows == 0 and stale_rows == 0
+
+def rebuild(conn, cursor):
+    """Replace the summary's contents with the view's rows"""
+    start = time.perf_counter()
+    cursor.execute("SELECT takeoff.rebuild_comprehensive_takeoff_summary()")
+    row_count = cursor.fetchone()[0]
+    conn.commit()
+    cursor.execute("ANALYZE takeoff.comprehensive_takeoff_summary")
+    conn.commit()
+    print(f"Rebuilt comprehensive_takeoff_summary: {row_count} rows in {time.perf_counter() - start:.2f}s")
+
+def main():
+    conn = psycopg2.connect(**DB_CONFIG)
+    cursor = conn.cursor()
+    try:
+        if '--check' in sys.argv[1:]:
+            in_sync = check(cursor)
+            conn.rollback()
+            sys.exit(0 if in_sync else 1)
+        rebuild(conn, cursor)
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+if __name__ == '__main__':
+    main()
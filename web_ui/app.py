@@ -70,6 +70,21 @@ Provides dashboard view of all tables with CRUD operations
 #        - Vendors
 #        - Formulas
 #
+#    4.11 Import Jobs Endpoints
+#        - Background imports: submit, list, progress, cancel
+#
+#    4.12 Grid Export Endpoints
+#        - Filtered/sorted/projected exports of any registered grid
+#
+#    4.13 Estimate Workbook Endpoints
+#        - Background estimate workbooks per plan option or job: submit, progress, download
+#
+#    4.14 Server-Side Row Model Endpoints
+#        - Row blocks, groups and aggregates of any registered grid for AG-Grid's server-side row model
+#
+#    4.15 Takeoff Rollup Endpoints
+#        - Comprehensive takeoff subtotals at every grouping level (GROUPING SETS), cached by data version
+#
 # 5. Main App Run Block [Line 3241]
 #    - Application entry point
 
@@ -84,6 +99,13 @@ load_dotenv()
 import os
 import sys
 import time
+import functools
+import queue
+import threading
+import uuid
+import tempfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import psycopg2
 from psycopg2.extras import RealDictCursor
 from flask import Flask, render_template, request, redirect, url_for, flash, jsonify
@@ -652,6 +674,986 @@ cache_expiry = {}
 response_etags = {}
 CACHE_DURATION = 300  # Cache duration in seconds (5 minutes)
 
+def _as_list(value):
+    """Normalize a scalar-or-list request value to a list, dropping empty entries"""
+    if value is None or value == '':
+        return []
+    if isinstance(value, (list, tuple)):
+        return [v for v in value if v is not None and v != '']
+    return [value]
+
+# Spreadsheet import schemas map each column to a spec:
+#   type        'text', 'int', 'number' or 'bool' (cells are coerced to this type; 'int'
+#               values must fit the INTEGER column they are staged in)
+#   required    blank cells are rejected
+#   default     value used for blank cells
+#   max_length  longest text accepted (the column's VARCHAR size)
+#   choices     allowed text values
+#   min         smallest number accepted (the column's CHECK constraint)
+#   max         largest number accepted (the column's DECIMAL precision)
+#   scale       decimal places the column keeps; numbers are rounded to it before the range
+#               checks, as the column would round them
+IMPORT_SQL_TYPES = {'text': 'TEXT', 'int': 'INTEGER', 'number': 'NUMERIC', 'bool': 'BOOLEAN'}
+IMPORT_INTEGER_MAX = 2147483647
+IMPORT_BOOLEAN_VALUES = {
+    'true': True, 't': True, 'yes': True, 'y': True, '1': True, '1.0': True,
+    'false': False, 'f': False, 'no': False, 'n': False, '0': False, '0.0': False
+}
+
+def _validate_import_frame(df, schema, unique_on=None, seen_keys=None):
+    """
+    Validate a spreadsheet DataFrame against an import schema using whole-column operations:
+    trimming, type coercion, defaults, required/choice/length/range checks and in-file
+    duplicate detection on the unique_on columns. Returns (clean, errors) where clean holds the
+    valid rows typed per the schema (original index kept, so sheet row = index + 2) and errors
+    is [{'row': ..., 'error': ...}] with every problem for a row joined together.
+
+    When a file arrives in batches, pass the same seen_keys dict for every batch so duplicates
+    are also caught across batches; it maps each key tuple to the row it was first seen on.
+    """
+    import numpy as np
+    import pandas as pd
+
+    row_nums = pd.Series(df.index + 2, index=df.index)
+    clean = pd.DataFrame(index=df.index)
+    problems = pd.DataFrame(index=df.index, dtype=object)
+
+    for column, spec in schema.items():
+        column_type = spec.get('type', 'text')
+        raw = df[column] if column in df.columns else pd.Series(np.nan, index=df.index, dtype=object)
+        text = raw.astype('string').str.strip()
+        if column_type == 'text' and pd.api.types.is_float_dtype(raw):
+            # Codes typed as numbers come back from Excel as floats ("1000.0")
+            text = text.str.replace(r'\.0$', '', regex=True)
+        blank = text.fillna('').eq('')
+        default = spec.get('default')
+
+        checks = [(blank & spec.get('required', False) & (default is None), f'{column} is required')]
+        if column_type == 'text':
+            values = text.mask(blank, default)
+            if spec.get('choices'):
+                checks.append((
+                    ~blank & ~values.isin(spec['choices']),
+                    f"{column} must be {', '.join(spec['choices'][:-1])} or {spec['choices'][-1]} (got '"
+                    + values.fillna('') + "')"
+                ))
+            if spec.get('max_length'):
+                checks.append((
+                    values.str.len().fillna(0) > spec['max_length'],
+                    f"{column} is longer than {spec['max_length']} characters"
+                ))
+        elif column_type in ('int', 'number'):
+            values = pd.to_numeric(text.mask(blank).astype(object), errors='coerce')
+            checks.append((~blank & values.isna(), f'{column} must be a number'))
+            if spec.get('scale') is not None:
+                values = values.round(spec['scale'])
+            if column_type == 'int':
+                checks.append((values.notna() & (np.floor(values) != values), f'{column} must be a whole number'))
+                checks.append((values.abs() > IMPORT_INTEGER_MAX, f'{column} is out of range'))
+            if spec.get('min') is not None:
+                checks.append((values < spec['min'], f"{column} cannot be less than {spec['min']}"))
+            if spec.get('max') is not None:
+                checks.append((values > spec['max'], f"{column} cannot be more than {spec['max']}"))
+            values = values.mask(blank, default)
+            values = values.round().astype('Int64') if column_type == 'int' else values.astype('Float64')
+        else:
+            values = text.str.lower().map(IMPORT_BOOLEAN_VALUES)
+            checks.append((~blank & values.isna(), f'{column} must be TRUE or FALSE'))
+            values = values.mask(blank, default).astype('boolean')
+
+        # First failing check wins for each cell
+        conditions = [condition.fillna(False).to_numpy(dtype=bool) for condition, _ in checks]
+        messages = [np.broadcast_to(np.asarray(message, dtype=object), len(df)) for _, message in checks]
+        problems[column] = np.select(conditions, messages, default=None)
+        clean[column] = values
+
+    if unique_on:
+        keys = [clean[column] for column in unique_on]
+        has_key = pd.concat(keys, axis=1).notna().all(axis=1)
+        first_row = row_nums.groupby(keys, dropna=True).transform('min')
+        duplicate = has_key & clean.duplicated(subset=unique_on, keep='first')
+        if seen_keys is not None:
+            key_tuples = pd.Series(list(zip(*(key.tolist() for key in keys))), index=df.index, dtype=object)
+            earlier = key_tuples.where(has_key).map(seen_keys.get, na_action='ignore')
+            duplicate |= earlier.notna()
+            first_row = earlier.fillna(first_row)
+            first_seen = has_key & ~duplicate
+            seen_keys.update(zip(key_tuples[first_seen], row_nums[first_seen]))
+        problems['_duplicate'] = np.where(
+            duplicate,
+            f"Duplicate {', '.join(unique_on)} (first seen on row " + first_row.astype('Int64').astype(str) + ')',
+            None
+        )
+
+    messages = problems.stack().groupby(level=0).agg('; '.join)
+    errors = [{'row': int(row_nums[index]), 'error': message} for index, message in messages.items()]
+    return clean.drop(index=messages.index), errors
+
+def _import_records(frame):
+    """Convert a validated import frame to row dicts with None for blank cells"""
+    return frame.astype(object).where(frame.notna(), None).to_dict('records')
+
+# Rows per DataFrame batch handed to the import cores
+IMPORT_BATCH_SIZE = 5000
+
+class ImportFileError(ValueError):
+    """Raised when an uploaded import file cannot be read; the request gets a 400"""
+
+class ImportBatches:
+    """
+    Lazily parsed DataFrame batches of an import file. Iterating yields the batches; a parse
+    error raised on the way becomes ImportFileError. close() releases the file whether or
+    not the batches were ever read, so callers close it in a finally.
+    """
+
+    def __init__(self, filename, batches, close=None):
+        self.filename = filename
+        self.batches = batches
+        self.on_close = close
+
+    def __iter__(self):
+        try:
+            yield from self.batches
+        except Exception as e:
+            raise ImportFileError(f'Error reading {self.filename}: {str(e)}') from e
+
+    def close(self):
+        if self.on_close:
+            self.on_close()
+            self.on_close = None
+
+def _open_import_batches(source, filename, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Open an uploaded import file (path or seekable file object) for streaming.
+
+    Returns (columns, batches) where batches is an ImportBatches lazily yielding DataFrames
+    of up to batch_size rows; the caller closes it. .xlsx is read with openpyxl in read-only
+    mode and CSV with pandas' chunked reader, so peak memory follows the batch size rather
+    than the file size. Each batch keeps the sheet position as its index (sheet row =
+    index + 2), and fully blank sheet rows are skipped without shifting later row numbers.
+    Legacy .xls files have no streaming reader and are read whole, then batched. A file
+    that cannot be opened raises ImportFileError.
+    """
+    import pandas as pd
+
+    name = filename.lower()
+    workbook = None
+    try:
+        if name.endswith('.csv'):
+            columns = list(pd.read_csv(source, nrows=0, encoding='utf-8').columns)
+            if hasattr(source, 'seek'):
+                source.seek(0)
+            reader = pd.read_csv(source, chunksize=batch_size, encoding='utf-8')
+            return columns, ImportBatches(filename, reader, reader.close)
+
+        if name.endswith('.xls'):
+            df = pd.read_excel(source)
+            return list(df.columns), ImportBatches(
+                filename, (df.iloc[start:start + batch_size] for start in range(0, len(df), batch_size))
+            )
+
+        from openpyxl import load_workbook
+
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        columns, sheet_rows = _xlsx_sheet_rows(workbook.active)
+    except Exception as e:
+        if workbook is not None:
+            workbook.close()
+        raise ImportFileError(f'Error reading {filename}: {str(e)}') from e
+
+    batches = (
+        pd.DataFrame([row for _, row in chunk], columns=columns, index=[position for position, _ in chunk])
+        for chunk in _chunked(sheet_rows, batch_size)
+    )
+    return columns, ImportBatches(filename, batches, workbook.close)
+
+def _xlsx_sheet_rows(worksheet):
+    """
+    Read a read-only openpyxl worksheet as (columns, rows) where rows lazily yields
+    (sheet position, values) pairs padded to the header width, skipping fully blank rows
+    """
+    rows = worksheet.iter_rows(values_only=True)
+    header = next(rows, ())
+    columns = [
+        str(value).strip() if value is not None else f'Unnamed: {position}'
+        for position, value in enumerate(header)
+    ]
+    width = len(columns)
+
+    def data_rows():
+        for position, row in enumerate(rows):
+            if all(value is None or value == '' for value in row):
+                continue
+            yield position, tuple(row[:width]) + (None,) * (width - len(row))
+
+    return columns, data_rows()
+
+def _as_import_batches(data):
+    """Accept a single DataFrame or an iterable of DataFrame batches"""
+    import pandas as pd
+
+    return [data] if isinstance(data, pd.DataFrame) else data
+
+def _copy_frame(cursor, df, table, columns):
+    """Stream DataFrame columns into a table with COPY FROM STDIN (blank cells arrive as NULL)"""
+    import io
+
+    buffer = io.StringIO()
+    df.to_csv(buffer, columns=columns, index=False, header=False)
+    buffer.seek(0)
+    cursor.copy_expert(f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+# Streamed COPY exports hold at most EXPORT_STREAM_QUEUE_DEPTH chunks per download
+EXPORT_STREAM_CHUNK_SIZE = 64 * 1024
+EXPORT_STREAM_QUEUE_DEPTH = 8
+
+class _CopyStreamClosed(Exception):
+    """Raised in a COPY writer thread once its download has been closed"""
+
+class _CopyQueueWriter:
+    """
+    File-like target for copy_expert that batches PostgreSQL's per-row output into chunks on a
+    bounded queue. The first write (the CSV header) is passed on at once so the response can
+    start before the query finishes; a full queue blocks COPY until the client catches up.
+    """
+
+    def __init__(self, chunks, closed):
+        self.chunks = chunks
+        self.closed = closed
+        self.buffer = []
+        self.size = 0
+        self.started = False
+
+    def put(self, item):
+        while True:
+            if self.closed.is_set():
+                raise _CopyStreamClosed()
+            try:
+                self.chunks.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def write(self, data):
+        self.buffer.append(data)
+        self.size += len(data)
+        if self.size >= EXPORT_STREAM_CHUNK_SIZE or not self.started:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.put(b''.join(self.buffer))
+            self.buffer, self.size, self.started = [], 0, True
+
+def _stream_copy_csv(query, filename, params=None, cache_path=None):
+    """
+    Stream a SELECT as a CSV download with COPY (...) TO STDOUT WITH CSV HEADER.
+
+    COPY runs on its own connection in a writer thread and the response yields its chunks as
+    they arrive, so memory stays bounded by the queue whatever the row count. Errors raised
+    before the header is produced (connection, bad SQL) still return a JSON 500; a client
+    that disconnects stops COPY at its next chunk. With cache_path the chunks are also written
+    to that export cache entry, which only appears once the whole download has gone out.
+    """
+    from flask import Response
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    with conn.cursor() as cursor:
+        copy_sql = cursor.mogrify(f"COPY ({query}) TO STDOUT WITH CSV HEADER", params).decode('utf-8')
+    chunks = queue.Queue(maxsize=EXPORT_STREAM_QUEUE_DEPTH)
+    closed = threading.Event()
+    writer = _CopyQueueWriter(chunks, closed)
+
+    def copy_rows():
+        try:
+            with conn.cursor() as cursor:
+                cursor.copy_expert(copy_sql, writer)
+            writer.flush()
+            writer.put(None)
+        except _CopyStreamClosed:
+            pass
+        except Exception as e:
+            logger.error(f"Error streaming {filename}: {e}")
+            try:
+                writer.put(e)
+            except _CopyStreamClosed:
+                pass
+        finally:
+            conn.close()
+
+    threading.Thread(target=copy_rows, name=f'export-{filename}', daemon=True).start()
+
+    first = chunks.get()
+    if isinstance(first, Exception):
+        return jsonify({'error': str(first)}), 500
+
+    def generate():
+        output = _open_export_output(cache_path) if cache_path else None
+        try:
+            chunk = first
+            while chunk is not None:
+                if isinstance(chunk, Exception):
+                    raise chunk  # Abort mid-stream so the client sees a truncated download
+                if output:
+                    output.write(chunk)
+                yield chunk
+                chunk = chunks.get()
+            if output:
+                _store_export_output(output, cache_path).close()
+                output = None
+        finally:
+            closed.set()
+            if output:
+                _discard_export_output(output)
+
+    response = Response(generate(), mimetype=EXPORT_MIMETYPES['csv'], headers={
+        'Content-Disposition': f'attachment; filename={filename}'
+    })
+    # A response that is never iterated (HEAD, aborted before the body) never runs the
+    # generator's finally; the writer thread still has to stop
+    response.call_on_close(closed.set)
+    return response
+
+# Rows per round trip from the server-side cursor of a streamed XLSX/Parquet/Arrow export
+EXPORT_FETCH_SIZE = 5000
+# Finished export files stay in memory up to this size, larger ones spill to a temp file
+EXPORT_SPOOL_MAX_BYTES = 32 * 1024 * 1024
+# Excel formats by PostgreSQL type OID; numeric columns use their declared scale when known
+PG_NUMBER_TYPES = {700, 701, 1700}  # real, double precision, numeric
+PG_DATE_FORMATS = {1082: 'yyyy-mm-dd', 1114: 'yyyy-mm-dd hh:mm:ss', 1184: 'yyyy-mm-dd hh:mm:ss'}
+PG_TIMESTAMPTZ = 1184
+
+def _export_batches(conn, query, params=None):
+    """
+    Run an export SELECT on a server-side cursor. Returns (columns, first, batches): named
+    cursors only describe their columns after a fetch, so the first batch is read up front;
+    batches then yields it and every later list of up to EXPORT_FETCH_SIZE row tuples.
+    """
+    cursor = conn.cursor(name='export')
+    cursor.itersize = EXPORT_FETCH_SIZE
+    cursor.execute(query, params)
+    first = cursor.fetchmany(EXPORT_FETCH_SIZE)
+    columns = cursor.description
+
+    def batches():
+        try:
+            rows = first
+            while rows:
+                yield rows
+                rows = cursor.fetchmany(EXPORT_FETCH_SIZE)
+        finally:
+            cursor.close()
+
+    return columns, first, batches()
+
+def _send_spooled_file(output, filename, mimetype):
+    """Stream a finished export file out of its spool in chunks, closing it afterwards"""
+    from flask import Response
+
+    output.seek(0, 2)
+    size = output.tell()
+    output.seek(0)
+
+    def generate():
+        try:
+            chunk = output.read(EXPORT_STREAM_CHUNK_SIZE)
+            while chunk:
+                yield chunk
+                chunk = output.read(EXPORT_STREAM_CHUNK_SIZE)
+        finally:
+            output.close()
+
+    return Response(generate(), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={filename}',
+        'Content-Length': str(size)
+    })
+
+def _xlsx_number_format(column):
+    """Excel number format for a result column (None leaves the cell as General)"""
+    if column.type_code in PG_NUMBER_TYPES:
+        if column.scale is None:
+            return '#,##0.00##'
+        return '#,##0.' + '0' * column.scale if column.scale else '#,##0'
+    return PG_DATE_FORMATS.get(column.type_code)
+
+def _stream_xlsx_export(query, filename, sheet_name, params=None, cache_path=None):
+    """
+    Export a SELECT as an .xlsx download with constant memory.
+
+    Rows come from a server-side cursor EXPORT_FETCH_SIZE at a time and go straight into a
+    write-only openpyxl workbook, which keeps no cell objects once a row is written. Number
+    and date formats follow each column's PostgreSQL type. The finished file is spooled to
+    disk past EXPORT_SPOOL_MAX_BYTES and streamed out in chunks, or written to cache_path.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    output = _open_export_output(cache_path)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        columns, _, batches = _export_batches(conn, query, params)
+
+        workbook = Workbook(write_only=True)
+        sheet = workbook.create_sheet(sheet_name)
+        header = []
+        for position, column in enumerate(columns, start=1):
+            sheet.column_dimensions[get_column_letter(position)].width = max(len(column.name) + 2, 10)
+            cell = WriteOnlyCell(sheet, value=column.name)
+            cell.font = Font(bold=True)
+            header.append(cell)
+        sheet.append(header)
+
+        formatted = [
+            (position, number_format)
+            for position, column in enumerate(columns)
+            for number_format in [_xlsx_number_format(column)]
+            if number_format
+        ]
+        timestamptz = [position for position, column in enumerate(columns) if column.type_code == PG_TIMESTAMPTZ]
+        for rows in batches:
+            for row in rows:
+                if formatted:
+                    row = list(row)
+                    for position in timestamptz:
+                        if row[position] is not None:
+                            row[position] = row[position].replace(tzinfo=None)  # Excel has no time zones
+                    for position, number_format in formatted:
+                        if row[position] is not None:
+                            cell = WriteOnlyCell(sheet, value=row[position])
+                            cell.number_format = number_format
+                            row[position] = cell
+                sheet.append(row)
+
+        workbook.save(output)
+    except Exception:
+        _discard_export_output(output)
+        raise
+    finally:
+        conn.close()
+
+    return _send_export_output(output, cache_path, filename, EXPORT_MIMETYPES['excel'])
+
+# Parquet/Arrow exports (optional pyarrow dependency)
+PARQUET_ROW_GROUP_SIZE = 100000
+# Arrow types by PostgreSQL type OID; numeric and timestamps are handled separately
+PG_ARROW_TYPES = {16: 'bool_', 20: 'int64', 21: 'int16', 23: 'int32', 700: 'float32', 701: 'float64', 1082: 'date32'}
+PG_TEXT_TYPES = {25, 1042, 1043}  # text, char, varchar
+PG_JSON_TYPES = {114, 3802}  # json, jsonb (psycopg2 hands these over already parsed)
+# Text columns are dictionary-encoded when the first batch has at most this share of distinct values
+ARROW_DICTIONARY_MAX_DISTINCT = 0.5
+# Scale kept for numeric columns declared without one
+ARROW_DEFAULT_DECIMAL_SCALE = 10
+
+class _ArrowDictionaryEncoder:
+    """
+    Dictionary-encode a text column batch by batch against one growing dictionary, so each
+    batch's dictionary extends the previous one and Arrow IPC can write it as a delta
+    """
+
+    def __init__(self, pa):
+        self.pa = pa
+        self.codes = {}
+        self.values = []
+
+    def __call__(self, values):
+        codes = []
+        for value in values:
+            if value is not None:
+                code = self.codes.get(value)
+                if code is None:
+                    code = self.codes[value] = len(self.values)
+                    self.values.append(value)
+                value = code
+            codes.append(value)
+        return self.pa.DictionaryArray.from_arrays(
+            self.pa.array(codes, self.pa.int32()), self.pa.array(self.values, self.pa.string())
+        )
+
+def _arrow_column_encoder(pa, column, sample):
+    """
+    (arrow type, encoder) for a result column, where encoder turns a list of cell values into
+    an Arrow array. sample holds the column's first-batch values.
+    """
+    type_code = column.type_code
+    if type_code in PG_ARROW_TYPES:
+        arrow_type = getattr(pa, PG_ARROW_TYPES[type_code])()
+    elif type_code in PG_DATE_FORMATS:
+        arrow_type = pa.timestamp('us', tz='UTC' if type_code == PG_TIMESTAMPTZ else None)
+    elif type_code == 1700:
+        if column.precision and column.precision <= 38 and column.scale is not None:
+            arrow_type = pa.decimal128(column.precision, column.scale)
+        else:
+            # Unconstrained numeric: infer per batch, then settle on one decimal type
+            arrow_type = pa.decimal128(38, ARROW_DEFAULT_DECIMAL_SCALE)
+            return arrow_type, lambda values: pa.array(values).cast(arrow_type, safe=False)
+    elif type_code in PG_TEXT_TYPES:
+        present = [value for value in sample if value is not None]
+        if present and len(set(present)) <= len(present) * ARROW_DICTIONARY_MAX_DISTINCT:
+            return pa.dictionary(pa.int32(), pa.string()), _ArrowDictionaryEncoder(pa)
+        arrow_type = pa.string()
+    else:
+        # json, uuid, arrays and other types are exported as their text form
+        import json
+
+        to_text = json.dumps if type_code in PG_JSON_TYPES else str
+        return pa.string(), lambda values: pa.array([None if value is None else to_text(value) for value in values], pa.string())
+    return arrow_type, lambda values: pa.array(values, arrow_type)
+
+def _stream_arrow_export(query, filename, format, params=None, cache_path=None):
+    """
+    Export a SELECT as a Parquet or Arrow IPC file. Columns keep their PostgreSQL types
+    (decimals with their precision and scale, dates, timestamps) and repetitive text columns
+    are dictionary-encoded. Record batches are built column by column from each server-side
+    cursor fetch; Parquet buffers them into row groups of PARQUET_ROW_GROUP_SIZE rows.
+    Written to cache_path when given. Returns 501 when pyarrow is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.ipc
+        import pyarrow.parquet as pq
+    except ImportError:
+        return jsonify({'error': f'{format} exports need the pyarrow package (pip install pyarrow)'}), 501
+
+    output = _open_export_output(cache_path)
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        columns, first, batches = _export_batches(conn, query, params)
+        fields, encoders = [], []
+        for position, column in enumerate(columns):
+            arrow_type, encoder = _arrow_column_encoder(pa, column, [row[position] for row in first])
+            fields.append(pa.field(column.name, arrow_type))
+            encoders.append(encoder)
+        schema = pa.schema(fields)
+
+        if format == 'parquet':
+            writer = pq.ParquetWriter(output, schema, compression='zstd')
+            pending, pending_rows = [], 0
+        else:
+            writer = pa.ipc.new_file(output, schema, options=pa.ipc.IpcWriteOptions(
+                compression='zstd', emit_dictionary_deltas=True
+            ))
+
+        for rows in batches:
+            batch = pa.record_batch(
+                [encoder(list(values)) for encoder, values in zip(encoders, zip(*rows))], schema=schema
+            )
+            if format == 'parquet':
+                pending.append(batch)
+                pending_rows += len(rows)
+                if pending_rows >= PARQUET_ROW_GROUP_SIZE:
+                    writer.write_table(pa.Table.from_batches(pending, schema=schema))
+                    pending, pending_rows = [], 0
+            else:
+                writer.write_batch(batch)
+        if format == 'parquet' and pending:
+            writer.write_table(pa.Table.from_batches(pending, schema=schema))
+        writer.close()
+    except Exception:
+        _discard_export_output(output)
+        raise
+    finally:
+        conn.close()
+
+    return _send_export_output(output, cache_path, filename, EXPORT_MIMETYPES[format])
+
+# Export format -> file extension and content type
+EXPORT_EXTENSIONS = {'csv': 'csv', 'excel': 'xlsx', 'parquet': 'parquet', 'arrow': 'arrow'}
+EXPORT_MIMETYPES = {
+    'csv': 'text/csv',
+    'excel': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.file'
+}
+# Generated exports are cached on disk under the data versions of the tables they read
+# (takeoff.data_versions, migration 034); an empty EXPORT_CACHE_DIR turns the cache off
+EXPORT_CACHE_DIR = os.getenv('EXPORT_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'takeoff-export-cache'))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv('EXPORT_CACHE_MAX_BYTES', str(2 * 1024 * 1024 * 1024)))
+export_cache_lock = threading.Lock()
+
+def _data_versions(tables):
+    """
+    Current takeoff.data_versions of the given tables, or None when any of them is not tracked
+    (or migration 034 is not applied), in which case results must not be cached
+    """
+    from psycopg2 import errors
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(
+                "SELECT table_name, version FROM takeoff.data_versions WHERE table_name = ANY(%s)",
+                (list(tables),)
+            )
+            versions = dict(cursor.fetchall())
+    except errors.UndefinedTable:
+        return None
+    finally:
+        conn.close()
+    return versions if len(versions) == len(set(tables)) else None
+
+def _export_cache_path(name, format, query, params, versions):
+    """Content address of an export: a hash of everything that determines the file's bytes"""
+    import hashlib
+    import json
+
+    key = hashlib.sha256(json.dumps(
+        [name, format, ' '.join(query.split()), params, sorted(versions.items())], default=str
+    ).encode('utf-8')).hexdigest()
+    return os.path.join(EXPORT_CACHE_DIR, f'{key}.{EXPORT_EXTENSIONS[format]}')
+
+def _open_export_output(cache_path):
+    """Spooled temp file for an uncached export, or a partial file beside its cache entry"""
+    if cache_path is None:
+        return tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_BYTES)
+    os.makedirs(EXPORT_CACHE_DIR, exist_ok=True)
+    return open(f'{cache_path}.{uuid.uuid4().hex}.partial', 'w+b')
+
+def _discard_export_output(output):
+    """Close a failed export's output, removing its partial cache file"""
+    output.close()
+    if isinstance(getattr(output, 'name', None), str) and output.name.endswith('.partial'):
+        try:
+            os.remove(output.name)
+        except OSError:
+            pass
+
+def _store_export_output(output, cache_path):
+    """
+    Publish a finished partial file as its cache entry, then trim the cache to size. Returns
+    the entry opened for reading: the handle stays valid when eviction removes the entry at
+    once (an export larger than EXPORT_CACHE_MAX_BYTES) or soon after.
+    """
+    output.close()
+    entry = open(output.name, 'rb')
+    os.replace(output.name, cache_path)
+    _evict_export_cache()
+    return entry
+
+def _evict_export_cache():
+    """
+    Delete least recently used cache entries until the cache fits EXPORT_CACHE_MAX_BYTES,
+    along with partial files abandoned for over an hour (e.g. by a restart mid-export)
+    """
+    with export_cache_lock:
+        entries = []
+        with os.scandir(EXPORT_CACHE_DIR) as scan:
+            for entry in scan:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+                if not entry.name.endswith('.partial'):
+                    entries.append((stat.st_atime, stat.st_size, entry.path))
+                elif stat.st_mtime < time.time() - 3600:
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= EXPORT_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)  # Downloads already reading the file keep their handle
+            except OSError:
+                continue
+            total -= size
+
+def _send_cached_export(cache_path, filename, mimetype, entry=None):
+    """
+    Serve a cache entry with send_file: the content hash is the ETag, Range requests and
+    If-None-Match are honoured. The entry is sent from an open handle (entry, or opened
+    here), so eviction can remove it mid-download; returns None when it is already gone.
+    Access time is set by hand to drive LRU eviction (mtime, and so Last-Modified, stays put).
+    """
+    from flask import send_file
+
+    if entry is None:
+        try:
+            entry = open(cache_path, 'rb')
+        except FileNotFoundError:
+            return None
+    stat = os.fstat(entry.fileno())
+    try:
+        os.utime(cache_path, (time.time(), stat.st_mtime))
+    except OSError:
+        pass  # Evicted since it was opened
+    response = send_file(
+        entry, mimetype=mimetype, as_attachment=True, download_name=filename,
+        etag=os.path.basename(cache_path).split('.')[0], last_modified=stat.st_mtime, max_age=0
+    )
+    # send_file only knows the length (needed for Range requests) of files given by path
+    response.content_length = stat.st_size
+    try:
+        return response.make_conditional(request, accept_ranges=True, complete_length=stat.st_size)
+    except Exception:
+        entry.close()
+        raise
+
+def _send_export_output(output, cache_path, filename, mimetype):
+    """Send a finished export file: from its cache entry when cached, else from the spool"""
+    if cache_path is None:
+        return _send_spooled_file(output, filename, mimetype)
+    return _send_cached_export(cache_path, filename, mimetype, _store_export_output(output, cache_path))
+
+def _export_query(query, name, sheet_name, format, params=None, tables=None):
+    """
+    Stream a SELECT as a csv, excel, parquet or arrow download named after name.
+
+    tables lists the tables the query reads; when given, the file is cached on disk keyed by
+    the query, format and their data versions, and served from there until one of them
+    changes.
+    """
+    format = format.lower()
+    if format not in EXPORT_EXTENSIONS:
+        return jsonify({'error': 'Invalid format. Use csv, excel, parquet or arrow'}), 400
+    filename = f'{name}.{EXPORT_EXTENSIONS[format]}'
+
+    cache_path = None
+    if tables and EXPORT_CACHE_DIR:
+        versions = _data_versions(tables)
+        if versions is not None:
+            cache_path = _export_cache_path(name, format, query, params, versions)
+            cached = _send_cached_export(cache_path, filename, EXPORT_MIMETYPES[format])
+            if cached is not None:
+                return cached
+
+    if format == 'csv':
+        return _stream_copy_csv(query, filename, params, cache_path=cache_path)
+    elif format == 'excel':
+        return _stream_xlsx_export(query, filename, sheet_name, params, cache_path=cache_path)
+    else:
+        return _stream_arrow_export(query, filename, format, params, cache_path=cache_path)
+
+def _chunked(iterable, size):
+    """Yield lists of up to size items from any iterable without materializing it"""
+    import itertools
+
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+class ImportCancelled(Exception):
+    """Raised inside an import core when its background job has been cancelled"""
+
+def _report_import_progress(job, **progress):
+    """Record progress counters on a background import job (no-op for inline imports)"""
+    if job is not None:
+        job.report(**progress)
+
+def _check_import_cancelled(job):
+    """Stop an import at a safe point, before its writes are committed, if the job was cancelled"""
+    if job is not None and job.cancel_requested.is_set():
+        raise ImportCancelled()
+
+def _limit_errors(errors, limit=10):
+    """Trim an import error list for the response, noting how many were left out"""
+    if len(errors) <= limit:
+        return errors
+    return errors[:limit] + [f'... and {len(errors) - limit} more errors']
+
+# Changes and missing keys listed in a sync import report
+IMPORT_SYNC_SAMPLE_SIZE = 100
+
+def _import_sync_options():
+    """
+    Read the change-detecting import options from the query string or form:
+    mode=sync compares rows with the database and writes only the differences,
+    dryRun=true (sync only) reports the differences without writing anything.
+    Returns {} for a plain import, or the keyword arguments for the import core.
+    """
+    sync = request.values.get('mode', '').lower() == 'sync'
+    dry_run = request.values.get('dryRun', 'false').lower() in ('true', '1', 'yes')
+    if dry_run and not sync:
+        raise ValueError('dryRun requires mode=sync')
+    return {'sync': True, 'dry_run': dry_run} if sync else {}
+
+def _classify_import_sync(cursor, incoming, current, key, columns):
+    """
+    Classify staged import rows against the current rows in one pass per outcome.
+
+    incoming is a temp table holding row_num, the key and the compared columns; current is a
+    table or subquery exposing the same names. columns is [(column, sql_type)]; both sides
+    are cast to the import types before hashing so equal values always hash alike. Each
+    incoming row gets an action of 'insert' (no current row with its key), 'update' or
+    'unchanged' (the md5 of its compared columns matches), plus the names of the changed
+    columns. Current rows whose key is absent from the import are counted as missing.
+    """
+    def row_hash(alias):
+        return f"md5(ROW({', '.join(f'{alias}.{column}::{sql_type}' for column, sql_type in columns)})::text)"
+
+    changed_columns = ', '.join(
+        f"CASE WHEN i.{column}::{sql_type} IS DISTINCT FROM c.{column}::{sql_type} THEN '{column}' END"
+        for column, sql_type in columns
+    )
+    cursor.execute(f"ALTER TABLE {incoming} ADD COLUMN action TEXT, ADD COLUMN changed_columns TEXT[]")
+    cursor.execute(f"""
+        UPDATE {incoming} i
+        SET action = CASE WHEN {row_hash('i')} = {row_hash('c')} THEN 'unchanged' ELSE 'update' END,
+            changed_columns = ARRAY_REMOVE(ARRAY[{changed_columns}], NULL)
+        FROM {current} c
+        WHERE c.{key} = i.{key}
+    """)
+    cursor.execute(f"UPDATE {incoming} SET action = 'insert' WHERE action IS NULL")
+
+    cursor.execute(f"SELECT action, COUNT(*) FROM {incoming} GROUP BY action")
+    counts = dict(cursor.fetchall())
+    cursor.execute(f"""
+        SELECT COUNT(*) OVER (), c.{key}
+        FROM {current} c
+        WHERE c.{key} IS NOT NULL
+        AND NOT EXISTS (SELECT 1 FROM {incoming} i WHERE i.{key} = c.{key})
+        ORDER BY c.{key}
+        LIMIT %s
+    """, (IMPORT_SYNC_SAMPLE_SIZE,))
+    missing = cursor.fetchall()
+    cursor.execute(f"""
+        SELECT row_num, {key}, action, changed_columns
+        FROM {incoming}
+        WHERE action <> 'unchanged'
+        ORDER BY row_num
+        LIMIT %s
+    """, (IMPORT_SYNC_SAMPLE_SIZE,))
+    changes = [
+        {'row': row_num, key: key_value, 'action': action, 'changed_columns': changed or []}
+        for row_num, key_value, action, changed in cursor.fetchall()
+    ]
+
+    return {
+        'inserted': counts.get('insert', 0),
+        'updated': counts.get('update', 0),
+        'unchanged': counts.get('unchanged', 0),
+        'missing': missing[0][0] if missing else 0,
+        'missing_keys': [key_value for _, key_value in missing],
+        'changes': changes
+    }
+
+# Quantity formulas (items.qty_formula, formulas.formula_text) are arithmetic over plan option
+# measurements, e.g. "heated_sf_outside_studs * 1.1 / 32". They are parsed once into a
+# restricted AST and compiled to a NumPy evaluator, cached per formula text.
+QTY_FORMULA_FUNCTIONS = {
+    'min': lambda np, *args: functools.reduce(np.minimum, args),
+    'max': lambda np, *args: functools.reduce(np.maximum, args),
+    'round': lambda np, value, digits=0: np.round(value, int(digits)),
+    'ceil': lambda np, value: np.ceil(value),
+    'floor': lambda np, value: np.floor(value),
+    'abs': lambda np, value: np.abs(value)
+}
+QTY_FORMULA_OPERATORS = {
+    'Add': lambda a, b: a + b,
+    'Sub': lambda a, b: a - b,
+    'Mult': lambda a, b: a * b,
+    'Div': lambda a, b: a / b,
+    'Mod': lambda a, b: a % b,
+    'Pow': lambda a, b: a ** b
+}
+QTY_FORMULA_MAX_LENGTH = 500
+QTY_FORMULA_MAX_VALUE = 1e10  # takeoffs.calculated_quantity is NUMERIC(14,4)
+EXTENDED_PRICE_MAX_VALUE = 1e13  # takeoffs.extended_price is DECIMAL(15,2)
+
+@functools.lru_cache(maxsize=1024)
+def _compile_qty_formula(formula):
+    """
+    Compile a quantity formula into (evaluate, measure_names). evaluate(np, measures) takes a
+    dict of measure name -> float array and returns an array of quantities. Only numbers,
+    measure names, + - * / % **, parentheses and QTY_FORMULA_FUNCTIONS are accepted;
+    anything else raises ValueError.
+    """
+    import ast
+
+    if len(formula) > QTY_FORMULA_MAX_LENGTH:
+        raise ValueError(f'Formula longer than {QTY_FORMULA_MAX_LENGTH} characters')
+    try:
+        tree = ast.parse(formula.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ValueError(f'Invalid formula syntax: {e.msg}')
+    names = set()
+
+    def build(node):
+        if isinstance(node, ast.Constant) and type(node.value) in (int, float):
+            value = float(node.value)
+            # NumPy scalar, so constant-only parts divide by zero or overflow to inf too
+            return lambda np, measures: np.float64(value)
+        if isinstance(node, ast.Name):
+            name = node.id
+            names.add(name)
+            return lambda np, measures: measures[name]
+        if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+            operand = build(node.operand)
+            if isinstance(node.op, ast.USub):
+                return lambda np, measures: -operand(np, measures)
+            return operand
+        if isinstance(node, ast.BinOp) and type(node.op).__name__ in QTY_FORMULA_OPERATORS:
+            operator = QTY_FORMULA_OPERATORS[type(node.op).__name__]
+            left, right = build(node.left), build(node.right)
+            return lambda np, measures: operator(left(np, measures), right(np, measures))
+        if (
+            isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+            and node.func.id in QTY_FORMULA_FUNCTIONS and node.args and not node.keywords
+        ):
+            if node.func.id == 'round' and len(node.args) > 1 and not (
+                isinstance(node.args[1], ast.Constant) and type(node.args[1].value) is int
+            ):
+                raise ValueError('round() digits must be a whole number')
+            function = QTY_FORMULA_FUNCTIONS[node.func.id]
+            args = [build(arg) for arg in node.args]
+            return lambda np, measures: function(np, *(arg(np, measures) for arg in args))
+        raise ValueError(f'Unsupported formula element: {ast.unparse(node)}')
+
+    evaluate = build(tree.body)
+    return evaluate, frozenset(names)
+
+def _evaluate_qty_formulas(formulas, option_rows, measure_names, measure_matrix):
+    """
+    Evaluate every row's formula in one vectorized pass per distinct formula.
+
+    formulas holds each row's formula text (None for none), option_rows each row's index into
+    measure_matrix (plan options x measure_names, NaN where an option lacks a measurement).
+    Returns (quantities, errors, row_errors): quantities is NaN wherever a row has no formula
+    or no valid result, errors maps each invalid formula to its message and row_errors maps
+    rows whose formula gave a missing, negative or out of range quantity to theirs.
+    """
+    import numpy as np
+
+    quantities = np.full(len(formulas), np.nan)
+    columns = {name: position for position, name in enumerate(measure_names)}
+    errors = {}
+    row_errors = {}
+    formulas = np.asarray(formulas, dtype=object)
+    for formula in {formula for formula in formulas if formula}:
+        try:
+            evaluate, names = _compile_qty_formula(formula)
+        except ValueError as e:
+            errors[formula] = str(e)
+            continue
+        unknown = sorted(name for name in names if name not in columns)
+        if unknown:
+            errors[formula] = f'Unknown measurement: {", ".join(unknown)}'
+            continue
+        rows = np.flatnonzero(formulas == formula)
+        options = option_rows[rows]
+        measures = {name: measure_matrix[options, columns[name]] for name in names}
+        try:
+            with np.errstate(all='ignore'):
+                result = np.broadcast_to(np.asarray(evaluate(np, measures), dtype=float), rows.shape)
+        except (TypeError, ValueError) as e:
+            errors[formula] = f'Cannot evaluate formula: {e}'
+            continue
+        valid = np.isfinite(result) & (result >= 0) & (result < QTY_FORMULA_MAX_VALUE)
+        quantities[rows[valid]] = result[valid]
+        for row, value in zip(rows[~valid], result[~valid]):
+            if not np.isfinite(value):
+                row_errors[int(row)] = 'Formula has no result (missing measurement or division by zero)'
+            elif value < 0:
+                row_errors[int(row)] = f'Formula result {value:g} is negative'
+            else:
+                row_errors[int(row)] = f'Formula result {value:g} is too large'
+    return quantities, errors, row_errors
+
 # ============================================================================
 # == 4.2 COST CODES ENDPOINTS (CONTINUED) ==================================
 # ============================================================================
@@ -827,6 +1829,190 @@ def api_vendor_pricing_update():
     finally:
         db.disconnect()
 
+# Selector name -> (column, array cast) for the repricing endpoint
+REPRICE_SELECTORS = {
+    'vendor_id': ('vp.vendor_id', 'int[]'),
+    'vendor_name': ('v.vendor_name', 'text[]'),
+    'cost_code_id': ('cc.cost_code_id', 'int[]'),
+    'cost_code': ('cc.cost_code', 'text[]'),
+    'cost_group_id': ('cg.cost_group_id', 'int[]'),
+    'cost_group_code': ('cg.cost_group_code', 'text[]'),
+    'item_type': ('p.item_type', 'text[]')
+}
+
+@app.route('/api/vendor-pricing/reprice', methods=['POST'])
+def api_vendor_pricing_reprice():
+    """
+    Reprice every current vendor pricing record matching the selectors in one set-based transaction.
+    Selectors (single value or list, combined with AND): vendor_id, vendor_name, cost_code_id,
+    cost_code, cost_group_id, cost_group_code, item_type.
+    Change: change_type ('percent' or 'absolute') and change_value (e.g. 6 for +6%, -2.5 for -$2.50).
+    Options: effective_date (defaults to today), preview (return affected rows and totals without
+    committing), all_products (required to reprice the whole catalog without selectors).
+    """
+    from decimal import Decimal, InvalidOperation
+
+    data = request.get_json() or {}
+
+    change_type = str(data.get('change_type') or 'percent').lower()
+    if change_type not in ('percent', 'absolute'):
+        return jsonify({'success': False, 'message': "change_type must be 'percent' or 'absolute'"}), 400
+    try:
+        change_value = Decimal(str(data.get('change_value')))
+    except (InvalidOperation, ValueError):
+        return jsonify({'success': False, 'message': 'change_value must be a number'}), 400
+    # Decimal also parses NaN and Infinity, which no price can take
+    if not change_value.is_finite():
+        return jsonify({'success': False, 'message': 'change_value must be a finite number'}), 400
+
+    where_clauses = ["vp.is_current = TRUE", "vp.is_active = TRUE"]
+    params = []
+    for selector, (column, cast) in REPRICE_SELECTORS.items():
+        values = _as_list(data.get(selector))
+        if values:
+            where_clauses.append(f"{column} = ANY(%s::{cast})")
+            params.append([str(v) for v in values])
+
+    if len(where_clauses) == 2 and not data.get('all_products'):
+        return jsonify({
+            'success': False,
+            'message': 'Provide at least one selector, or set all_products to reprice the whole catalog'
+        }), 400
+
+    preview = bool(data.get('preview'))
+    effective_date = data.get('effective_date') or datetime.now().date().isoformat()
+
+    db = DatabaseManager()
+    if not db.connect():
+        return jsonify({'success': False, 'message': 'Database connection failed'}), 500
+
+    try:
+        # Snapshot the selected rows and their new prices once; every later step joins against it
+        db.cursor.execute(f"""
+            CREATE TEMP TABLE reprice_target ON COMMIT DROP AS
+            SELECT
+                vp.pricing_id,
+                vp.vendor_id,
+                v.vendor_name,
+                vp.product_id,
+                p.item_description AS product_description,
+                cc.cost_code,
+                vp.price AS old_price,
+                ROUND(CASE
+                    WHEN %s = 'percent' THEN vp.price * (1 + %s::numeric / 100)
+                    ELSE vp.price + %s::numeric
+                END, 4) AS new_price,
+                vp.unit_of_measure,
+                vp.effective_date,
+                vp.expiration_date,
+                vp.price_type,
+                vp.minimum_quantity,
+                vp.notes
+            FROM takeoff.vendor_pricing vp
+            JOIN takeoff.vendors v ON vp.vendor_id = v.vendor_id
+            JOIN takeoff.products p ON vp.product_id = p.product_id
+            LEFT JOIN takeoff.items i ON p.item_id = i.item_id
+            LEFT JOIN takeoff.cost_codes cc ON i.cost_code_id = cc.cost_code_id
+            LEFT JOIN takeoff.cost_groups cg ON cc.cost_group_id = cg.cost_group_id
+            WHERE {' AND '.join(where_clauses)}
+        """, [change_type, change_value, change_value] + params)
+
+        db.cursor.execute("""
+            SELECT
+                COUNT(*) AS affected_count,
+                COUNT(*) FILTER (WHERE new_price <> old_price) AS changed_count,
+                COUNT(*) FILTER (WHERE new_price < 0) AS negative_count,
+                COALESCE(SUM(old_price), 0) AS old_total,
+                COALESCE(SUM(new_price), 0) AS new_total
+            FROM reprice_target
+        """)
+        totals = db.cursor.fetchone()
+
+        if totals['negative_count']:
+            db.conn.rollback()
+            return jsonify({
+                'success': False,
+                'message': f"Change would make {totals['negative_count']} prices negative"
+            }), 400
+
+        summary = {
+            'affected_count': totals['affected_count'],
+            'changed_count': totals['changed_count'],
+            'old_total': float(totals['old_total']),
+            'new_total': float(totals['new_total']),
+            'difference': float(totals['new_total'] - totals['old_total']),
+            'effective_date': effective_date
+        }
+
+        if preview:
+            db.cursor.execute("""
+                SELECT pricing_id, vendor_id, vendor_name, product_id, product_description,
+                       cost_code, old_price, new_price, unit_of_measure, effective_date
+                FROM reprice_target
+                ORDER BY vendor_name, cost_code, product_description
+            """)
+            rows = [dict(record) for record in db.cursor.fetchall()]
+            db.conn.rollback()
+            return jsonify({'success': True, 'preview': True, **summary, 'rows': rows})
+
+        # Rows already effective on (or after) the target date are repriced in place;
+        # UNIQUE(vendor_id, product_id, effective_date) rules out a second row for that day
+        db.cursor.execute("""
+            UPDATE takeoff.vendor_pricing vp
+            SET price = t.new_price,
+                updated_date = CURRENT_TIMESTAMP
+            FROM reprice_target t
+            WHERE vp.pricing_id = t.pricing_id
+            AND t.new_price <> t.old_price
+            AND t.effective_date >= %s::date
+        """, (effective_date,))
+        updated_in_place = db.cursor.rowcount
+
+        # Retire the superseded rows in bulk, then write the new current rows in one INSERT
+        db.cursor.execute("""
+            UPDATE takeoff.vendor_pricing vp
+            SET is_current = FALSE,
+                updated_date = CURRENT_TIMESTAMP
+            FROM reprice_target t
+            WHERE vp.pricing_id = t.pricing_id
+            AND t.new_price <> t.old_price
+            AND t.effective_date < %s::date
+        """, (effective_date,))
+        retired_count = db.cursor.rowcount
+
+        db.cursor.execute("""
+            INSERT INTO takeoff.vendor_pricing
+            (vendor_id, product_id, price, unit_of_measure, effective_date,
+             expiration_date, is_current, is_active, price_type, minimum_quantity,
+             notes, created_date, updated_date)
+            SELECT vendor_id, product_id, new_price, unit_of_measure, %s::date,
+                   expiration_date, TRUE, TRUE, price_type, minimum_quantity,
+                   notes, CURRENT_TIMESTAMP, CURRENT_TIMESTAMP
+            FROM reprice_target
+            WHERE new_price <> old_price
+            AND effective_date < %s::date
+        """, (effective_date, effective_date))
+        inserted_count = db.cursor.rowcount
+
+        db.conn.commit()
+        logger.info(f"Repriced {summary['changed_count']} vendor pricing records ({change_type} {change_value})")
+        return jsonify({
+            'success': True,
+            'preview': False,
+            **summary,
+            'updated_in_place': updated_in_place,
+            'retired_count': retired_count,
+            'inserted_count': inserted_count,
+            'message': f"Repriced {summary['changed_count']} of {summary['affected_count']} pricing records"
+        })
+
+    except Exception as e:
+        logger.error(f"Error repricing vendor pricing: {e}")
+        db.conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+    finally:
+        db.disconnect()
+
 @app.route('/api/vendor-pricing')
 def api_vendor_pricing():
     """API endpoint to get vendor pricing data with optional product_id filtering"""
@@ -881,32 +2067,9 @@ def api_products():
         conn = psycopg2.connect(**DB_CONFIG)
         cursor = conn.cursor(cursor_factory=RealDictCursor)
         
+        # Pricing columns come from takeoff.product_price_summary (migration 038), kept
+        # current by triggers on vendor_pricing
         cursor.execute("""
-            WITH RankedPricing AS (
-                SELECT 
-                    vp.product_id,
-                    vp.price,
-                    vp.created_date,
-                    v.vendor_name,
-                    ROW_NUMBER() OVER (PARTITION BY vp.product_id ORDER BY vp.price ASC) as price_rank
-                FROM takeoff.vendor_pricing vp
-                JOIN takeoff.vendors v ON vp.vendor_id = v.vendor_id
-                WHERE vp.is_current = TRUE
-            ),
-            PriceChanges AS (
-                SELECT 
-                    vp.product_id,
-                    CASE 
-                        WHEN vp_old.price > 0 THEN ((vp.price - vp_old.price) / vp_old.price * 100)
-                        ELSE 0 
-                    END as price_change
-                FROM takeoff.vendor_pricing vp
-                LEFT JOIN takeoff.vendor_pricing vp_old ON vp.product_id = vp_old.product_id
-                    AND vp_old.created_date < vp.created_date
-                WHERE vp.is_current = TRUE
-                ORDER BY vp_old.created_date DESC
-                LIMIT 1
-            )
             SELECT
                 p.product_id,
                 i.item_id AS item_id,
@@ -934,13 +2097,13 @@ def api_products():
                         CONCAT(pe.plan_full_name, '_', po.option_name)
                     ELSE NULL
                 END as plan_option_display,
-                rp.price as unit_price,
-                rp.vendor_name,
-                pc.price_change,
-                COUNT(vp.pricing_id) as vendor_count,
-                MIN(vp.price) as min_price,
-                MAX(vp.price) as max_price,
-                AVG(vp.price) as avg_price,
+                pps.best_price as unit_price,
+                v.vendor_name,
+                pps.price_change,
+                COALESCE(pps.vendor_count, 0) as vendor_count,
+                pps.min_price,
+                pps.max_price,
+                pps.avg_price,
                 CASE
                     WHEN p.quantity <= p.min_stock_level THEN 'Low Stock'
                     WHEN p.is_active = FALSE THEN 'Inactive'
@@ -951,16 +2114,8 @@ def api_products():
             LEFT JOIN takeoff.cost_codes cc ON i.cost_code_id = cc.cost_code_id
             LEFT JOIN takeoff.plan_options po ON p.plan_option_id = po.plan_option_id
             LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
-            LEFT JOIN RankedPricing rp ON p.product_id = rp.product_id AND rp.price_rank = 1
-            LEFT JOIN PriceChanges pc ON p.product_id = pc.product_id
-            LEFT JOIN takeoff.vendor_pricing vp ON p.product_id = vp.product_id AND vp.is_current = TRUE
-            GROUP BY
-                p.product_id, i.item_id, i.item_name, cc.cost_code, p.item_description,
-                p.model, p.brand, p.style, p.color, p.finish, p.size,
-                p.material, p.item_type, p.image_url, p.is_active,
-                p.min_stock_level, p.quantity, p.unit_of_measure, p.plan_option_id,
-                pe.plan_full_name, po.option_name,
-                rp.price, rp.vendor_name, pc.price_change
+            LEFT JOIN takeoff.product_price_summary pps ON p.product_id = pps.product_id
+            LEFT JOIN takeoff.vendors v ON pps.best_vendor_id = v.vendor_id
             ORDER BY COALESCE(i.item_name, p.item_description)
         """)
         records = cursor.fetchall()
@@ -1130,52 +2285,11 @@ def api_bulk_update_cost_codes():
     finally:
         db.disconnect()
 
+
 @app.route('/api/cost-codes-with-groups/export/<format>')
 def api_export_cost_codes(format):
-    """API endpoint to export cost codes data in CSV or Excel format"""
-    import pandas as pd
-    import io
-    from flask import make_response
-    
-    db = DatabaseManager()
-    if not db.connect():
-        return jsonify({'error': 'Database connection failed'}), 500
-    
-    try:
-        db.cursor.execute("SELECT * FROM takeoff.v_cost_codes_with_groups ORDER BY cost_code")
-        records = db.cursor.fetchall()
-        
-        # Convert to DataFrame
-        df = pd.DataFrame([dict(record) for record in records])
-        
-        if format.lower() == 'csv':
-            # Export as CSV
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = 'attachment; filename=cost_codes_with_groups.csv'
-            return response
-            
-        elif format.lower() == 'excel':
-            # Export as Excel
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Cost Codes', index=False)
-            output.seek(0)
-            
-            response = make_response(output.read())
-            response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            response.headers['Content-Disposition'] = 'attachment; filename=cost_codes_with_groups.xlsx'
-            return response
-        else:
-            return jsonify({'error': 'Invalid format. Use csv or excel'}), 400
-            
-    except Exception as e:
-        logger.error(f"Error exporting cost codes: {e}")
-        return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
+    """API endpoint to export all cost codes data as CSV, Excel, Parquet or Arrow (see /api/export/cost-codes)"""
+    return _grid_export('cost-codes', format)
 
 @app.route('/api/cost-codes-with-groups/template/<format>')
 def api_cost_codes_template(format):
@@ -1236,15 +2350,251 @@ def api_cost_codes_template(format):
         logger.error(f"Error creating cost codes template: {e}")
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/cost-codes-with-groups/import', methods=['POST'])
-def api_import_cost_codes():
-    """API endpoint to import cost codes from Excel/CSV file"""
-    import pandas as pd
-    import io
+# Columns accepted by the cost codes import
+COST_CODES_IMPORT_SCHEMA = {
+    'cost_code': {'type': 'text', 'required': True, 'max_length': 50},
+    'cost_code_description': {'type': 'text', 'required': True, 'max_length': 255},
+    'cost_group_code': {'type': 'text', 'max_length': 50},
+    'cost_group_name': {'type': 'text', 'max_length': 255}
+}
+
+def _import_cost_codes_frame(data, conn, job=None, sync=False, dry_run=False):
+    """
+    Import cost codes batch by batch, creating or renaming cost groups as rows reference them.
+    With sync, only rows that differ from the database are written (see _sync_cost_codes_frame).
+    data is a DataFrame or an iterable of DataFrame batches (see _open_import_batches).
+    """
+    if sync:
+        return _sync_cost_codes_frame(data, conn, job=job, dry_run=dry_run)
+
+    imported_count = 0
+    updated_count = 0
+    total_rows = 0
+    errors = []
+    seen_cost_codes = {}
+    
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        for batch in _as_import_batches(data):
+            clean, validation_errors = _validate_import_frame(
+                batch, COST_CODES_IMPORT_SCHEMA, unique_on=['cost_code'], seen_keys=seen_cost_codes
+            )
+            errors.extend(f"Row {entry['row']}: {entry['error']}" for entry in validation_errors)
+            total_rows += len(batch)
+            _report_import_progress(job, rows_validated=total_rows)
+            _check_import_cancelled(job)
+            
+            # Process each valid row
+            for row_num, row in zip(clean.index + 2, _import_records(clean)):
+                try:
+                    cost_code = row['cost_code']
+                    cost_code_description = row['cost_code_description']
+                    cost_group_code = row['cost_group_code']
+                    cost_group_name = row['cost_group_name']
+                
+                    # Check if cost code exists
+                    cursor.execute("SELECT cost_code_id FROM takeoff.cost_codes WHERE cost_code = %s", (cost_code,))
+                    existing_cost_code = cursor.fetchone()
+                
+                    cost_group_id = None
+                
+                    # Handle cost group if provided
+                    if cost_group_code and cost_group_name:
+                        # Check if cost group exists
+                        cursor.execute("SELECT cost_group_id FROM takeoff.cost_groups WHERE cost_group_code = %s", (cost_group_code,))
+                        existing_group = cursor.fetchone()
+                    
+                        if existing_group:
+                            cost_group_id = existing_group['cost_group_id']
+                            # Update group name if different
+                            cursor.execute("""
+                                UPDATE takeoff.cost_groups
+                                SET cost_group_name = %s
+                                WHERE cost_group_id = %s AND cost_group_name != %s
+                            """, (cost_group_name, cost_group_id, cost_group_name))
+                        else:
+                            # Create new cost group
+                            cursor.execute("""
+                                INSERT INTO takeoff.cost_groups (cost_group_code, cost_group_name)
+                                VALUES (%s, %s) RETURNING cost_group_id
+                            """, (cost_group_code, cost_group_name))
+                            cost_group_id = cursor.fetchone()['cost_group_id']
+                
+                    if existing_cost_code:
+                        # Update existing cost code
+                        cursor.execute("""
+                            UPDATE takeoff.cost_codes
+                            SET cost_code_description = %s, cost_group_id = %s
+                            WHERE cost_code_id = %s
+                        """, (cost_code_description, cost_group_id, existing_cost_code['cost_code_id']))
+                        updated_count += 1
+                    else:
+                        # Insert new cost code
+                        cursor.execute("""
+                            INSERT INTO takeoff.cost_codes (cost_code, cost_code_description, cost_group_id)
+                            VALUES (%s, %s, %s)
+                        """, (cost_code, cost_code_description, cost_group_id))
+                        imported_count += 1
+                
+                except Exception as e:
+                    errors.append(f"Row {row_num}: {str(e)}")
+                    continue
+            _report_import_progress(job, rows_written=imported_count + updated_count)
+        
+        _check_import_cancelled(job)
+        conn.commit()
+    finally:
+        cursor.close()
+    
+    total_processed = imported_count + updated_count
+    message = f"Import completed: {imported_count} new cost codes, {updated_count} updated"
+    
+    if errors:
+        message += f", {len(errors)} errors"
+    
+    return {
+        'success': True,
+        'message': message,
+        'imported_count': imported_count,
+        'updated_count': updated_count,
+        'total_processed': total_processed,
+        'errors': errors
+    }
+
+# A cost code as the import sees it: its description and cost group
+COST_CODES_SYNC_CURRENT_SQL = """(
+    SELECT c.cost_code, c.cost_code_description, g.cost_group_code, g.cost_group_name
+    FROM takeoff.cost_codes c
+    LEFT JOIN takeoff.cost_groups g ON g.cost_group_id = c.cost_group_id
+)"""
+
+def _sync_cost_codes_frame(data, conn, job=None, dry_run=False):
+    """
+    Change-detecting cost codes import: stage the file, compare each row with the current
+    cost code and group by content hash, then create/rename the referenced groups and write
+    only new and changed cost codes with a few set-based statements. dry_run rolls back
+    after classifying, so nothing is written.
+    """
+    total_rows = 0
+    errors = []
+    seen_cost_codes = {}
+    imported_count = 0
+    updated_count = 0
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE TEMP TABLE cost_codes_import_rows (
+                row_num INTEGER,
+                {', '.join(f'{column} TEXT' for column in COST_CODES_IMPORT_SCHEMA)}
+            ) ON COMMIT DROP
+        """)
+        for batch in _as_import_batches(data):
+            _check_import_cancelled(job)
+            clean, validation_errors = _validate_import_frame(
+                batch, COST_CODES_IMPORT_SCHEMA, unique_on=['cost_code'], seen_keys=seen_cost_codes
+            )
+            clean.insert(0, 'row_num', clean.index + 2)
+            _copy_frame(cursor, clean, 'cost_codes_import_rows', list(clean.columns))
+            errors.extend(f"Row {entry['row']}: {entry['error']}" for entry in validation_errors)
+            total_rows += len(batch)
+            _report_import_progress(job, rows_validated=total_rows)
+
+        # As in the row-by-row import, a row only sets a cost group when it has both code and name
+        cursor.execute("""
+            UPDATE cost_codes_import_rows
+            SET cost_group_code = NULL, cost_group_name = NULL
+            WHERE cost_group_code IS NULL OR cost_group_name IS NULL
+        """)
+        summary = _classify_import_sync(
+            cursor, 'cost_codes_import_rows', COST_CODES_SYNC_CURRENT_SQL, 'cost_code',
+            [(column, 'TEXT') for column in COST_CODES_IMPORT_SCHEMA if column != 'cost_code']
+        )
+
+        _check_import_cancelled(job)
+        if not dry_run:
+            # Groups named by new or changed rows; the last row wins when names disagree
+            cursor.execute("""
+                CREATE TEMP TABLE cost_groups_import_rows ON COMMIT DROP AS
+                SELECT DISTINCT ON (cost_group_code) cost_group_code, cost_group_name
+                FROM cost_codes_import_rows
+                WHERE action IN ('insert', 'update') AND cost_group_code IS NOT NULL
+                ORDER BY cost_group_code, row_num DESC
+            """)
+            cursor.execute("""
+                UPDATE takeoff.cost_groups g
+                SET cost_group_name = n.cost_group_name
+                FROM cost_groups_import_rows n
+                WHERE g.cost_group_code = n.cost_group_code
+                AND g.cost_group_name IS DISTINCT FROM n.cost_group_name
+            """)
+            cursor.execute("""
+                INSERT INTO takeoff.cost_groups (cost_group_code, cost_group_name)
+                SELECT n.cost_group_code, n.cost_group_name
+                FROM cost_groups_import_rows n
+                WHERE NOT EXISTS (
+                    SELECT 1 FROM takeoff.cost_groups g WHERE g.cost_group_code = n.cost_group_code
+                )
+            """)
+            cursor.execute("""
+                UPDATE takeoff.cost_codes c
+                SET cost_code_description = r.cost_code_description,
+                    cost_group_id = g.cost_group_id
+                FROM cost_codes_import_rows r
+                LEFT JOIN takeoff.cost_groups g ON g.cost_group_code = r.cost_group_code
+                WHERE c.cost_code = r.cost_code
+                AND r.action = 'update'
+            """)
+            updated_count = cursor.rowcount
+            cursor.execute("""
+                INSERT INTO takeoff.cost_codes (cost_code, cost_code_description, cost_group_id)
+                SELECT r.cost_code, r.cost_code_description, g.cost_group_id
+                FROM cost_codes_import_rows r
+                LEFT JOIN takeoff.cost_groups g ON g.cost_group_code = r.cost_group_code
+                WHERE r.action = 'insert'
+                ORDER BY r.row_num
+            """)
+            imported_count = cursor.rowcount
+            _check_import_cancelled(job)
+            conn.commit()
+        else:
+            conn.rollback()
+    finally:
+        cursor.close()
+    _report_import_progress(job, rows_written=imported_count + updated_count)
+
+    message = (
+        f"{summary['inserted']} new, {summary['updated']} changed and {summary['unchanged']} unchanged cost codes; "
+        f"{summary['missing']} existing cost codes are not in the file"
+    )
+    if errors:
+        message += f", {len(errors)} errors"
+
+    return {
+        'success': True,
+        'mode': 'sync',
+        'dry_run': dry_run,
+        'message': f'Dry run: {message}' if dry_run else f'Sync completed: {message}',
+        'imported_count': imported_count,
+        'updated_count': updated_count,
+        'total_processed': imported_count + updated_count,
+        **summary,
+        'errors': errors
+    }
+
+@app.route('/api/cost-codes-with-groups/import', methods=['POST'])
+def api_import_cost_codes():
+    """API endpoint to import cost codes from Excel/CSV file (?mode=sync[&dryRun=true] to write only changes)"""
     
     db = DatabaseManager()
+    batches = None
     
     try:
+        try:
+            options = _import_sync_options()
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+        
         # Check if file was uploaded
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No file uploaded'}), 400
@@ -1258,110 +2608,33 @@ def api_import_cost_codes():
             return jsonify({'success': False, 'message': 'Invalid file format. Please upload Excel (.xlsx, .xls) or CSV file'}), 400
         
         # Read file
-        try:
-            if file.filename.lower().endswith('.csv'):
-                df = pd.read_csv(io.StringIO(file.read().decode('utf-8')))
-            else:
-                df = pd.read_excel(io.BytesIO(file.read()))
-        except Exception as e:
-            return jsonify({'success': False, 'message': f'Error reading file: {str(e)}'}), 400
+        columns, batches = _open_import_batches(file.stream, file.filename)
         
         # Validate required columns
         required_columns = ['cost_code', 'cost_code_description']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in columns]
         if missing_columns:
             return jsonify({'success': False, 'message': f'Missing required columns: {", ".join(missing_columns)}'}), 400
         
         if not db.connect():
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
         
-        imported_count = 0
-        updated_count = 0
-        errors = []
-        
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                cost_code = str(row.get('cost_code', '')).strip()
-                cost_code_description = str(row.get('cost_code_description', '')).strip()
-                cost_group_code = str(row.get('cost_group_code', '')).strip() if pd.notna(row.get('cost_group_code')) else ''
-                cost_group_name = str(row.get('cost_group_name', '')).strip() if pd.notna(row.get('cost_group_name')) else ''
-                
-                if not cost_code or not cost_code_description:
-                    errors.append(f"Row {index + 2}: Missing cost_code or cost_code_description")
-                    continue
-                
-                # Check if cost code exists
-                db.cursor.execute("SELECT cost_code_id FROM takeoff.cost_codes WHERE cost_code = %s", (cost_code,))
-                existing_cost_code = db.cursor.fetchone()
-                
-                cost_group_id = None
-                
-                # Handle cost group if provided
-                if cost_group_code and cost_group_name:
-                    # Check if cost group exists
-                    db.cursor.execute("SELECT cost_group_id FROM takeoff.cost_groups WHERE cost_group_code = %s", (cost_group_code,))
-                    existing_group = db.cursor.fetchone()
-                    
-                    if existing_group:
-                        cost_group_id = existing_group['cost_group_id']
-                        # Update group name if different
-                        db.cursor.execute("""
-                            UPDATE takeoff.cost_groups
-                            SET cost_group_name = %s
-                            WHERE cost_group_id = %s AND cost_group_name != %s
-                        """, (cost_group_name, cost_group_id, cost_group_name))
-                    else:
-                        # Create new cost group
-                        db.cursor.execute("""
-                            INSERT INTO takeoff.cost_groups (cost_group_code, cost_group_name)
-                            VALUES (%s, %s) RETURNING cost_group_id
-                        """, (cost_group_code, cost_group_name))
-                        cost_group_id = db.cursor.fetchone()['cost_group_id']
-                
-                if existing_cost_code:
-                    # Update existing cost code
-                    db.cursor.execute("""
-                        UPDATE takeoff.cost_codes
-                        SET cost_code_description = %s, cost_group_id = %s
-                        WHERE cost_code_id = %s
-                    """, (cost_code_description, cost_group_id, existing_cost_code['cost_code_id']))
-                    updated_count += 1
-                else:
-                    # Insert new cost code
-                    db.cursor.execute("""
-                        INSERT INTO takeoff.cost_codes (cost_code, cost_code_description, cost_group_id)
-                        VALUES (%s, %s, %s)
-                    """, (cost_code, cost_code_description, cost_group_id))
-                    imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
-                continue
-        
-        db.conn.commit()
-        
-        total_processed = imported_count + updated_count
-        message = f"Import completed: {imported_count} new cost codes, {updated_count} updated"
-        
-        if errors:
-            message += f", {len(errors)} errors"
-        
-        return jsonify({
-            'success': True,
-            'message': message,
-            'imported_count': imported_count,
-            'updated_count': updated_count,
-            'total_processed': total_processed,
-            'errors': errors[:10]  # Limit errors shown
-        })
+        result = _import_cost_codes_frame(batches, db.conn, **options)
+        result['errors'] = result['errors'][:10]  # Limit errors shown
+        return jsonify(result)
         
+    except ImportFileError as e:
+        if db.conn:
+            db.conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Error importing cost codes: {e}")
         if db.conn:
             db.conn.rollback()
         return jsonify({'success': False, 'message': f'Import failed: {str(e)}'}), 500
     finally:
+        if batches:
+            batches.close()
         db.disconnect()
 
 # ============================================================================
@@ -2022,9 +3295,188 @@ def api_bulk_update_items():
     finally:
         db.disconnect()
 
+# Rows per upsert statement for the items import
+ITEMS_IMPORT_CHUNK_SIZE = 500
+
+def _map_item_import_row(row):
+    """Map the column names accepted by the items import onto items fields"""
+    cost_code = row.get('cost_code') or row.get('Cost Code') or ''
+    formula_name = row.get('formula_name') or row.get('Formula') or ''
+    return {
+        'item_name': str(row.get('item_name') or row.get('Item Name') or row.get('name') or '').strip(),
+        'cost_code': str(cost_code).strip(),
+        'formula_name': str(formula_name).strip(),
+        'qty_type': row.get('qty_type') or row.get('Quantity Type') or 'Count',
+        'default_unit': row.get('default_unit') or row.get('Unit') or row.get('Default Unit') or 'EA'
+    }
+
+def _new_items_import_totals():
+    """Running counters for an items import"""
+    return {'rows_read': 0, 'imported_count': 0, 'updated_count': 0, 'skipped_count': 0, 'error_count': 0, 'errors': []}
+
+def _record_import_error(totals, message, limit=10):
+    """Count an import error, keeping only the first few messages so memory stays bounded"""
+    totals['error_count'] += 1
+    if len(totals['errors']) < limit:
+        totals['errors'].append(message)
+
+def _upsert_items_chunk(cursor, rows, update_existing):
+    """
+    Write one chunk of mapped item rows: resolve cost codes and formulas with one query each,
+    then insert the chunk with a single multi-row INSERT ... ON CONFLICT (item_name).
+    Returns (imported_count, updated_count, skipped_count).
+    """
+    from psycopg2.extras import execute_values
+
+    # ON CONFLICT cannot touch the same row twice in one statement, so collapse repeats:
+    # the last occurrence wins when updating, the first when existing items are kept
+    unique_rows = {}
+    for row in rows:
+        if update_existing:
+            unique_rows[row['item_name']] = row
+        else:
+            unique_rows.setdefault(row['item_name'], row)
+    repeated_count = len(rows) - len(unique_rows)
+
+    cost_codes = list({row['cost_code'] for row in unique_rows.values() if row['cost_code']})
+    formula_names = list({row['formula_name'] for row in unique_rows.values() if row['formula_name']})
+    cursor.execute("SELECT cost_code, cost_code_id FROM takeoff.cost_codes WHERE cost_code = ANY(%s)", (cost_codes,))
+    cost_code_ids = dict(cursor.fetchall())
+    cursor.execute("SELECT formula_name, formula_id FROM takeoff.formulas WHERE formula_name = ANY(%s)", (formula_names,))
+    formula_ids = dict(cursor.fetchall())
+
+    values = [
+        (row['item_name'], row['qty_type'], row['default_unit'],
+         cost_code_ids.get(row['cost_code']), formula_ids.get(row['formula_name']))
+        for row in unique_rows.values()
+    ]
+    # Unresolved cost codes/formulas leave the existing reference alone, as before
+    on_conflict = """
+        DO UPDATE SET
+            qty_type = EXCLUDED.qty_type,
+            default_unit = EXCLUDED.default_unit,
+            cost_code_id = COALESCE(EXCLUDED.cost_code_id, takeoff.items.cost_code_id),
+            formula_id = COALESCE(EXCLUDED.formula_id, takeoff.items.formula_id)
+    """ if update_existing else "DO NOTHING"
+    results = execute_values(cursor, f"""
+        INSERT INTO takeoff.items (item_name, qty_type, default_unit, cost_code_id, formula_id)
+        VALUES %s
+        ON CONFLICT (item_name) {on_conflict}
+        RETURNING (xmax = 0) AS inserted
+    """, values, page_size=len(values), fetch=True)
+
+    imported_count = sum(1 for (inserted,) in results if inserted)
+    updated_count = len(results) - imported_count
+    if update_existing:
+        return imported_count, updated_count + repeated_count, 0
+    return imported_count, updated_count, len(values) - len(results) + repeated_count
+
+def _import_items_rows(conn, rows, options, totals, commit_chunks=False):
+    """
+    Import raw item rows in chunks of ITEMS_IMPORT_CHUNK_SIZE, yielding the running totals
+    after each chunk. Rows are pulled lazily from any iterable, so memory is bounded by the
+    chunk size. Each chunk runs under a savepoint; with skipErrors a failing chunk is retried
+    row by row, each under its own savepoint, so only the bad rows are dropped.
+    commit_chunks makes each finished chunk durable instead of the caller committing once at
+    the end.
+    """
+    update_existing = options.get('updateExisting', False)
+    skip_errors = options.get('skipErrors', False)
+
+    def mapped_rows():
+        for row in rows:
+            totals['rows_read'] += 1
+            mapped = _map_item_import_row(row)
+            if not mapped['item_name']:
+                _record_import_error(totals, "Skipping row with missing item name")
+                continue
+            yield totals['rows_read'], mapped
+
+    for chunk in _chunked(mapped_rows(), ITEMS_IMPORT_CHUNK_SIZE):
+        cursor = conn.cursor()
+        try:
+            cursor.execute("SAVEPOINT items_import_chunk")
+            try:
+                imported_count, updated_count, skipped_count = _upsert_items_chunk(
+                    cursor, [row for _, row in chunk], update_existing
+                )
+            except Exception:
+                if not skip_errors:
+                    raise
+                cursor.execute("ROLLBACK TO SAVEPOINT items_import_chunk")
+                imported_count = updated_count = skipped_count = 0
+                for row_number, row in chunk:
+                    cursor.execute("SAVEPOINT items_import_row")
+                    try:
+                        row_counts = _upsert_items_chunk(cursor, [row], update_existing)
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT items_import_row")
+                        _record_import_error(totals, f"Error processing row {row_number} ('{row['item_name']}'): {str(e).strip()}")
+                        row_counts = (0, 0, 0)
+                    cursor.execute("RELEASE SAVEPOINT items_import_row")
+                    imported_count += row_counts[0]
+                    updated_count += row_counts[1]
+                    skipped_count += row_counts[2]
+            cursor.execute("RELEASE SAVEPOINT items_import_chunk")
+        finally:
+            cursor.close()
+
+        if commit_chunks:
+            conn.commit()
+        totals['imported_count'] += imported_count
+        totals['updated_count'] += updated_count
+        totals['skipped_count'] += skipped_count
+        yield totals
+
+def _items_import_summary(totals):
+    """Response fields shared by the JSON and NDJSON items import modes"""
+    message = f"Import completed: {totals['imported_count']} new items, {totals['updated_count']} updated"
+    if totals['skipped_count']:
+        message += f", {totals['skipped_count']} existing skipped"
+    if totals['error_count']:
+        message += f", {totals['error_count']} errors"
+    return {
+        'success': True,
+        'message': message,
+        'imported_count': totals['imported_count'],
+        'updated_count': totals['updated_count'],
+        'skipped_count': totals['skipped_count'],
+        'total_processed': totals['imported_count'] + totals['updated_count'],
+        'error_count': totals['error_count'],
+        'errors': totals['errors']
+    }
+
+def _read_ndjson_rows(stream, totals, skip_errors):
+    """Yield one dict per non-blank NDJSON line, reading the request body incrementally"""
+    import json
+
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            if not isinstance(row, dict):
+                raise ValueError("expected a JSON object")
+        except ValueError as e:
+            if not skip_errors:
+                raise ValueError(f"Line {line_number}: {str(e)}")
+            _record_import_error(totals, f"Line {line_number}: {str(e)}")
+            continue
+        yield row
+
 @app.route('/api/items/import', methods=['POST'])
 def api_import_items():
-    """API endpoint to import items from Excel data"""
+    """
+    API endpoint to import items from Excel data.
+
+    Accepts either one JSON document ({"data": [...], "options": {...}}, committed as a whole)
+    or, with Content-Type application/x-ndjson, one JSON object per line. NDJSON imports take
+    updateExisting/skipErrors from the query string, commit every chunk and stream a progress
+    line back per chunk followed by a final "complete" (or "error") line.
+    """
+    if request.mimetype == 'application/x-ndjson':
+        return _stream_items_import()
+
     db = DatabaseManager()
     request_data = request.get_json()
     
@@ -2038,93 +3490,12 @@ def api_import_items():
         return jsonify({'success': False, 'message': 'Database connection failed'}), 500
     
     try:
-        imported_count = 0
-        updated_count = 0
-        errors = []
-        
-        for row in import_data:
-            try:
-                # Map common column names
-                item_name = row.get('item_name') or row.get('Item Name') or row.get('name') or ''
-                cost_code = row.get('cost_code') or row.get('Cost Code') or ''
-                formula_name = row.get('formula_name') or row.get('Formula') or ''
-                qty_type = row.get('qty_type') or row.get('Quantity Type') or 'Count'
-                default_unit = row.get('default_unit') or row.get('Unit') or row.get('Default Unit') or 'EA'
-                
-                if not item_name:
-                    errors.append("Skipping row with missing item name")
-                    continue
-                
-                # Check if item exists (for update mode)
-                if options.get('updateExisting', False):
-                    db.cursor.execute("SELECT item_id FROM takeoff.items WHERE item_name = %s", (item_name,))
-                    existing_item = db.cursor.fetchone()
-                else:
-                    existing_item = None
-                
-                # Prepare data for insert/update
-                item_data = {
-                    'item_name': item_name,
-                    'qty_type': qty_type,
-                    'default_unit': default_unit
-                }
-                
-                # Handle cost code
-                if cost_code:
-                    db.cursor.execute("SELECT cost_code_id FROM takeoff.cost_codes WHERE cost_code = %s", (cost_code,))
-                    cost_code_result = db.cursor.fetchone()
-                    if cost_code_result:
-                        item_data['cost_code_id'] = cost_code_result['cost_code_id']
-                
-                # Handle formula
-                if formula_name:
-                    db.cursor.execute("SELECT formula_id FROM takeoff.formulas WHERE formula_name = %s", (formula_name,))
-                    formula_result = db.cursor.fetchone()
-                    if formula_result:
-                        item_data['formula_id'] = formula_result['formula_id']
-                
-                if existing_item:
-                    # Update existing item
-                    set_clauses = [f"{field} = %s" for field in item_data.keys()]
-                    values = list(item_data.values())
-                    values.append(existing_item['item_id'])
-                    
-                    query = f"UPDATE takeoff.items SET {', '.join(set_clauses)} WHERE item_id = %s"
-                    db.cursor.execute(query, values)
-                    updated_count += 1
-                else:
-                    # Insert new item
-                    columns = list(item_data.keys())
-                    values = list(item_data.values())
-                    placeholders = ['%s'] * len(columns)
-                    
-                    query = f"INSERT INTO takeoff.items ({', '.join(columns)}) VALUES ({', '.join(placeholders)})"
-                    db.cursor.execute(query, values)
-                    imported_count += 1
-                
-            except Exception as e:
-                if options.get('skipErrors', False):
-                    errors.append(f"Error processing row: {str(e)}")
-                    continue
-                else:
-                    raise e
+        totals = _new_items_import_totals()
+        for _ in _import_items_rows(db.conn, import_data, options, totals):
+            pass
         
         db.conn.commit()
-        
-        total_processed = imported_count + updated_count
-        message = f"Import completed: {imported_count} new items, {updated_count} updated"
-        
-        if errors:
-            message += f", {len(errors)} errors"
-        
-        return jsonify({
-            'success': True,
-            'message': message,
-            'imported_count': imported_count,
-            'updated_count': updated_count,
-            'total_processed': total_processed,
-            'errors': errors
-        })
+        return jsonify(_items_import_summary(totals))
         
     except Exception as e:
         logger.error(f"Error in items import: {e}")
@@ -2133,6 +3504,43 @@ def api_import_items():
     finally:
         db.disconnect()
 
+def _stream_items_import():
+    """Run an NDJSON items import, streaming one progress line back per committed chunk"""
+    import json
+    from flask import Response, stream_with_context
+
+    options = {
+        option: request.args.get(option, 'false').lower() in ('true', '1', 'yes')
+        for option in ('updateExisting', 'skipErrors')
+    }
+    db = DatabaseManager()
+    if not db.connect():
+        return jsonify({'success': False, 'message': 'Database connection failed'}), 500
+
+    def generate():
+        totals = _new_items_import_totals()
+        progress_fields = ('rows_read', 'imported_count', 'updated_count', 'skipped_count', 'error_count')
+        try:
+            rows = _read_ndjson_rows(request.stream, totals, options['skipErrors'])
+            for progress in _import_items_rows(db.conn, rows, options, totals, commit_chunks=True):
+                yield json.dumps({'type': 'progress', **{field: progress[field] for field in progress_fields}}) + '\n'
+            db.conn.commit()
+            yield json.dumps({'type': 'complete', 'rows_read': totals['rows_read'], **_items_import_summary(totals)}) + '\n'
+        except Exception as e:
+            logger.error(f"Error in streamed items import: {e}")
+            db.conn.rollback()
+            # Chunks reported in earlier progress lines are already committed
+            yield json.dumps({
+                'type': 'error',
+                'success': False,
+                'message': f'Import failed: {str(e)}',
+                **{field: totals[field] for field in progress_fields}
+            }) + '\n'
+
+    response = Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    response.call_on_close(db.disconnect)
+    return response
+
 # ============================================================================
 # == 4.6 PLAN OPTIONS ENDPOINTS (CONTINUED) ================================
 # ============================================================================
@@ -2249,53 +3657,11 @@ def api_plan_options():
     finally:
         db.disconnect()
 
+
 @app.route('/api/plan-options/export/<format>')
 def api_export_plan_options(format):
-    """API endpoint to export plan options data in CSV or Excel format"""
-    import pandas as pd
-    import io
-    from flask import make_response
-    db = DatabaseManager()
-    if not db.connect():
-        return jsonify({'error': 'Database connection failed'}), 500
-    try:
-        db.cursor.execute("""
-            SELECT
-                po.plan_option_id,
-                pe.plan_full_name,
-                po.option_name,
-                po.option_description,
-                po.total_sf_outside_studs,
-                po.created_date,
-                po.modified_date
-            FROM takeoff.plan_options po
-            JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
-            ORDER BY po.plan_option_id
-        """)
-        records = db.cursor.fetchall()
-        df = pd.DataFrame([dict(record) for record in records])
-        if format.lower() == 'csv':
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = 'attachment; filename=plan_options.csv'
-            return response
-        elif format.lower() == 'excel':
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Plan Options', index=False)
-            output.seek(0)
-            response = make_response(output.read())
-            response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            response.headers['Content-Disposition'] = 'attachment; filename=plan_options.xlsx'
-            return response
-        else:
-            return jsonify({'error': 'Invalid format. Use csv or excel'}), 400
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
-    finally:
-        db.disconnect()
+    """API endpoint to export all plan options data as CSV, Excel, Parquet or Arrow (see /api/export/plan-options)"""
+    return _grid_export('plan-options', format)
 
 @app.route('/api/plan-options/template/<format>')
 def api_plan_options_template(format):
@@ -2348,12 +3714,179 @@ def api_plan_options_template(format):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# Columns accepted by the plan options import
+PLAN_OPTIONS_IMPORT_SCHEMA = {
+    'plan_full_name': {'type': 'text', 'required': True},
+    'option_name': {'type': 'text', 'required': True, 'max_length': 100},
+    'option_description': {'type': 'text', 'default': ''},
+    'total_sf_outside_studs': {'type': 'number', 'default': 0, 'min': 0}
+}
+
+# Editable plan_options columns (excluding PK and computed fields)
+PLAN_OPTIONS_EDITABLE_FIELDS = [
+    'plan_elevation_id', 'option_name', 'option_type', 'option_description',
+    'bedroom_count', 'bathroom_count',
+    'heated_sf_inside_studs', 'heated_sf_outside_studs', 'heated_sf_outside_veneer',
+    'unheated_sf_inside_studs', 'unheated_sf_outside_studs', 'unheated_sf_outside_veneer',
+    'total_sf_inside_studs', 'total_sf_outside_studs', 'total_sf_outside_veneer'
+]
+
+def _resolve_plan_elevations(cursor, plan_full_names):
+    """Map every distinct plan_full_name to its plan_elevation_id with a single query"""
+    cursor.execute("""
+        SELECT plan_full_name, plan_elevation_id
+        FROM takeoff.plan_elevations
+        WHERE plan_full_name = ANY(%s)
+    """, (list(set(plan_full_names)),))
+    return {row['plan_full_name']: row['plan_elevation_id'] for row in cursor.fetchall()}
+
+def _plan_option_field_groups(records):
+    """Group row dicts by the set of fields they carry so each group is one statement"""
+    groups = {}
+    for record in records:
+        groups.setdefault(tuple(field for field in PLAN_OPTIONS_EDITABLE_FIELDS if field in record), []).append(record)
+    return groups
+
+def _upsert_plan_options(cursor, records):
+    """
+    Insert plan options with one multi-row statement per field set, updating rows that
+    already exist for (plan_elevation_id, option_name). Returns (inserted, updated).
+    """
+    import json
+
+    inserted = updated = 0
+    for fields, group in _plan_option_field_groups(records).items():
+        assignments = [f"{field} = EXCLUDED.{field}" for field in fields if field not in ('plan_elevation_id', 'option_name')]
+        on_conflict = f"DO UPDATE SET {', '.join(assignments)}" if assignments else "DO NOTHING"
+        cursor.execute(f"""
+            WITH merged AS (
+                INSERT INTO takeoff.plan_options ({', '.join(fields)})
+                SELECT {', '.join(fields)}
+                FROM json_populate_recordset(NULL::takeoff.plan_options, %s::json)
+                ON CONFLICT (plan_elevation_id, option_name) {on_conflict}
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE inserted) AS inserted,
+                COUNT(*) FILTER (WHERE NOT inserted) AS updated
+            FROM merged
+        """, (json.dumps(group, default=str),))
+        counts = cursor.fetchone()
+        inserted += counts['inserted']
+        updated += counts['updated']
+    return inserted, updated
+
+def _update_plan_options(cursor, records):
+    """Update existing plan options by plan_option_id with one UPDATE ... FROM per field set"""
+    import json
+
+    updated = 0
+    for fields, group in _plan_option_field_groups(records).items():
+        if not fields:
+            continue
+        cursor.execute(f"""
+            UPDATE takeoff.plan_options po
+            SET {', '.join(f'{field} = u.{field}' for field in fields)}
+            FROM json_populate_recordset(NULL::takeoff.plan_options, %s::json) u
+            WHERE po.plan_option_id = u.plan_option_id
+        """, (json.dumps(group, default=str),))
+        updated += cursor.rowcount
+    return updated
+
+def _write_plan_option_rows(cursor, write, rows, errors):
+    """
+    Run write(cursor, records) on (label, record) rows as one batch under a savepoint. If the
+    batch fails, retry it row by row, each under its own savepoint, so a bad row is reported
+    in errors as "<label>: <error>" instead of rolling back the rest. Returns the list of
+    write's results (one for the batch, or one per row that succeeded).
+    """
+    cursor.execute("SAVEPOINT plan_options_batch")
+    try:
+        result = write(cursor, [record for _, record in rows])
+        cursor.execute("RELEASE SAVEPOINT plan_options_batch")
+        return [result]
+    except Exception:
+        cursor.execute("ROLLBACK TO SAVEPOINT plan_options_batch")
+
+    results = []
+    for label, record in rows:
+        cursor.execute("SAVEPOINT plan_options_row")
+        try:
+            results.append(write(cursor, [record]))
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT plan_options_row")
+            errors.append(f"{label}: {str(e).strip()}")
+        cursor.execute("RELEASE SAVEPOINT plan_options_row")
+    cursor.execute("RELEASE SAVEPOINT plan_options_batch")
+    return results
+
+def _import_plan_options_frame(data, conn, job=None):
+    """
+    Import plan options with one plan name lookup and one upsert per batch.
+    data is a DataFrame or an iterable of DataFrame batches (see _open_import_batches).
+    """
+    imported_count = updated_count = total_rows = 0
+    errors = []
+    unknown_plans = {}
+    seen_options = {}
+
+    cursor = conn.cursor(cursor_factory=RealDictCursor)
+    try:
+        for batch in _as_import_batches(data):
+            clean, validation_errors = _validate_import_frame(
+                batch, PLAN_OPTIONS_IMPORT_SCHEMA, unique_on=['plan_full_name', 'option_name'], seen_keys=seen_options
+            )
+            errors.extend(f"Row {entry['row']}: {entry['error']}" for entry in validation_errors)
+            total_rows += len(batch)
+            _report_import_progress(job, rows_validated=total_rows)
+
+            # Resolve every plan name in the batch at once; unknown ones are reported together
+            rows = list(zip(clean.index + 2, _import_records(clean)))
+            elevation_ids = _resolve_plan_elevations(cursor, [row['plan_full_name'] for _, row in rows])
+            records = []
+            for row_num, row in rows:
+                plan_elevation_id = elevation_ids.get(row['plan_full_name'])
+                if plan_elevation_id is None:
+                    unknown_plans.setdefault(row['plan_full_name'], []).append(row_num)
+                    continue
+                records.append((f"Row {row_num}", {
+                    'plan_elevation_id': plan_elevation_id,
+                    'option_name': row['option_name'],
+                    'option_description': row['option_description'],
+                    'total_sf_outside_studs': row['total_sf_outside_studs']
+                }))
+
+            _check_import_cancelled(job)
+            # Plan names and option names are unique per file, so no two records share a key
+            for inserted, updated in _write_plan_option_rows(cursor, _upsert_plan_options, records, errors):
+                imported_count += inserted
+                updated_count += updated
+            _report_import_progress(job, rows_written=imported_count + updated_count)
+
+        for plan_full_name, row_nums in unknown_plans.items():
+            errors.append(f"Plan '{plan_full_name}' not found (rows {', '.join(map(str, row_nums))})")
+        _check_import_cancelled(job)
+        conn.commit()
+    finally:
+        cursor.close()
+
+    message = f"Import completed: {imported_count} new plan options, {updated_count} updated"
+    if errors:
+        message += f", {len(errors)} errors"
+    return {
+        'success': True,
+        'message': message,
+        'imported_count': imported_count,
+        'updated_count': updated_count,
+        'unknown_plans': sorted(unknown_plans),
+        'errors': errors
+    }
+
 @app.route('/api/plan-options/import', methods=['POST'])
 def api_import_plan_options():
     """API endpoint to import plan options from Excel/CSV file"""
-    import pandas as pd
-    import io
     db = DatabaseManager()
+    batches = None
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No file uploaded'}), 400
@@ -2362,55 +3895,27 @@ def api_import_plan_options():
             return jsonify({'success': False, 'message': 'No file selected'}), 400
         if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
             return jsonify({'success': False, 'message': 'Invalid file format. Please upload Excel (.xlsx, .xls) or CSV file'}), 400
-        if file.filename.lower().endswith('.csv'):
-            df = pd.read_csv(io.StringIO(file.read().decode('utf-8')))
-        else:
-            df = pd.read_excel(io.BytesIO(file.read()))
+        columns, batches = _open_import_batches(file.stream, file.filename)
         required_columns = ['plan_full_name', 'option_name']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in columns]
         if missing_columns:
             return jsonify({'success': False, 'message': f'Missing required columns: {", ".join(missing_columns)}'}), 400
         if not db.connect():
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
-        imported_count = 0
-        errors = []
-        for index, row in df.iterrows():
-            try:
-                # Get plan_elevation_id from plan_full_name
-                db.cursor.execute("SELECT plan_elevation_id FROM takeoff.plan_elevations WHERE plan_full_name = %s", (row.get('plan_full_name', ''),))
-                pe = db.cursor.fetchone()
-                if not pe:
-                    errors.append(f"Row {index + 2}: Plan '{row.get('plan_full_name', '')}' not found")
-                    continue
-                db.cursor.execute("""
-                    INSERT INTO takeoff.plan_options
-                    (plan_elevation_id, option_name, option_description, total_sf_outside_studs)
-                    VALUES (%s, %s, %s, %s)
-                """, (
-                    pe['plan_elevation_id'],
-                    row.get('option_name', ''),
-                    row.get('option_description', ''),
-                    row.get('total_sf_outside_studs', 0)
-                ))
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
-                continue
-        db.conn.commit()
-        message = f"Import completed: {imported_count} new plan options"
-        if errors:
-            message += f", {len(errors)} errors"
-        return jsonify({
-            'success': True,
-            'message': message,
-            'imported_count': imported_count,
-            'errors': errors[:10]
-        })
+        result = _import_plan_options_frame(batches, db.conn)
+        result['errors'] = result['errors'][:10]
+        return jsonify(result)
+    except ImportFileError as e:
+        if db.conn:
+            db.conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         if db.conn:
             db.conn.rollback()
         return jsonify({'success': False, 'message': f'Import failed: {str(e)}'}), 500
     finally:
+        if batches:
+            batches.close()
         db.disconnect()
 
 @app.route('/api/plan-options/bulk-update', methods=['POST'])
@@ -2426,60 +3931,49 @@ def api_bulk_update_plan_options():
     if not db.connect():
         return jsonify({'success': False, 'message': 'Database connection failed'}), 500
     try:
-        updated_count = 0
         errors = []
-        # List of all editable fields in plan_options (excluding PK and computed fields)
-        editable_fields = [
-            'plan_elevation_id', 'option_name', 'option_type', 'option_description',
-            'bedroom_count', 'bathroom_count',
-            'heated_sf_inside_studs', 'heated_sf_outside_studs', 'heated_sf_outside_veneer',
-            'unheated_sf_inside_studs', 'unheated_sf_outside_studs', 'unheated_sf_outside_veneer',
-            'total_sf_inside_studs', 'total_sf_outside_studs', 'total_sf_outside_veneer'
-        ]
-        for update in updates:
-            try:
-                plan_option_id = update.get('plan_option_id')
-                if plan_option_id:
-                    update_fields = []
-                    params = []
-                    # Handle plan_full_name -> plan_elevation_id
-                    if 'plan_full_name' in update:
-                        db.cursor.execute("SELECT plan_elevation_id FROM takeoff.plan_elevations WHERE plan_full_name = %s", (update['plan_full_name'],))
-                        pe = db.cursor.fetchone()
-                        if pe:
-                            update_fields.append("plan_elevation_id = %s")
-                            params.append(pe['plan_elevation_id'])
-                    # Handle all other editable fields
-                    for field in editable_fields:
-                        if field in update and field != 'plan_elevation_id':
-                            update_fields.append(f"{field} = %s")
-                            params.append(update[field])
-                    if update_fields:
-                        params.append(plan_option_id)
-                        query = f"UPDATE takeoff.plan_options SET {', '.join(update_fields)} WHERE plan_option_id = %s"
-                        db.cursor.execute(query, params)
-                else:
-                    # Insert new (not common from UI, but support basic fields)
-                    fields = []
-                    values = []
-                    if 'plan_full_name' in update:
-                        db.cursor.execute("SELECT plan_elevation_id FROM takeoff.plan_elevations WHERE plan_full_name = %s", (update['plan_full_name'],))
-                        pe = db.cursor.fetchone()
-                        if pe:
-                            fields.append('plan_elevation_id')
-                            values.append(pe['plan_elevation_id'])
-                    for field in editable_fields:
-                        if field in update and field != 'plan_elevation_id':
-                            fields.append(field)
-                            values.append(update[field])
-                    if fields:
-                        placeholders = ','.join(['%s'] * len(fields))
-                        query = f"INSERT INTO takeoff.plan_options ({','.join(fields)}) VALUES ({placeholders})"
-                        db.cursor.execute(query, values)
-                updated_count += 1
-            except Exception as e:
-                errors.append(f"Error updating plan_option: {str(e)}")
-                continue
+        # Resolve every plan_full_name in the batch with one query
+        elevation_ids = _resolve_plan_elevations(
+            db.cursor, [update['plan_full_name'] for update in updates if update.get('plan_full_name')]
+        )
+        unknown_plans = sorted({
+            update['plan_full_name'] for update in updates
+            if update.get('plan_full_name') and update['plan_full_name'] not in elevation_ids
+        })
+        if unknown_plans:
+            errors.append(f"Plans not found: {', '.join(unknown_plans)}")
+
+        # Rows for the same plan option are merged, later fields winning as if applied in
+        # order: one statement cannot update a row twice
+        existing = {}
+        new = {}
+        for row_num, update in enumerate(updates, start=1):
+            record = {field: update[field] for field in PLAN_OPTIONS_EDITABLE_FIELDS if field in update}
+            # plan_full_name wins over a raw plan_elevation_id, as before
+            record.pop('plan_elevation_id', None)
+            if update.get('plan_full_name') in elevation_ids:
+                record['plan_elevation_id'] = elevation_ids[update['plan_full_name']]
+            if update.get('plan_option_id'):
+                record['plan_option_id'] = update['plan_option_id']
+                target, key = existing, update['plan_option_id']
+            elif record:
+                # Insert new (not common from UI); an existing plan/option pair is updated instead
+                key = (record.get('plan_elevation_id'), record.get('option_name'))
+                target, key = new, key if None not in key else ('row', row_num)
+            else:
+                continue
+            labels, merged = target.get(key, ([], {}))
+            target[key] = (labels + [row_num], {**merged, **record})
+
+        def labelled(records):
+            return [
+                (f"Row{'s' if len(labels) > 1 else ''} {', '.join(map(str, labels))}", record)
+                for labels, record in records.values()
+            ]
+
+        updated_count = sum(_write_plan_option_rows(db.cursor, _update_plan_options, labelled(existing), errors))
+        for inserted_count, merged_count in _write_plan_option_rows(db.cursor, _upsert_plan_options, labelled(new), errors):
+            updated_count += inserted_count + merged_count
         db.conn.commit()
         if errors:
             message = f"Updated {updated_count} plan options with {len(errors)} errors: {'; '.join(errors[:3])}"
@@ -2522,7 +4016,7 @@ def api_qty_takeoffs():
                 t.item_description,
                 t.quantity_source,
                 t.quantity,
-                COALESCE(t.quantity * COALESCE(t.price_factor, 1), 0) AS calculated_quantity,
+                COALESCE(pm.measure_value, t.calculated_quantity, t.quantity, 0) AS calculated_quantity,
                 t.unit_price,
                 t.price_factor,
                 t.unit_of_measure,
@@ -2543,6 +4037,9 @@ def api_qty_takeoffs():
             LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
             LEFT JOIN takeoff.cost_codes cc ON t.cost_code_id = cc.cost_code_id
             LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+            LEFT JOIN takeoff.plan_option_measurements pm
+                ON pm.plan_option_id = t.plan_option_id
+                AND pm.measure_name = NULLIF(i.qty_formula, '')
             LEFT JOIN takeoff.vendors v ON t.vendor_id = v.vendor_id
             ORDER BY t.takeoff_id
         """)
@@ -2555,80 +4052,157 @@ def api_qty_takeoffs():
     finally:
         db.disconnect()
 
-@app.route('/api/qty-takeoffs/export/<format>')
-def api_export_qty_takeoffs(format):
-    """API endpoint to export Qty Takeoffs data in CSV or Excel format"""
-    import pandas as pd
-    import io
-    from flask import make_response
-    db = DatabaseManager()
-    if not db.connect():
-        return jsonify({'error': 'Database connection failed'}), 500
+
+@app.route('/api/qty-takeoffs/recalculate', methods=['POST'])
+def api_recalculate_qty_takeoffs():
+    """
+    API endpoint to recompute calculated_quantity and extended_price of every takeoff in a
+    plan set from its item's quantity formula. JSON body: {"plan_option_ids": [...]},
+    {"plan_ids": [...]} or {"all": true}; add "dryRun": true to only report what would change.
+    Formulas are evaluated vectorized over all takeoffs at once and the changed rows are
+    written with a single UPDATE. Only takeoffs whose formula gives a valid quantity are
+    repriced, and extended_price only where the takeoff has a unit price; takeoffs without a
+    formula just get a NULL calculated_quantity. Negative or out of range results are reported
+    per takeoff in row_errors and leave the takeoff unchanged.
+    """
+    import numpy as np
+
+    data = request.get_json(silent=True) or {}
+    dry_run = str(data.get('dryRun', '')).lower() in ('1', 'true', 'yes')
+    if data.get('plan_option_ids'):
+        scope, scope_params = 't.plan_option_id = ANY(%s)', [_as_list(data['plan_option_ids'])]
+    elif data.get('plan_ids'):
+        scope = """t.plan_option_id IN (
+            SELECT po.plan_option_id FROM takeoff.plan_options po
+            JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+            WHERE pe.plan_id = ANY(%s)
+        )"""
+        scope_params = [_as_list(data['plan_ids'])]
+    elif data.get('all') is True:
+        scope, scope_params = 't.plan_option_id IS NOT NULL', []
+    else:
+        return jsonify({'success': False, 'message': 'Provide plan_option_ids, plan_ids or "all": true'}), 400
     try:
-        # Use the same query as the api_qty_takeoffs endpoint
-        db.cursor.execute("""
-            SELECT
-                t.takeoff_id,
-                t.plan_option_id,
-                po.option_name,
-                pe.plan_full_name,
-                COALESCE(t.quantity * COALESCE(t.price_factor, 1), 0) AS calculated_quantity,
-                t.cost_code_id,
-                cc.cost_code,
-                t.item_id,
-                i.item_name,
-                t.item_description,
-                t.quantity_source,
-                t.quantity,
-                t.calculated_quantity,
-                t.unit_price,
-                t.price_factor,
-                t.unit_of_measure,
-                t.extended_price,
-                t.vendor_id,
-                v.vendor_name,
-                t.notes,
-                t.job_name,
-                t.job_number,
-                t.lot_number,
-                t.customer_name,
-                t.room,
-                t.spec_name,
-                t.job_id,
-                t.product_id
-            FROM takeoff.takeoffs t
-            LEFT JOIN takeoff.plan_options po ON t.plan_option_id = po.plan_option_id
-            LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
-            LEFT JOIN takeoff.cost_codes cc ON t.cost_code_id = cc.cost_code_id
-            LEFT JOIN takeoff.items i ON t.item_id = i.item_id
-            LEFT JOIN takeoff.vendors v ON t.vendor_id = v.vendor_id
-            ORDER BY t.takeoff_id
-        """)
-        records = db.cursor.fetchall()
-        df = pd.DataFrame([dict(record) for record in records])
-        if format.lower() == 'csv':
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = 'attachment; filename=qty_takeoffs.csv'
-            return response
-        elif format.lower() == 'excel':
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Qty Takeoffs', index=False)
-            output.seek(0)
-            response = make_response(output.read())
-            response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            response.headers['Content-Disposition'] = 'attachment; filename=qty_takeoffs.xlsx'
-            return response
+        scope_params = [[int(value) for value in values] for values in scope_params]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Ids must be integers'}), 400
+
+    def floats(values, default=np.nan):
+        return np.array([default if value is None else value for value in values], dtype=float)
+
+    start = time.perf_counter()
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"""
+                SELECT
+                    t.takeoff_id,
+                    t.plan_option_id,
+                    t.unit_price,
+                    t.price_factor,
+                    COALESCE(NULLIF(i.qty_formula, ''), NULLIF(f.formula_text, '')) AS formula
+                FROM takeoff.takeoffs t
+                LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+                LEFT JOIN takeoff.formulas f ON i.formula_id = f.formula_id
+                WHERE {scope}
+            """, scope_params)
+            takeoffs = cursor.fetchall()
+            if not takeoffs:
+                return jsonify({'success': True, 'dry_run': dry_run, 'takeoffs': 0, 'formula_takeoffs': 0, 'updated': 0, 'formula_errors': [], 'row_errors': []})
+            takeoff_ids, option_ids, unit_prices, price_factors, formulas = zip(*takeoffs)
+
+            # Measurements pivoted to a plan option x measure matrix
+            options, option_rows = np.unique(np.array(option_ids), return_inverse=True)
+            cursor.execute("SELECT DISTINCT measure_name FROM takeoff.plan_option_measurements ORDER BY measure_name")
+            measure_names = [row[0] for row in cursor.fetchall()]
+            measure_matrix = np.full((len(options), len(measure_names)), np.nan)
+            cursor.execute("""
+                SELECT plan_option_id, measure_name, measure_value
+                FROM takeoff.plan_option_measurements
+                WHERE plan_option_id = ANY(%s)
+            """, ([int(option) for option in options],))
+            measurements = cursor.fetchall()
+            if measurements:
+                option_ids_m, names_m, values_m = zip(*measurements)
+                measure_columns = {name: position for position, name in enumerate(measure_names)}
+                measure_matrix[
+                    np.searchsorted(options, np.array(option_ids_m)),
+                    [measure_columns[name] for name in names_m]
+                ] = floats(values_m)
+
+            calculated, errors, row_errors = _evaluate_qty_formulas(formulas, option_rows, measure_names, measure_matrix)
+            calculated = np.round(calculated, 4)
+            unit_prices = floats(unit_prices)
+            with np.errstate(invalid='ignore'):
+                extended = np.round(calculated * unit_prices * floats(price_factors, 1.0), 2)
+            for row in np.flatnonzero(~np.isnan(extended) & ((extended < 0) | (extended >= EXTENDED_PRICE_MAX_VALUE))):
+                row_errors[int(row)] = f'Extended price {extended[row]:g} is out of range'
+                calculated[row] = np.nan
+
+            # Rows with a valid result are repriced; rows without a formula only lose a stale
+            # calculated_quantity; rows whose formula failed are left alone
+            update_rows = [
+                row for row, formula in enumerate(formulas)
+                if not np.isnan(calculated[row]) or not formula
+            ]
+            values = (
+                [takeoff_ids[row] for row in update_rows],
+                [None if np.isnan(calculated[row]) else float(calculated[row]) for row in update_rows],
+                [
+                    None if np.isnan(calculated[row]) or np.isnan(unit_prices[row]) else float(extended[row])
+                    for row in update_rows
+                ]
+            )
+            changed = """
+                unnest(%s::int[], %s::numeric[], %s::numeric[]) AS u(takeoff_id, calculated_quantity, extended_price)
+                JOIN takeoff.takeoffs t ON t.takeoff_id = u.takeoff_id
+                WHERE t.calculated_quantity IS DISTINCT FROM u.calculated_quantity
+                OR (u.extended_price IS NOT NULL AND t.extended_price IS DISTINCT FROM u.extended_price)
+            """
+            if dry_run:
+                cursor.execute(f"SELECT COUNT(*) FROM {changed}", values)
+            else:
+                # A NULL extended_price keeps the takeoff's own (lump sums, manual prices)
+                cursor.execute(f"""
+                    UPDATE takeoff.takeoffs
+                    SET calculated_quantity = changed.calculated_quantity,
+                        extended_price = COALESCE(changed.extended_price, takeoffs.extended_price)
+                    FROM (SELECT u.* FROM {changed}) changed
+                    WHERE takeoffs.takeoff_id = changed.takeoff_id
+                """, values)
+            updated = cursor.fetchone()[0] if dry_run else cursor.rowcount
+        if dry_run:
+            conn.rollback()
         else:
-            return jsonify({'error': 'Invalid format. Use csv or excel'}), 400
+            conn.commit()
+
+        return jsonify({
+            'success': True,
+            'dry_run': dry_run,
+            'takeoffs': len(takeoffs),
+            'formula_takeoffs': sum(1 for formula in formulas if formula),
+            'updated': updated,
+            'formula_errors': [
+                {'formula': formula, 'error': error, 'takeoffs': formulas.count(formula)}
+                for formula, error in sorted(errors.items())
+            ],
+            'row_errors': _limit_errors([
+                {'takeoff_id': takeoff_ids[row], 'formula': formulas[row], 'error': error}
+                for row, error in sorted(row_errors.items())
+            ], limit=100),
+            'elapsed_ms': round((time.perf_counter() - start) * 1000, 1)
+        })
     except Exception as e:
-        logger.error(f"Error exporting qty takeoffs: {e}")
-        return jsonify({'error': str(e)}), 500
+        conn.rollback()
+        logger.error(f"Error recalculating qty takeoffs: {e}")
+        return jsonify({'success': False, 'message': str(e)}), 500
     finally:
-        db.disconnect()
+        conn.close()
+
+@app.route('/api/qty-takeoffs/export/<format>')
+def api_export_qty_takeoffs(format):
+    """API endpoint to export all Qty Takeoffs data as CSV, Excel, Parquet or Arrow (see /api/export/qty-takeoffs)"""
+    return _grid_export('qty-takeoffs', format)
 
 @app.route('/api/qty-takeoffs/template/<format>')
 def api_qty_takeoffs_template(format):
@@ -2718,12 +4292,245 @@ def api_qty_takeoffs_template(format):
         logger.error(f"Error creating qty takeoffs template: {e}")
         return jsonify({'error': str(e)}), 500
 
+# Largest extended_price takeoffs can hold (DECIMAL(15,2))
+QTY_TAKEOFFS_EXTENDED_PRICE_MAX = 9999999999999.99
+
+# Columns accepted by the qty takeoffs import (matches the import template)
+QTY_TAKEOFFS_IMPORT_SCHEMA = {
+    'takeoff_id': {'type': 'int'},
+    'plan_full_name': {'type': 'text'},
+    'option_name': {'type': 'text'},
+    'cost_code': {'type': 'text'},
+    'item_name': {'type': 'text'},
+    'item_description': {'type': 'text'},
+    'quantity_source': {'type': 'text', 'max_length': 255},
+    'quantity': {'type': 'number', 'min': 0, 'max': 99999999.9999, 'scale': 4},
+    'unit_price': {'type': 'number', 'min': 0, 'max': 99999999.9999, 'scale': 4},
+    'price_factor': {'type': 'number', 'default': 1.0, 'min': 0, 'max': 9999.9999, 'scale': 4},
+    'unit_of_measure': {'type': 'text', 'default': 'EA', 'max_length': 50},
+    'extended_price': {'type': 'number', 'min': 0, 'max': QTY_TAKEOFFS_EXTENDED_PRICE_MAX, 'scale': 2},
+    'vendor_name': {'type': 'text'},
+    'notes': {'type': 'text'},
+    'job_name': {'type': 'text', 'max_length': 255},
+    'job_number': {'type': 'text', 'max_length': 100},
+    'lot_number': {'type': 'text', 'max_length': 100},
+    'customer_name': {'type': 'text', 'max_length': 255},
+    'room': {'type': 'text', 'max_length': 255},
+    'spec_name': {'type': 'text', 'max_length': 255},
+    'job_id': {'type': 'int'},
+    'product_id': {'type': 'int'},
+    'vendor_id': {'type': 'int'},
+    'plan_option_id': {'type': 'int'},
+    'item_id': {'type': 'int'},
+    'cost_code_id': {'type': 'int'}
+}
+
+# Staged id column -> (staged name column, lookup table, lookup name column)
+QTY_TAKEOFFS_NAME_REFERENCES = {
+    'cost_code_id': ('cost_code', 'takeoff.cost_codes', 'cost_code'),
+    'item_id': ('item_name', 'takeoff.items', 'item_name'),
+    'vendor_id': ('vendor_name', 'takeoff.vendors', 'vendor_name')
+}
+
+# Staged id column -> lookup table for references that can only be given by id
+QTY_TAKEOFFS_ID_REFERENCES = {
+    'takeoff_id': 'takeoff.takeoffs',
+    'plan_option_id': 'takeoff.plan_options',
+    'cost_code_id': 'takeoff.cost_codes',
+    'item_id': 'takeoff.items',
+    'vendor_id': 'takeoff.vendors',
+    'product_id': 'takeoff.products',
+    'job_id': 'takeoff.jobs'
+}
+
+def _import_qty_takeoffs_frame(data, conn, job=None):
+    """
+    Import qty takeoffs in set-based stages: validate and coerce each batch with the shared
+    import schema and COPY its clean rows into typed staging, resolve every name/id reference
+    with one join per reference, report all unresolved rows together, then upsert the valid
+    rows into takeoff.takeoffs keyed on takeoff_id when supplied.
+    data is a DataFrame or an iterable of DataFrame batches (see _open_import_batches).
+    """
+    total_rows = 0
+    validation_errors = []
+    seen_takeoff_ids = {}
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE TEMP TABLE qty_takeoffs_import_staging (
+                row_num INTEGER,
+                {', '.join(f"{column} {IMPORT_SQL_TYPES[spec['type']]}" for column, spec in QTY_TAKEOFFS_IMPORT_SCHEMA.items())},
+                {', '.join(f'r_{column} INTEGER' for column in QTY_TAKEOFFS_ID_REFERENCES)},
+                error TEXT
+            ) ON COMMIT DROP
+        """)
+
+        # Stage 1: validate and load batch by batch
+        for batch in _as_import_batches(data):
+            _check_import_cancelled(job)
+            staging, batch_errors = _validate_import_frame(
+                batch, QTY_TAKEOFFS_IMPORT_SCHEMA, unique_on=['takeoff_id'], seen_keys=seen_takeoff_ids
+            )
+            staging.insert(0, 'row_num', staging.index + 2)
+            _copy_frame(cursor, staging, 'qty_takeoffs_import_staging', list(staging.columns))
+            validation_errors.extend(batch_errors)
+            total_rows += len(batch)
+            _report_import_progress(job, rows_validated=total_rows)
+
+        # Stage 2: resolve. Explicit ids win; names fill in whatever was left blank
+        for id_column, table in QTY_TAKEOFFS_ID_REFERENCES.items():
+            cursor.execute(f"""
+                UPDATE qty_takeoffs_import_staging s
+                SET r_{id_column} = t.{id_column}
+                FROM {table} t
+                WHERE t.{id_column} = s.{id_column}
+            """)
+
+        for id_column, (name_column, table, table_name_column) in QTY_TAKEOFFS_NAME_REFERENCES.items():
+            cursor.execute(f"""
+                UPDATE qty_takeoffs_import_staging s
+                SET r_{id_column} = t.{id_column}
+                FROM {table} t
+                WHERE s.{id_column} IS NULL
+                AND t.{table_name_column} = s.{name_column}
+            """)
+
+        cursor.execute("""
+            UPDATE qty_takeoffs_import_staging s
+            SET r_plan_option_id = po.plan_option_id
+            FROM takeoff.plan_options po
+            JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+            WHERE s.plan_option_id IS NULL
+            AND pe.plan_full_name = s.plan_full_name
+            AND po.option_name = s.option_name
+        """)
+
+        # Products have no unique name; match the item's product with the same description
+        cursor.execute("""
+            UPDATE qty_takeoffs_import_staging s
+            SET r_product_id = p.product_id
+            FROM (
+                SELECT DISTINCT ON (item_id, item_description) product_id, item_id, item_description
+                FROM takeoff.products
+                ORDER BY item_id, item_description, product_id
+            ) p
+            WHERE s.product_id IS NULL
+            AND p.item_id = s.r_item_id
+            AND p.item_description = s.item_description
+        """)
+
+        # Stage 3: values and in-file duplicates were checked before staging; report every
+        # unresolved reference at once
+        cursor.execute("""
+            UPDATE qty_takeoffs_import_staging
+            SET error = NULLIF(CONCAT_WS('; ',
+                CASE WHEN takeoff_id IS NOT NULL AND r_takeoff_id IS NULL
+                     THEN 'takeoff_id ' || takeoff_id || ' not found' END,
+                CASE WHEN plan_option_id IS NOT NULL AND r_plan_option_id IS NULL
+                     THEN 'plan_option_id ' || plan_option_id || ' not found'
+                     WHEN plan_option_id IS NULL AND (plan_full_name IS NULL OR option_name IS NULL)
+                     THEN 'plan_full_name and option_name are required'
+                     WHEN r_plan_option_id IS NULL
+                     THEN 'Plan option ''' || plan_full_name || ' / ' || option_name || ''' not found' END,
+                CASE WHEN COALESCE(cost_code_id::text, cost_code) IS NOT NULL AND r_cost_code_id IS NULL
+                     THEN 'Cost code ''' || COALESCE(cost_code_id::text, cost_code) || ''' not found' END,
+                CASE WHEN COALESCE(item_id::text, item_name) IS NOT NULL AND r_item_id IS NULL
+                     THEN 'Item ''' || COALESCE(item_id::text, item_name) || ''' not found' END,
+                CASE WHEN COALESCE(vendor_id::text, vendor_name) IS NOT NULL AND r_vendor_id IS NULL
+                     THEN 'Vendor ''' || COALESCE(vendor_id::text, vendor_name) || ''' not found' END,
+                CASE WHEN product_id IS NOT NULL AND r_product_id IS NULL
+                     THEN 'product_id ' || product_id || ' not found' END,
+                CASE WHEN job_id IS NOT NULL AND r_job_id IS NULL
+                     THEN 'job_id ' || job_id || ' not found' END,
+                -- The takeoffs trigger recomputes extended_price from the other three (when
+                -- blank, or when they change on an existing takeoff)
+                CASE WHEN ROUND(COALESCE(quantity, 0) * COALESCE(unit_price, 0) * COALESCE(price_factor, 1.0), 2) > %(extended_price_max)s
+                     THEN 'quantity x unit_price x price_factor is more than ' || %(extended_price_max)s END
+            ), '')
+        """, {'extended_price_max': QTY_TAKEOFFS_EXTENDED_PRICE_MAX})
+
+        cursor.execute("""
+            SELECT row_num, error FROM qty_takeoffs_import_staging
+            WHERE error IS NOT NULL
+        """)
+        unresolved = sorted(
+            validation_errors + [{'row': row_num, 'error': error} for row_num, error in cursor.fetchall()],
+            key=lambda entry: entry['row']
+        )
+
+        # Stage 4: merge valid rows into takeoffs in one upsert
+        _check_import_cancelled(job)
+        cursor.execute("""
+            WITH merged AS (
+                INSERT INTO takeoff.takeoffs (
+                    takeoff_id, job_id, product_id, vendor_id, plan_option_id, item_id, cost_code_id,
+                    item_description, quantity_source, quantity, unit_price, price_factor,
+                    unit_of_measure, extended_price, notes, job_name, job_number, lot_number,
+                    customer_name, room, spec_name
+                )
+                SELECT
+                    COALESCE(r_takeoff_id, nextval('takeoff.takeoffs_takeoff_id_seq')),
+                    r_job_id, r_product_id, r_vendor_id, r_plan_option_id, r_item_id, r_cost_code_id,
+                    item_description, quantity_source, quantity, unit_price,
+                    price_factor, unit_of_measure, extended_price, notes, job_name, job_number, lot_number,
+                    customer_name, room, spec_name
+                FROM qty_takeoffs_import_staging
+                WHERE error IS NULL
+                ORDER BY row_num
+                ON CONFLICT (takeoff_id) DO UPDATE SET
+                    job_id = EXCLUDED.job_id,
+                    product_id = EXCLUDED.product_id,
+                    vendor_id = EXCLUDED.vendor_id,
+                    plan_option_id = EXCLUDED.plan_option_id,
+                    item_id = EXCLUDED.item_id,
+                    cost_code_id = EXCLUDED.cost_code_id,
+                    item_description = EXCLUDED.item_description,
+                    quantity_source = EXCLUDED.quantity_source,
+                    quantity = EXCLUDED.quantity,
+                    unit_price = EXCLUDED.unit_price,
+                    price_factor = EXCLUDED.price_factor,
+                    unit_of_measure = EXCLUDED.unit_of_measure,
+                    extended_price = EXCLUDED.extended_price,
+                    notes = EXCLUDED.notes,
+                    job_name = EXCLUDED.job_name,
+                    job_number = EXCLUDED.job_number,
+                    lot_number = EXCLUDED.lot_number,
+                    customer_name = EXCLUDED.customer_name,
+                    room = EXCLUDED.room,
+                    spec_name = EXCLUDED.spec_name
+                RETURNING (xmax = 0) AS inserted
+            )
+            SELECT
+                COUNT(*) FILTER (WHERE inserted) AS imported_count,
+                COUNT(*) FILTER (WHERE NOT inserted) AS updated_count
+            FROM merged
+        """)
+        imported_count, updated_count = cursor.fetchone()
+        _check_import_cancelled(job)
+        conn.commit()
+    finally:
+        cursor.close()
+    _report_import_progress(job, rows_written=imported_count + updated_count)
+
+    message = f"Import completed: {imported_count} new qty takeoffs, {updated_count} updated"
+    if unresolved:
+        message += f", {len(unresolved)} unresolved rows"
+    return {
+        'success': True,
+        'message': message,
+        'imported_count': imported_count,
+        'updated_count': updated_count,
+        'unresolved_count': len(unresolved),
+        'unresolved': unresolved,
+        'errors': [f"Row {entry['row']}: {entry['error']}" for entry in unresolved]
+    }
+
 @app.route('/api/qty-takeoffs/import', methods=['POST'])
 def api_import_qty_takeoffs():
-    """API endpoint to import Qty Takeoffs from Excel/CSV file"""
-    import pandas as pd
-    import io
+    """API endpoint to import Qty Takeoffs from Excel/CSV file into takeoff.takeoffs"""
     db = DatabaseManager()
+    batches = None
     try:
         if 'file' not in request.files:
             return jsonify({'success': False, 'message': 'No file uploaded'}), 400
@@ -2732,54 +4539,28 @@ def api_import_qty_takeoffs():
             return jsonify({'success': False, 'message': 'No file selected'}), 400
         if not file.filename.lower().endswith(('.xlsx', '.xls', '.csv')):
             return jsonify({'success': False, 'message': 'Invalid file format. Please upload Excel (.xlsx, .xls) or CSV file'}), 400
-        if file.filename.lower().endswith('.csv'):
-            df = pd.read_csv(io.StringIO(file.read().decode('utf-8')))
-        else:
-            df = pd.read_excel(io.BytesIO(file.read()))
+        columns, batches = _open_import_batches(file.stream, file.filename)
         required_columns = ['plan_full_name', 'option_name', 'cost_code', 'item_name', 'item_description', 'quantity_source', 'quantity']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in columns]
         if missing_columns:
             return jsonify({'success': False, 'message': f'Missing required columns: {", ".join(missing_columns)}'}), 400
         if not db.connect():
             return jsonify({'success': False, 'message': 'Database connection failed'}), 500
-        imported_count = 0
-        errors = []
-        for index, row in df.iterrows():
-            try:
-                # Insert into a staging table or main table as appropriate
-                db.cursor.execute("""
-                    INSERT INTO takeoff.qty_takeoffs_staging
-                    (plan_full_name, option_name, cost_code, item_name, item_description, quantity_source, quantity)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    row.get('plan_full_name', ''),
-                    row.get('option_name', ''),
-                    row.get('cost_code', ''),
-                    row.get('item_name', ''),
-                    row.get('item_description', ''),
-                    row.get('quantity_source', ''),
-                    row.get('quantity', 0)
-                ))
-                imported_count += 1
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
-                continue
-        db.conn.commit()
-        message = f"Import completed: {imported_count} new qty takeoffs"
-        if errors:
-            message += f", {len(errors)} errors"
-        return jsonify({
-            'success': True,
-            'message': message,
-            'imported_count': imported_count,
-            'errors': errors[:10]
-        })
+        result = _import_qty_takeoffs_frame(batches, db.conn)
+        result['errors'] = result['errors'][:10]
+        return jsonify(result)
+    except ImportFileError as e:
+        if db.conn:
+            db.conn.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 400
     except Exception as e:
         logger.error(f"Error importing qty takeoffs: {e}")
         if db.conn:
             db.conn.rollback()
         return jsonify({'success': False, 'message': f'Import failed: {str(e)}'}), 500
     finally:
+        if batches:
+            batches.close()
         db.disconnect()
 
 @app.route('/api/qty-takeoffs/delete', methods=['POST'])
@@ -2887,7 +4668,8 @@ def api_comprehensive_takeoff_analysis():
         return jsonify({'error': 'Database connection failed'}), 500
     
     try:
-        db.cursor.execute("SELECT * FROM takeoff.v_comprehensive_takeoff_analysis ORDER BY cost_code, item_name")
+        # Trigger-maintained copy of v_comprehensive_takeoff_analysis (migration 035)
+        db.cursor.execute("SELECT * FROM takeoff.comprehensive_takeoff_summary ORDER BY cost_code, item_name, takeoff_id")
         records = db.cursor.fetchall()
         
         # Convert to list of dictionaries for JSON serialization
@@ -2899,6 +4681,12 @@ def api_comprehensive_takeoff_analysis():
     finally:
         db.disconnect()
 
+
+@app.route('/api/comprehensive-takeoff-analysis/export/<format>')
+def api_export_comprehensive_takeoff_analysis(format):
+    """API endpoint to export the comprehensive takeoff analysis as CSV, Excel, Parquet or Arrow"""
+    return _grid_export('comprehensive-takeoff-analysis', format)
+
 # ============================================================================
 # == 4.4 PRODUCTS ENDPOINTS (CONTINUED) ====================================
 # ============================================================================
@@ -3072,15 +4860,296 @@ def api_update_product(product_id):
         if conn:
             conn.close()
 
+# Columns accepted by the products import, in staging-table order
+PRODUCTS_IMPORT_SCHEMA = {
+    'product_id': {'type': 'int'},  # Only used by sync imports, to match existing products
+    'item_id': {'type': 'int'},
+    'item_name': {'type': 'text'},
+    'item_description': {'type': 'text'},
+    'brand': {'type': 'text', 'max_length': 100},
+    'model': {'type': 'text', 'max_length': 100},
+    'item_type': {'type': 'text', 'default': 'Product', 'choices': ['Quote', 'Product', 'Attribute']},
+    'style': {'type': 'text', 'max_length': 100},
+    'color': {'type': 'text', 'max_length': 50},
+    'finish': {'type': 'text', 'max_length': 50},
+    'material': {'type': 'text', 'max_length': 100},
+    'sku': {'type': 'text', 'max_length': 100},
+    'size': {'type': 'text', 'max_length': 50},
+    'unit_of_measure': {'type': 'text', 'default': 'Each', 'max_length': 10},
+    'image_url': {'type': 'text', 'default': '/static/images/default-product.png'},
+    'is_active': {'type': 'bool', 'default': True},
+    'plan_option_id': {'type': 'int'},
+    'min_stock_level': {'type': 'int', 'default': 0},
+    'quantity': {'type': 'int', 'default': 0}
+}
+
+# takeoff.products columns written by the import (and compared by sync imports)
+PRODUCTS_IMPORT_WRITE_COLUMNS = [
+    'item_id', 'item_description', 'brand', 'model', 'item_type', 'style', 'color',
+    'finish', 'material', 'sku', 'size', 'unit_of_measure', 'image_url',
+    'is_active', 'plan_option_id', 'min_stock_level', 'quantity'
+]
+
+def _import_products_frame(data, conn, job=None, sync=False, dry_run=False):
+    """
+    Import products set-based: validate and coerce each batch with the shared import schema
+    and COPY its clean rows into a typed staging table, resolve references with a few
+    whole-table statements, then merge with a single INSERT ... SELECT.
+    item_description is derived in SQL exactly as trg_set_item_description_from_item_name
+    would, so the per-row trigger is skipped for this transaction.
+
+    With sync, rows carrying a product_id are compared with that product by content hash and
+    only changed products are updated. Rows without one are matched to an existing product on
+    item, description and model (ambiguous matches are reported as errors); only rows that
+    match nothing are inserted. dry_run rolls back after classifying, so nothing is written.
+    data is a DataFrame or an iterable of DataFrame batches (see _open_import_batches).
+    """
+    total_rows = 0
+    validation_errors = []
+    seen_product_ids = {}
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(f"""
+            CREATE TEMP TABLE products_import_staging (
+                row_num INTEGER,
+                {', '.join(f"{column} {IMPORT_SQL_TYPES[spec['type']]}" for column, spec in PRODUCTS_IMPORT_SCHEMA.items())},
+                resolved_item_id INTEGER,
+                resolved_plan_option_id INTEGER,
+                error TEXT
+            ) ON COMMIT DROP
+        """)
+        for batch in _as_import_batches(data):
+            _check_import_cancelled(job)
+            staging, batch_errors = _validate_import_frame(
+                batch, PRODUCTS_IMPORT_SCHEMA,
+                unique_on=['product_id'] if sync else None, seen_keys=seen_product_ids
+            )
+            staging.insert(0, 'row_num', staging.index + 2)
+            _copy_frame(cursor, staging, 'products_import_staging', list(staging.columns))
+            validation_errors.extend(batch_errors)
+            total_rows += len(batch)
+            _report_import_progress(job, rows_validated=total_rows)
+
+        # Resolve item and plan option references with one join each
+        cursor.execute("""
+            UPDATE products_import_staging s
+            SET resolved_item_id = i.item_id
+            FROM takeoff.items i
+            WHERE i.item_id = s.item_id
+        """)
+        cursor.execute("""
+            UPDATE products_import_staging s
+            SET resolved_item_id = i.item_id
+            FROM takeoff.items i
+            WHERE s.item_id IS NULL
+            AND i.item_name = s.item_name
+        """)
+        cursor.execute("""
+            UPDATE products_import_staging s
+            SET resolved_plan_option_id = po.plan_option_id
+            FROM takeoff.plan_options po
+            WHERE po.plan_option_id = s.plan_option_id
+        """)
+
+        # Values were checked before staging; only references are left to validate
+        cursor.execute("""
+            UPDATE products_import_staging
+            SET error = NULLIF(CONCAT_WS('; ',
+                CASE WHEN item_id IS NOT NULL AND resolved_item_id IS NULL
+                     THEN 'item_id ' || item_id || ' not found' END,
+                CASE WHEN item_id IS NULL AND item_name IS NOT NULL AND resolved_item_id IS NULL
+                     THEN 'Item ''' || item_name || ''' not found' END,
+                CASE WHEN plan_option_id IS NOT NULL AND resolved_plan_option_id IS NULL
+                     THEN 'plan_option_id ' || plan_option_id || ' not found' END
+            ), '')
+        """)
+        if sync:
+            cursor.execute("""
+                UPDATE products_import_staging s
+                SET error = CONCAT_WS('; ', s.error, 'product_id ' || s.product_id || ' not found')
+                WHERE s.product_id IS NOT NULL
+                AND NOT EXISTS (SELECT 1 FROM takeoff.products p WHERE p.product_id = s.product_id)
+            """)
+
+        # Final column values, deriving item_description the same way the trigger does
+        cursor.execute("""
+            CREATE TEMP TABLE products_import_rows ON COMMIT DROP AS
+            SELECT
+                s.row_num,
+                s.product_id,
+                s.resolved_item_id AS item_id,
+                CASE s.item_type
+                    WHEN 'Product' THEN i.item_name
+                    WHEN 'Quote' THEN
+                        CASE WHEN s.resolved_plan_option_id IS NOT NULL
+                             THEN 'Quote_' || COALESCE(pe.plan_full_name, '') || COALESCE(po.option_name, '')
+                             ELSE 'Quote'
+                        END
+                    WHEN 'Attribute' THEN
+                        COALESCE(s.brand, '') || '_' ||
+                        COALESCE(s.style, '') || '_' ||
+                        COALESCE(s.color, '') || '_' ||
+                        COALESCE(s.finish, '') || '_' ||
+                        COALESCE(s.sku, '') || '_' ||
+                        COALESCE(s.size, '')
+                    ELSE s.item_description
+                END AS item_description,
+                s.brand, s.model, s.item_type, s.style, s.color,
+                s.finish, s.material, s.sku, s.size, s.unit_of_measure, s.image_url,
+                s.is_active,
+                s.resolved_plan_option_id AS plan_option_id,
+                s.min_stock_level,
+                s.quantity
+            FROM products_import_staging s
+            LEFT JOIN takeoff.items i ON i.item_id = s.resolved_item_id
+            LEFT JOIN takeoff.plan_options po ON po.plan_option_id = s.resolved_plan_option_id
+            LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+            WHERE s.error IS NULL
+        """)
+        cursor.execute("""
+            SELECT row_num, error FROM products_import_staging
+            WHERE error IS NOT NULL
+        """)
+        reference_errors = [{'row': row_num, 'error': error} for row_num, error in cursor.fetchall()]
+
+        if sync:
+            # Rows without product_id (hand-built files, or exports without the column) are
+            # matched on item, description and model. A key shared by several products, or by
+            # several rows of the file, or leading to a product another row already names,
+            # cannot be matched safely and is reported instead of inserted again.
+            cursor.execute("""
+                CREATE TEMP TABLE products_import_matches ON COMMIT DROP AS
+                WITH existing AS (
+                    SELECT
+                        COALESCE(item_id, 0) AS item_key,
+                        COALESCE(item_description, '') AS description_key,
+                        COALESCE(model, '') AS model_key,
+                        MIN(product_id) AS product_id,
+                        COUNT(*) AS matches
+                    FROM takeoff.products
+                    GROUP BY 1, 2, 3
+                ), incoming AS (
+                    SELECT
+                        row_num,
+                        COALESCE(item_id, 0) AS item_key,
+                        COALESCE(item_description, '') AS description_key,
+                        COALESCE(model, '') AS model_key,
+                        COUNT(*) OVER (PARTITION BY COALESCE(item_id, 0), COALESCE(item_description, ''), COALESCE(model, '')) AS rows_with_key
+                    FROM products_import_rows
+                    WHERE product_id IS NULL
+                )
+                SELECT
+                    i.row_num,
+                    e.product_id,
+                    CASE
+                        WHEN e.matches > 1
+                        THEN 'matches ' || e.matches || ' existing products on item, description and model; add product_id'
+                        WHEN i.rows_with_key > 1
+                        THEN 'item, description and model repeat on another row without product_id; add product_id'
+                        WHEN e.product_id IN (SELECT product_id FROM products_import_rows WHERE product_id IS NOT NULL)
+                        THEN 'matches product_id ' || e.product_id || ', which another row already updates'
+                    END AS error
+                FROM incoming i
+                JOIN existing e USING (item_key, description_key, model_key)
+            """)
+            cursor.execute("""
+                UPDATE products_import_rows r
+                SET product_id = m.product_id
+                FROM products_import_matches m
+                WHERE m.row_num = r.row_num
+                AND m.error IS NULL
+            """)
+            cursor.execute("""
+                DELETE FROM products_import_rows r
+                USING products_import_matches m
+                WHERE m.row_num = r.row_num
+                AND m.error IS NOT NULL
+                RETURNING r.row_num, m.error
+            """)
+            reference_errors += [{'row': row_num, 'error': error} for row_num, error in cursor.fetchall()]
+
+        errors = [
+            f"Row {entry['row']}: {entry['error']}"
+            for entry in sorted(validation_errors + reference_errors, key=lambda entry: entry['row'])
+        ]
+
+        columns = ', '.join(PRODUCTS_IMPORT_WRITE_COLUMNS)
+        insert_where = ''
+        summary = None
+        if sync:
+            summary = _classify_import_sync(
+                cursor, 'products_import_rows', 'takeoff.products', 'product_id',
+                [(column, IMPORT_SQL_TYPES[PRODUCTS_IMPORT_SCHEMA[column]['type']]) for column in PRODUCTS_IMPORT_WRITE_COLUMNS]
+            )
+            insert_where = "WHERE action = 'insert'"
+
+        _check_import_cancelled(job)
+        cursor.execute("SET LOCAL takeoff.skip_item_description_trigger = 'on'")
+        updated_count = 0
+        if sync and not dry_run:
+            cursor.execute(f"""
+                UPDATE takeoff.products p
+                SET {', '.join(f'{column} = r.{column}' for column in PRODUCTS_IMPORT_WRITE_COLUMNS)}
+                FROM products_import_rows r
+                WHERE p.product_id = r.product_id
+                AND r.action = 'update'
+            """)
+            updated_count = cursor.rowcount
+        if not dry_run:
+            cursor.execute(f"""
+                INSERT INTO takeoff.products ({columns})
+                SELECT {columns}
+                FROM products_import_rows
+                {insert_where}
+                ORDER BY row_num
+            """)
+        imported_count = cursor.rowcount if not dry_run else 0
+        _check_import_cancelled(job)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    finally:
+        cursor.close()
+    _report_import_progress(job, rows_written=imported_count + updated_count)
+
+    if summary is None:
+        return {
+            'success': True,
+            'imported': imported_count,
+            'total': total_rows,
+            'message': f'Successfully imported {imported_count} out of {total_rows} products',
+            'errors': errors
+        }
+
+    message = (
+        f"{summary['inserted']} new, {summary['updated']} changed and {summary['unchanged']} unchanged products; "
+        f"{summary['missing']} existing products are not in the file"
+    )
+    return {
+        'success': True,
+        'mode': 'sync',
+        'dry_run': dry_run,
+        'imported': imported_count,
+        'total': total_rows,
+        **summary,
+        'message': f'Dry run: {message}' if dry_run else f'Sync completed: {message}',
+        'errors': errors
+    }
+
 @app.route('/api/products/import', methods=['POST'])
 def api_import_products():
-    """API endpoint to import products from Excel file"""
-    import pandas as pd
-    import io
+    """API endpoint to import products from Excel file (?mode=sync[&dryRun=true] to write only changes)"""
     
     conn = None
-    cursor = None
+    batches = None
     try:
+        try:
+            options = _import_sync_options()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
         # Check if file was uploaded
         if 'file' not in request.files:
             return jsonify({'error': 'No file uploaded'}), 400
@@ -3094,89 +5163,36 @@ def api_import_products():
             return jsonify({'error': 'Invalid file format. Please upload an Excel file (.xlsx or .xls)'}), 400
         
         # Read Excel file
-        try:
-            df = pd.read_excel(io.BytesIO(file.read()))
-        except Exception as e:
-            return jsonify({'error': f'Error reading Excel file: {str(e)}'}), 400
+        columns, batches = _open_import_batches(file.stream, file.filename)
         
         # Validate required columns
         required_columns = ['item_description', 'brand', 'model']
-        missing_columns = [col for col in required_columns if col not in df.columns]
+        missing_columns = [col for col in required_columns if col not in columns]
         if missing_columns:
             return jsonify({'error': f'Missing required columns: {", ".join(missing_columns)}'}), 400
         
         conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor()
-        
-        imported_count = 0
-        errors = []
-        
-        # Process each row
-        for index, row in df.iterrows():
-            try:
-                # Prepare data with defaults
-                product_data = {
-                    'item_description': row.get('item_description', ''),
-                    'brand': row.get('brand', ''),
-                    'model': row.get('model', ''),
-                    'item_type': row.get('item_type', 'Product'),
-                    'style': row.get('style', ''),
-                    'color': row.get('color', ''),
-                    'finish': row.get('finish', ''),
-                    'material': row.get('material', ''),
-                    'size': row.get('size', ''),
-                    'unit_of_measure': row.get('unit_of_measure', 'Each'),
-                    'image_url': row.get('image_url', '/static/images/default-product.png'),
-                    'is_active': bool(row.get('is_active', True)),
-                    'plan_option_id': int(row.get('plan_option_id')) if pd.notna(row.get('plan_option_id')) else None,
-                    'min_stock_level': int(row.get('min_stock_level', 0)),
-                    'quantity': int(row.get('quantity', 0))
-                }
-                
-                # Insert product
-                cursor.execute("""
-                    INSERT INTO takeoff.products (
-                        item_description, brand, model, item_type, style, color,
-                        finish, material, size, unit_of_measure, image_url,
-                        is_active, plan_option_id, min_stock_level, quantity
-                    ) VALUES (
-                        %(item_description)s, %(brand)s, %(model)s, %(item_type)s,
-                        %(style)s, %(color)s, %(finish)s, %(material)s, %(size)s,
-                        %(unit_of_measure)s, %(image_url)s, %(is_active)s,
-                        %(plan_option_id)s, %(min_stock_level)s, %(quantity)s
-                    )
-                """, product_data)
-                
-                imported_count += 1
-                
-            except Exception as e:
-                errors.append(f"Row {index + 2}: {str(e)}")
-                continue
+        result = _import_products_frame(batches, conn, **options)
         
-        conn.commit()
-        
-        result = {
-            'success': True,
-            'imported': imported_count,
-            'total': len(df),
-            'message': f'Successfully imported {imported_count} out of {len(df)} products'
-        }
-        
-        if errors:
-            result['errors'] = errors[:10]  # Limit to first 10 errors
-            if len(errors) > 10:
-                result['errors'].append(f'... and {len(errors) - 10} more errors')
+        if result['errors']:
+            result['errors'] = _limit_errors(result['errors'])
+        else:
+            del result['errors']
         
         return jsonify(result), 200
         
+    except ImportFileError as e:
+        if conn:
+            conn.rollback()
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         if conn:
             conn.rollback()
         logger.error(f"Error importing products: {e}")
         return jsonify({'error': str(e)}), 500
     finally:
-        if cursor:
-            cursor.close()
+        if batches:
+            batches.close()
         if conn:
             conn.close()
 
@@ -3214,75 +5230,11 @@ def api_delete_product(product_id):
         if conn:
             conn.close()
 
-# --- NEW: Products Export Endpoint ---
+
 @app.route('/api/products/export/<format>')
 def api_export_products(format):
-    """API endpoint to export products data in CSV or Excel format"""
-    import pandas as pd
-    import io
-    from flask import make_response
-
-    conn = None
-    cursor = None
-    try:
-        conn = psycopg2.connect(**DB_CONFIG)
-        cursor = conn.cursor(cursor_factory=RealDictCursor)
-        cursor.execute("""
-            SELECT
-                p.product_id,
-                COALESCE(i.item_name, p.item_description) as item_name,
-                COALESCE(cc.cost_code, 'N/A') as cost_code,
-                p.item_description as product_description,
-                p.model,
-                p.brand,
-                p.style,
-                p.color,
-                p.finish,
-                p.size,
-                p.material,
-                p.item_type,
-                p.image_url,
-                p.is_active,
-                p.min_stock_level,
-                COALESCE(p.quantity, 0) as quantity,
-                p.unit_of_measure,
-                p.plan_option_id
-            FROM takeoff.products p
-            LEFT JOIN takeoff.items i ON p.item_id = i.item_id
-            LEFT JOIN takeoff.cost_codes cc ON i.cost_code_id = cc.cost_code_id
-            ORDER BY COALESCE(i.item_name, p.item_description)
-        """)
-        records = cursor.fetchall()
-        df = pd.DataFrame([dict(record) for record in records])
-
-        if format.lower() == 'csv':
-            output = io.StringIO()
-            df.to_csv(output, index=False)
-            response = make_response(output.getvalue())
-            response.headers['Content-Type'] = 'text/csv'
-            response.headers['Content-Disposition'] = 'attachment; filename=products.csv'
-            return response
-        elif format.lower() == 'excel':
-            output = io.BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df.to_excel(writer, sheet_name='Products', index=False)
-            output.seek(0)
-            response = make_response(output.read())
-            response.headers['Content-Type'] = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-            response.headers['Content-Disposition'] = 'attachment; filename=products.xlsx'
-            return response
-        else:
-            return jsonify({'error': 'Invalid format. Use csv or excel'}), 400
-    except Exception as e:
-        if conn:
-            conn.rollback()
-        logger.error(f"Error exporting products: {e}")
-        return jsonify({'error': str(e)}), 500
-    finally:
-        if cursor:
-            cursor.close()
-        if conn:
-            conn.close()
+    """API endpoint to export all products data as CSV, Excel, Parquet or Arrow (see /api/export/products)"""
+    return _grid_export('products', format)
 
 # --- NEW: Products Import Template Endpoint ---
 @app.route('/api/products/template/<format>')
@@ -3499,6 +5451,1615 @@ def api_products_for_dropdown():
     """Legacy endpoint that redirects to /api/products?for_dropdown=true"""
     return api_products_for_lookup()
 
+# ============================================================================
+# == 4.11 IMPORT JOBS ENDPOINTS ============================================
+# ============================================================================
+
+# Imports submitted as jobs run on a small dedicated pool so large workbooks never tie up
+# request workers; each running job holds one database connection.
+IMPORT_JOB_WORKERS = int(os.getenv('IMPORT_JOB_WORKERS', '2'))
+IMPORT_JOB_MAX_QUEUED = int(os.getenv('IMPORT_JOB_MAX_QUEUED', '20'))
+IMPORT_JOB_RETENTION = int(os.getenv('IMPORT_JOB_RETENTION', '3600'))  # Seconds finished jobs stay queryable
+# Multi-file imports parse workbooks in a process pool (Excel parsing is CPU-bound under the GIL)
+IMPORT_PARSE_PROCESSES = int(os.getenv('IMPORT_PARSE_PROCESSES', str(os.cpu_count() or 2)))
+IMPORT_ZIP_MAX_BYTES = int(os.getenv('IMPORT_ZIP_MAX_BYTES', str(500 * 1024 * 1024)))  # Uncompressed
+
+# Import type -> import core, required columns, accepted file extensions and whether the
+# core supports change-detecting sync (mode=sync)
+IMPORT_JOB_KINDS = {
+    'cost-codes': {
+        'import': _import_cost_codes_frame,
+        'required_columns': ['cost_code', 'cost_code_description'],
+        'extensions': ('.xlsx', '.xls', '.csv'),
+        'sync': True
+    },
+    'plan-options': {
+        'import': _import_plan_options_frame,
+        'required_columns': ['plan_full_name', 'option_name'],
+        'extensions': ('.xlsx', '.xls', '.csv')
+    },
+    'products': {
+        'import': _import_products_frame,
+        'required_columns': ['item_description', 'brand', 'model'],
+        'extensions': ('.xlsx', '.xls'),
+        'sync': True
+    },
+    'qty-takeoffs': {
+        'import': _import_qty_takeoffs_frame,
+        'required_columns': ['plan_full_name', 'option_name', 'cost_code', 'item_name', 'item_description', 'quantity_source', 'quantity'],
+        'extensions': ('.xlsx', '.xls', '.csv')
+    }
+}
+
+class BackgroundJob:
+    """State shared by background jobs: status, progress counters, timestamps and cancellation"""
+
+    def __init__(self, progress):
+        self.job_id = uuid.uuid4().hex
+        self.status = 'queued'
+        self.progress = progress
+        self.result = None
+        self.error = None
+        self.created_at = datetime.now()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in ('completed', 'failed', 'cancelled')
+
+    def start(self):
+        self.started_at = datetime.now()
+        self.status = 'running'
+
+    def report(self, **progress):
+        self.progress.update(progress)
+
+    def discard(self):
+        """Release what the job keeps after finishing; called when it is forgotten"""
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'error': self.error,
+            'cancel_requested': self.cancel_requested.is_set(),
+            'created_at': self.created_at.isoformat(),
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None
+        }
+
+class JobRegistry:
+    """
+    Background jobs of one kind: a bounded worker pool, lookup, listing and cancellation.
+    Finished jobs are forgotten IMPORT_JOB_RETENTION seconds after they finish.
+    """
+
+    def __init__(self, label, workers, max_queued, thread_name_prefix):
+        self.label = label  # 'Import job', used in messages
+        self.workers = workers
+        self.max_queued = max_queued
+        self.jobs = {}
+        self.lock = threading.Lock()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=thread_name_prefix)
+
+    def _prune(self):
+        """Forget expired finished jobs (call with self.lock held)"""
+        now = datetime.now()
+        for job_id, job in list(self.jobs.items()):
+            if job.finished and (now - job.finished_at).total_seconds() > IMPORT_JOB_RETENTION:
+                job.discard()
+                del self.jobs[job_id]
+
+    def submit(self, job, run):
+        """Register job and run it on the pool; False (nothing queued) when the queue is full"""
+        with self.lock:
+            self._prune()
+            active = sum(1 for queued in self.jobs.values() if not queued.finished)
+            if active >= self.workers + self.max_queued:
+                return False
+            self.jobs[job.job_id] = job
+        self.executor.submit(run, job)
+        return True
+
+    def finish(self, job, status, error=None):
+        """Record a job's outcome; finished_at is set with the status, as pruning reads both"""
+        with self.lock:
+            job.error = error
+            job.finished_at = datetime.now()
+            job.status = status
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def list(self):
+        """Known jobs, newest first"""
+        with self.lock:
+            self._prune()
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id):
+        """Response of a cancel endpoint: the job stops at its next safe point"""
+        job = self.jobs.get(job_id)
+        if not job:
+            return jsonify({'success': False, 'message': f'{self.label} not found'}), 404
+        if job.finished:
+            return jsonify({'success': False, 'message': f'{self.label} already {job.status}'}), 409
+        job.cancel_requested.set()
+        return jsonify({'success': True, 'job_id': job.job_id, 'status': job.status})
+
+class ImportJob(BackgroundJob):
+    """State of one background import: status, progress counters and the final report"""
+
+    def __init__(self, kind, filename, path, files=None, options=None):
+        super().__init__({'rows_parsed': 0, 'rows_validated': 0, 'rows_written': 0})
+        self.kind = kind
+        self.filename = filename
+        self.options = options or {}  # Keyword arguments for the import core (sync, dry_run)
+        self.path = path  # Upload file, or the temp directory holding a multi-file upload
+        self.files = files  # [(display name, path)] for multi-file imports
+        self.sources = []  # Per file/sheet row ranges of a multi-file import
+
+    def to_dict(self, include_result=True):
+        job = {
+            **super().to_dict(),
+            'kind': self.kind,
+            'filename': self.filename,
+            'options': self.options,
+            'sources': self.sources
+        }
+        if include_result:
+            job['result'] = self.result
+        return job
+
+import_jobs = JobRegistry('Import job', IMPORT_JOB_WORKERS, IMPORT_JOB_MAX_QUEUED, 'import-job')
+import_parse_pool = None
+import_parse_pool_lock = threading.Lock()
+
+def _get_import_parse_pool():
+    """Create the parsing process pool on first use; spawned so workers never inherit server threads"""
+    global import_parse_pool
+    with import_parse_pool_lock:
+        if import_parse_pool is None:
+            import multiprocessing
+
+            import_parse_pool = ProcessPoolExecutor(
+                max_workers=IMPORT_PARSE_PROCESSES, mp_context=multiprocessing.get_context('spawn')
+            )
+        return import_parse_pool
+
+def _list_import_sheets(path, filename):
+    """Sheet names of an uploaded workbook ([None] for CSV, which has a single table)"""
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    name = filename.lower()
+    if name.endswith('.csv'):
+        return [None]
+    if name.endswith('.xls'):
+        return pd.ExcelFile(path).sheet_names
+    workbook = load_workbook(path, read_only=True)
+    try:
+        return workbook.sheetnames
+    finally:
+        workbook.close()
+
+def _parse_import_sheet(path, filename, sheet_name, required_columns):
+    """
+    Process-pool worker: parse one worksheet (or a CSV file) into a NumPy-backed DataFrame
+    indexed by sheet position (sheet row = index + 2). Returns (columns, frame); frame is
+    None when the sheet lacks the import's required columns, so it is not parsed further.
+    """
+    import pandas as pd
+    from openpyxl import load_workbook
+
+    name = filename.lower()
+    if name.endswith(('.csv', '.xls')):
+        df = pd.read_csv(path, encoding='utf-8') if name.endswith('.csv') else pd.read_excel(path, sheet_name=sheet_name)
+        columns = list(df.columns)
+        return columns, df if all(col in columns for col in required_columns) else None
+
+    workbook = load_workbook(path, read_only=True, data_only=True)
+    try:
+        columns, sheet_rows = _xlsx_sheet_rows(workbook[sheet_name])
+        if not all(col in columns for col in required_columns):
+            return columns, None
+        positions, rows = [], []
+        for position, row in sheet_rows:
+            positions.append(position)
+            rows.append(row)
+        return columns, pd.DataFrame(rows, columns=columns, index=positions)
+    finally:
+        workbook.close()
+
+def _parse_import_files_parallel(job, required_columns, batch_size=IMPORT_BATCH_SIZE):
+    """
+    Parse every sheet of every file in a multi-file job on the process pool and yield the
+    rows as DataFrame batches in upload order, so the single writer downstream always sees
+    the same sequence. At most two sheets per process are parsed ahead of the writer.
+    Sheets are numbered onto one running row sequence; job.sources maps ranges back.
+    """
+    import collections
+
+    pool = _get_import_parse_pool()
+    tasks = iter([
+        (filename, path, sheet_name)
+        for filename, path in job.files
+        for sheet_name in _list_import_sheets(path, filename)
+    ])
+    pending = collections.deque()
+
+    def submit_next():
+        task = next(tasks, None)
+        if task:
+            pending.append((task, pool.submit(_parse_import_sheet, task[1], task[0], task[2], required_columns)))
+
+    for _ in range(IMPORT_PARSE_PROCESSES * 2):
+        submit_next()
+
+    offset = 0
+    try:
+        while pending:
+            (filename, _, sheet_name), future = pending.popleft()
+            columns, frame = future.result()
+            submit_next()
+            _check_import_cancelled(job)
+
+            source = filename if sheet_name is None else f'{filename} [{sheet_name}]'
+            if frame is None:
+                missing_columns = [col for col in required_columns if col not in columns]
+                job.sources.append({'source': source, 'skipped': f'Missing required columns: {", ".join(missing_columns)}'})
+                continue
+            last_row = int(frame.index.max()) + 2 if len(frame) else 1
+            job.sources.append({
+                'source': source,
+                'rows': len(frame),
+                'offset': offset,
+                'first_row': offset + 2,
+                'last_row': offset + last_row
+            })
+            frame.index = frame.index + offset
+            offset += last_row
+            for start in range(0, len(frame), batch_size):
+                yield frame.iloc[start:start + batch_size]
+    finally:
+        for _, future in pending:
+            future.cancel()
+
+    if not any('offset' in source for source in job.sources):
+        raise ValueError(f'No sheet has the required columns: {", ".join(required_columns)}')
+
+def _label_import_sources(result, sources):
+    """Rewrite the running "Row N" numbers of a multi-file import as file/sheet rows"""
+    import re
+
+    def label(row_num):
+        for source in sources:
+            if 'offset' in source and source['first_row'] <= row_num <= source['last_row']:
+                return f"{source['source']} row {row_num - source['offset']}"
+        return f'Row {row_num}'
+
+    result['errors'] = [
+        re.sub(r'^Row (\d+)', lambda match: label(int(match.group(1))), str(error))
+        for error in result.get('errors', [])
+    ]
+    for entry in result.get('unresolved', []):
+        entry['source'] = label(entry['row'])
+
+def _extract_import_zip(upload, workdir, extensions, first_number):
+    """
+    Extract the importable files of an uploaded zip, in name order, to numbered temp paths.
+    The declared sizes are checked up front, and the bytes actually written are counted too,
+    so an archive that understates its sizes still stops at IMPORT_ZIP_MAX_BYTES.
+    """
+    import zipfile
+
+    with zipfile.ZipFile(upload.stream) as archive:
+        members = sorted(
+            (
+                member for member in archive.infolist()
+                if not member.is_dir()
+                and member.filename.lower().endswith(extensions)
+                and '__MACOSX' not in member.filename
+                and not os.path.basename(member.filename).startswith(('.', '~$'))
+            ),
+            key=lambda member: member.filename
+        )
+        too_large = f'{upload.filename} is larger than {IMPORT_ZIP_MAX_BYTES // (1024 * 1024)} MB uncompressed'
+        if sum(member.file_size for member in members) > IMPORT_ZIP_MAX_BYTES:
+            raise ValueError(too_large)
+        files = []
+        extracted = 0
+        for member in members:
+            path = os.path.join(workdir, f'{first_number + len(files):04d}{os.path.splitext(member.filename)[1].lower()}')
+            with archive.open(member) as source, open(path, 'wb') as target:
+                while True:
+                    chunk = source.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    extracted += len(chunk)
+                    if extracted > IMPORT_ZIP_MAX_BYTES:
+                        raise ValueError(too_large)
+                    target.write(chunk)
+            files.append((member.filename, path))
+    return files
+
+def _run_import_job(job):
+    """Worker body: stream the saved upload through the import core and record the outcome"""
+    spec = IMPORT_JOB_KINDS[job.kind]
+    conn = None
+    batches = None
+    status, error = 'failed', None
+    try:
+        _check_import_cancelled(job)
+        job.start()
+
+        if job.files is None:
+            columns, batches = _open_import_batches(job.path, job.filename)
+            missing_columns = [col for col in spec['required_columns'] if col not in columns]
+            if missing_columns:
+                raise ValueError(f'Missing required columns: {", ".join(missing_columns)}')
+        else:
+            batches = _parse_import_files_parallel(job, spec['required_columns'])
+
+        def parsed(batches):
+            for batch in batches:
+                job.report(rows_parsed=job.progress['rows_parsed'] + len(batch))
+                yield batch
+
+        conn = psycopg2.connect(**DB_CONFIG)
+        job.result = spec['import'](parsed(batches), conn, job=job, **job.options)
+        if job.files is not None:
+            _label_import_sources(job.result, job.sources)
+        status = 'completed'
+    except ImportCancelled:
+        if conn:
+            conn.rollback()
+        status = 'cancelled'
+    except Exception as e:
+        logger.error(f"Error in {job.kind} import job {job.job_id}: {e}")
+        if conn:
+            conn.rollback()
+        error = str(e)
+    finally:
+        if isinstance(batches, ImportBatches):
+            batches.close()
+        if conn:
+            conn.close()
+        _remove_import_upload(job.path)
+        import_jobs.finish(job, status, error)
+
+def _remove_import_upload(path):
+    """Delete a spooled upload (file or multi-file directory)"""
+    import shutil
+
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+def _queue_import_job(job):
+    """Register and submit a job, or reject it with 429 when the queue is full"""
+    if not import_jobs.submit(job, _run_import_job):
+        _remove_import_upload(job.path)
+        return jsonify({'success': False, 'message': 'Too many imports in progress, try again later'}), 429
+
+    return jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status': job.status,
+        'status_url': url_for('api_import_job', job_id=job.job_id)
+    }), 202
+
+def _import_job_options(kind, spec):
+    """Sync options of a job submission; only import types whose core supports them accept any"""
+    options = _import_sync_options()
+    if options and not spec.get('sync'):
+        raise ValueError(f'mode=sync is not supported for {kind} imports')
+    return options
+
+@app.route('/api/import-jobs/<kind>', methods=['POST'])
+def api_submit_import_job(kind):
+    """API endpoint to queue a file import as a background job; returns the job id immediately"""
+    spec = IMPORT_JOB_KINDS.get(kind)
+    if not spec:
+        return jsonify({'success': False, 'message': f'Unknown import type: {kind}'}), 404
+    try:
+        options = _import_job_options(kind, spec)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if 'file' not in request.files:
+        return jsonify({'success': False, 'message': 'No file uploaded'}), 400
+    file = request.files['file']
+    if file.filename == '':
+        return jsonify({'success': False, 'message': 'No file selected'}), 400
+    if not file.filename.lower().endswith(spec['extensions']):
+        return jsonify({'success': False, 'message': f'Invalid file format. Please upload a {", ".join(spec["extensions"])} file'}), 400
+
+    # Spool the upload to disk so the request returns before the workbook is parsed
+    fd, path = tempfile.mkstemp(prefix='import-', suffix=os.path.splitext(file.filename)[1])
+    os.close(fd)
+    file.save(path)
+    return _queue_import_job(ImportJob(kind, file.filename, path, options=options))
+
+@app.route('/api/import-jobs/<kind>/batch', methods=['POST'])
+def api_submit_import_batch_job(kind):
+    """
+    API endpoint to queue several workbooks (multipart "files", each may be a .zip of them) as
+    one import job. Sheets are parsed in parallel and written in upload order by one writer;
+    sheets without the import's required columns are skipped and listed in the job's sources.
+    """
+    import zipfile
+
+    spec = IMPORT_JOB_KINDS.get(kind)
+    if not spec:
+        return jsonify({'success': False, 'message': f'Unknown import type: {kind}'}), 404
+    try:
+        options = _import_job_options(kind, spec)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    uploads = [upload for upload in request.files.getlist('files') + request.files.getlist('file') if upload.filename]
+    if not uploads:
+        return jsonify({'success': False, 'message': 'No files uploaded'}), 400
+
+    workdir = tempfile.mkdtemp(prefix='import-')
+    files = []
+    try:
+        for upload in uploads:
+            name = upload.filename.lower()
+            if name.endswith('.zip'):
+                files.extend(_extract_import_zip(upload, workdir, spec['extensions'], len(files)))
+            elif name.endswith(spec['extensions']):
+                path = os.path.join(workdir, f'{len(files):04d}{os.path.splitext(name)[1]}')
+                upload.save(path)
+                files.append((upload.filename, path))
+            else:
+                raise ValueError(f'Invalid file format: {upload.filename}. Please upload {", ".join(spec["extensions"])} or .zip files')
+        if not files:
+            raise ValueError('No importable files found in the upload')
+    except (ValueError, zipfile.BadZipFile) as e:
+        _remove_import_upload(workdir)
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    return _queue_import_job(ImportJob(
+        kind, ', '.join(filename for filename, _ in files), workdir, files=files, options=options
+    ))
+
+@app.route('/api/import-jobs')
+def api_import_jobs():
+    """API endpoint to list recent import jobs (newest first) without their error reports"""
+    return jsonify([job.to_dict(include_result=False) for job in import_jobs.list()])
+
+@app.route('/api/import-jobs/<job_id>')
+def api_import_job(job_id):
+    """API endpoint to get an import job's progress and, once finished, its full report"""
+    job = import_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/import-jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_import_job(job_id):
+    """API endpoint to cancel an import job; nothing is committed once cancellation is seen"""
+    return import_jobs.cancel(job_id)
+
+# ============================================================================
+# == 4.12 GRID EXPORT ENDPOINTS ============================================
+# ============================================================================
+
+# Exportable grids. Each lists its row source (a SELECT without ORDER BY), the type of every
+# exportable column ('text', 'number', 'date' or 'bool'; filters are checked against these
+# names), its default order (ending in a unique, non-null column, so the order is total), the
+# tables it reads (for the export cache) and the file and
+# sheet names. Columns are exported in the order listed unless the grid sends its own. A
+# column whose grid filters on a filterValueGetter lists the SQL of that value under
+# 'filter_values'; it is filtered as text. The server-side row model endpoint (4.14) serves
+# the same grids under the same rules.
+GRID_EXPORTS = {
+    'cost-codes': {
+        'source': "SELECT * FROM takeoff.v_cost_codes_with_groups",
+        'columns': {
+            'cost_code_id': 'number', 'cost_group_id': 'number', 'cost_code': 'text',
+            'cost_code_description': 'text', 'cost_group_code': 'text', 'cost_group_name': 'text'
+        },
+        'order_by': ['cost_code', 'cost_code_id'],
+        'tables': ['cost_codes', 'cost_groups'],
+        'name': 'cost_codes_with_groups',
+        'sheet_name': 'Cost Codes'
+    },
+    'plan-options': {
+        'source': """
+            SELECT
+                po.plan_option_id,
+                po.plan_elevation_id,
+                pe.plan_full_name,
+                po.option_name,
+                po.option_type,
+                po.option_description,
+                po.bedroom_count,
+                po.bathroom_count,
+                po.heated_sf_inside_studs,
+                po.heated_sf_outside_studs,
+                po.heated_sf_outside_veneer,
+                po.unheated_sf_inside_studs,
+                po.unheated_sf_outside_studs,
+                po.unheated_sf_outside_veneer,
+                po.total_sf_inside_studs,
+                po.total_sf_outside_studs,
+                po.total_sf_outside_veneer,
+                po.created_date,
+                po.modified_date
+            FROM takeoff.plan_options po
+            JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+        """,
+        # Every column of templates/plan_options_grid.html
+        'columns': {
+            'plan_option_id': 'number', 'plan_elevation_id': 'number', 'plan_full_name': 'text',
+            'option_name': 'text', 'option_type': 'text', 'option_description': 'text',
+            'bedroom_count': 'number', 'bathroom_count': 'number',
+            'heated_sf_inside_studs': 'number', 'heated_sf_outside_studs': 'number',
+            'heated_sf_outside_veneer': 'number', 'unheated_sf_inside_studs': 'number',
+            'unheated_sf_outside_studs': 'number', 'unheated_sf_outside_veneer': 'number',
+            'total_sf_inside_studs': 'number', 'total_sf_outside_studs': 'number',
+            'total_sf_outside_veneer': 'number', 'created_date': 'date', 'modified_date': 'date'
+        },
+        'order_by': ['plan_option_id'],
+        'tables': ['plan_options', 'plan_elevations'],
+        'name': 'plan_options',
+        'sheet_name': 'Plan Options'
+    },
+    'qty-takeoffs': {
+        # The columns of the api_qty_takeoffs endpoint, in the order of the original export with
+        # calculated_quantity after the plan. calculated_quantity is the quantity extended_price
+        # is priced on (before price_factor), as in v_comprehensive_takeoff_analysis: the
+        # formula's measurement or stored result, else the entered quantity
+        'source': """
+            SELECT
+                t.takeoff_id,
+                t.plan_option_id,
+                po.option_name,
+                pe.plan_full_name,
+                COALESCE(pm.measure_value, t.calculated_quantity, t.quantity, 0) AS calculated_quantity,
+                t.cost_code_id,
+                cc.cost_code,
+                t.item_id,
+                i.item_name,
+                t.item_description,
+                t.quantity_source,
+                t.quantity,
+                t.unit_price,
+                t.price_factor,
+                t.unit_of_measure,
+                t.extended_price,
+                t.vendor_id,
+                v.vendor_name,
+                t.notes,
+                t.job_name,
+                t.job_number,
+                t.lot_number,
+                t.customer_name,
+                t.room,
+                t.spec_name,
+                t.job_id,
+                t.product_id
+            FROM takeoff.takeoffs t
+            LEFT JOIN takeoff.plan_options po ON t.plan_option_id = po.plan_option_id
+            LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+            LEFT JOIN takeoff.cost_codes cc ON t.cost_code_id = cc.cost_code_id
+            LEFT JOIN takeoff.items i ON t.item_id = i.item_id
+            LEFT JOIN takeoff.plan_option_measurements pm
+                ON pm.plan_option_id = t.plan_option_id
+                AND pm.measure_name = NULLIF(i.qty_formula, '')
+            LEFT JOIN takeoff.vendors v ON t.vendor_id = v.vendor_id
+        """,
+        'columns': {
+            'takeoff_id': 'number', 'plan_option_id': 'number', 'option_name': 'text',
+            'plan_full_name': 'text', 'calculated_quantity': 'number', 'cost_code_id': 'number',
+            'cost_code': 'text', 'item_id': 'number', 'item_name': 'text', 'item_description': 'text',
+            'quantity_source': 'text', 'quantity': 'number', 'unit_price': 'number',
+            'price_factor': 'number', 'unit_of_measure': 'text', 'extended_price': 'number',
+            'vendor_id': 'number', 'vendor_name': 'text', 'notes': 'text', 'job_name': 'text',
+            'job_number': 'text', 'lot_number': 'text', 'customer_name': 'text', 'room': 'text',
+            'spec_name': 'text', 'job_id': 'number', 'product_id': 'number'
+        },
+        # The Plan Option column filters on its "plan – option" label
+        'filter_values': {
+            'plan_option_id': "COALESCE(grid_rows.plan_full_name || ' – ' || grid_rows.option_name, grid_rows.plan_option_id::text)"
+        },
+        'order_by': ['takeoff_id'],
+        'tables': ['takeoffs', 'plan_options', 'plan_elevations', 'cost_codes', 'items', 'vendors'],
+        'name': 'qty_takeoffs',
+        'sheet_name': 'Qty Takeoffs'
+    },
+    'products': {
+        'source': """
+            SELECT
+                p.product_id,
+                COALESCE(i.item_name, p.item_description) as item_name,
+                COALESCE(cc.cost_code, 'N/A') as cost_code,
+                p.item_description as product_description,
+                p.model,
+                p.brand,
+                p.style,
+                p.color,
+                p.finish,
+                p.size,
+                p.material,
+                p.item_type,
+                p.image_url,
+                p.is_active,
+                p.min_stock_level,
+                COALESCE(p.quantity, 0) as quantity,
+                p.unit_of_measure,
+                p.plan_option_id
+            FROM takeoff.products p
+            LEFT JOIN takeoff.items i ON p.item_id = i.item_id
+            LEFT JOIN takeoff.cost_codes cc ON i.cost_code_id = cc.cost_code_id
+        """,
+        'columns': {
+            'product_id': 'number', 'item_name': 'text', 'cost_code': 'text',
+            'product_description': 'text', 'model': 'text', 'brand': 'text', 'style': 'text',
+            'color': 'text', 'finish': 'text', 'size': 'text', 'material': 'text',
+            'item_type': 'text', 'image_url': 'text', 'is_active': 'bool',
+            'min_stock_level': 'number', 'quantity': 'number', 'unit_of_measure': 'text',
+            'plan_option_id': 'number'
+        },
+        'order_by': ['item_name', 'product_id'],
+        'tables': ['products', 'items', 'cost_codes'],
+        'name': 'products',
+        'sheet_name': 'Products'
+    },
+    'comprehensive-takeoff-analysis': {
+        'source': "SELECT * FROM takeoff.comprehensive_takeoff_summary",
+        'columns': {
+            'takeoff_id': 'number', 'plan_full_name': 'text', 'option_name': 'text',
+            'cost_code': 'text', 'item_name': 'text', 'item_description': 'text',
+            'quantity_source': 'text', 'quantity': 'number', 'unit_price': 'number',
+            'price_factor': 'number', 'unit_of_measure': 'text', 'calculated_quantity': 'number',
+            'extended_price': 'number', 'vendor_name': 'text', 'job_name': 'text',
+            'job_number': 'text', 'lot_number': 'text', 'customer_name': 'text', 'room': 'text',
+            'spec_name': 'text', 'notes': 'text', 'job_id': 'number', 'product_id': 'number',
+            'vendor_id': 'number', 'plan_option_id': 'number', 'item_id': 'number',
+            'cost_code_id': 'number', 'created_date': 'date', 'updated_date': 'date'
+        },
+        'order_by': ['cost_code', 'item_name', 'takeoff_id'],
+        # The summary's source tables, and the nightly price book expiry (migration 040)
+        'tables': [
+            'takeoffs', 'plan_options', 'plan_elevations', 'items', 'cost_codes',
+            'products', 'vendor_pricing', 'vendors', 'jobs', 'current_price_book'
+        ],
+        'name': 'comprehensive_takeoff_analysis',
+        'sheet_name': 'Takeoff Analysis'
+    }
+}
+
+# AG-Grid number/date filter types -> SQL comparison
+GRID_FILTER_OPERATORS = {
+    'equals': '=', 'notEqual': '<>', 'lessThan': '<', 'lessThanOrEqual': '<=',
+    'greaterThan': '>', 'greaterThanOrEqual': '>='
+}
+
+def _grid_like_pattern(value, filter_type):
+    """ILIKE pattern for an AG-Grid text filter value, with LIKE wildcards escaped"""
+    escaped = str(value).replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    if filter_type in ('contains', 'notContains'):
+        return f'%{escaped}%'
+    if filter_type == 'startsWith':
+        return f'{escaped}%'
+    if filter_type == 'endsWith':
+        return f'%{escaped}'
+    return escaped
+
+def _grid_set_value(column, column_type, value):
+    """A set filter value as a SQL parameter of the column's type; ValueError if it is not one"""
+    import math
+    from email.utils import parsedate_to_datetime
+
+    text = str(value).strip()
+    try:
+        if column_type == 'number':
+            # NUMERIC columns hold no infinities, and NaN matches nothing a grid shows
+            if not math.isfinite(float(text)):
+                raise ValueError(text)
+            return text
+        if column_type == 'bool':
+            if text.lower() not in ('true', 'false'):
+                raise ValueError(text)
+            return text.lower()
+        if column_type == 'date':
+            # Grid rows carry dates as jsonify writes them (RFC 1123), or ISO from a date filter
+            try:
+                parsed = datetime.fromisoformat(text)
+            except ValueError:
+                parsed = parsedate_to_datetime(text)
+            return parsed.replace(tzinfo=None).isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f'Invalid {column_type} value in set filter for {column}: {value}')
+    return text
+
+def _grid_filter_sql(column, column_type, model, params, ref=None):
+    """
+    Translate one column's AG-Grid filter model into a SQL condition on grid_rows.<column>
+    (or on ref, the SQL of the column's filter value), appending its values to params.
+    Handles set, text, number and date filters, combined conditions (AND/OR) and multi
+    filters, matching the grid's client-side semantics: text matching is case-insensitive
+    and negative text filters keep blank cells. Raises ValueError for anything it does not
+    understand, including set values not of the column's type, rather than exporting
+    unfiltered or wrongly filtered rows.
+    """
+    import math
+
+    ref = ref or f'grid_rows.{column}'
+    if not isinstance(model, dict):
+        raise ValueError(f'Invalid filter for {column}')
+
+    if model.get('operator'):
+        conditions = model.get('conditions') or [model.get('condition1'), model.get('condition2')]
+        joiner = {'AND': ' AND ', 'OR': ' OR '}.get(str(model['operator']).upper())
+        if not joiner:
+            raise ValueError(f"Invalid filter operator for {column}: {model['operator']}")
+        parts = [
+            _grid_filter_sql(column, column_type, {'filterType': model.get('filterType'), **condition}, params, ref)
+            for condition in conditions if condition
+        ]
+        return f"({joiner.join(parts)})" if parts else 'TRUE'
+
+    filter_type = model.get('filterType')
+    if filter_type == 'multi':
+        parts = [_grid_filter_sql(column, column_type, sub_model, params, ref) for sub_model in model.get('filterModels') or [] if sub_model]
+        return f"({' AND '.join(parts)})" if parts else 'TRUE'
+
+    if filter_type == 'set':
+        values = model.get('values') or []
+        params.append([_grid_set_value(column, column_type, value) for value in values if value is not None])
+        if column_type == 'number':
+            condition = f'{ref} = ANY(%s::numeric[])'
+        elif column_type == 'date':
+            # jsonify drops fractions of a second
+            condition = f"date_trunc('second', {ref}::timestamp) = ANY(%s::timestamp[])"
+        elif column_type == 'bool':
+            condition = f'{ref} = ANY(%s::boolean[])'
+        else:
+            condition = f'{ref} = ANY(%s)'
+        return f'({condition} OR {ref} IS NULL)' if None in values else condition
+
+    condition_type = model.get('type')
+    if condition_type == 'blank':
+        return f"({ref} IS NULL OR {ref}::text = '')"
+    if condition_type == 'notBlank':
+        return f"({ref} IS NOT NULL AND {ref}::text <> '')"
+
+    if filter_type == 'text':
+        if condition_type not in ('contains', 'notContains', 'equals', 'notEqual', 'startsWith', 'endsWith'):
+            raise ValueError(f'Invalid text filter for {column}: {condition_type}')
+        params.append(_grid_like_pattern(model.get('filter', ''), condition_type))
+        if condition_type in ('notContains', 'notEqual'):
+            return f"({ref} IS NULL OR {ref}::text NOT ILIKE %s)"
+        return f"{ref}::text ILIKE %s"
+
+    if filter_type in ('number', 'date'):
+        if filter_type == 'number':
+            cast = 'numeric'
+            bounds = [model.get('filter'), model.get('filterTo')]
+            try:
+                bounds = [float(bound) if bound is not None else None for bound in bounds]
+            except (TypeError, ValueError):
+                raise ValueError(f'Invalid number filter for {column}')
+            if not all(bound is None or math.isfinite(bound) for bound in bounds):
+                raise ValueError(f'Invalid number filter for {column}')
+        else:
+            cast = 'date'
+            bounds = [model.get('dateFrom'), model.get('dateTo')]
+            bounds = [str(bound)[:10] if bound else None for bound in bounds]
+        if condition_type == 'inRange':
+            # AG-Grid ranges exclude both ends by default
+            params.extend(bounds)
+            return f'({ref}::{cast} > %s::{cast} AND {ref}::{cast} < %s::{cast})'
+        if condition_type not in GRID_FILTER_OPERATORS or bounds[0] is None:
+            raise ValueError(f'Invalid {filter_type} filter for {column}: {condition_type}')
+        params.append(bounds[0])
+        condition = f'{ref}::{cast} {GRID_FILTER_OPERATORS[condition_type]} %s::{cast}'
+        return f'({ref} IS NULL OR {condition})' if condition_type == 'notEqual' else condition
+
+    raise ValueError(f'Unsupported filter type for {column}: {filter_type}')
+
+def _grid_conditions(spec, state, params):
+    """
+    WHERE conditions on grid_rows for a grid state's filterModel and quickFilterText,
+    appending their values to params. Only the grid's registered columns can be filtered.
+    """
+    known = spec['columns']
+    filter_values = spec.get('filter_values', {})
+    conditions = []
+    for column, model in (state.get('filterModel') or {}).items():
+        if column not in known:
+            raise ValueError(f'Cannot filter on unknown column: {column}')
+        if column in filter_values:
+            conditions.append(_grid_filter_sql(column, 'text', model, params, filter_values[column]))
+        else:
+            conditions.append(_grid_filter_sql(column, known[column], model, params))
+    # Quick filter: every word must appear in some column, as in the grid
+    for word in str(state.get('quickFilterText') or '').split():
+        params.extend([_grid_like_pattern(word, 'contains')] * len(known))
+        conditions.append('(' + ' OR '.join(f'grid_rows.{column}::text ILIKE %s' for column in known) + ')')
+    return conditions
+
+def _grid_sort(sort, columns):
+    """ORDER BY term for one sortModel entry; the column must be one of columns"""
+    column = sort.get('colId') if isinstance(sort, dict) else None
+    if not isinstance(column, str) or column not in columns:
+        raise ValueError(f'Cannot sort on unknown column: {column}')
+    return f"grid_rows.{column} {'DESC' if sort.get('sort') == 'desc' else 'ASC'}"
+
+def _grid_visible_columns(columns, known):
+    """
+    Registered fields among a grid's visible columns (column ids or AG-Grid column
+    descriptors), in display order; every registered column when none are sent. Unknown ids
+    are skipped, since grids also show action and checkbox columns.
+    """
+    fields = []
+    for column in columns or []:
+        field = column.get('field') or column.get('id') if isinstance(column, dict) else column
+        if isinstance(field, str) and field in known:
+            fields.append(field)
+    return fields or list(known)
+
+def _grid_export_query(spec, state):
+    """
+    Build (query, params) for a grid export from the grid's state: filterModel and
+    quickFilterText become the WHERE clause, sortModel the ORDER BY (the grid's default order
+    breaks ties) and columns (the visible column ids, in display order) the projection. Only
+    the grid's registered columns are accepted in filters and sorts; unknown column ids in
+    columns are skipped, since grids also show action and checkbox columns.
+    """
+    known = spec['columns']
+    params = []
+
+    columns = _grid_visible_columns(state.get('columns'), known)
+    conditions = _grid_conditions(spec, state, params)
+    order_by = [_grid_sort(sort, known) for sort in state.get('sortModel') or []]
+    order_by += [f'grid_rows.{column}' for column in spec['order_by']]
+
+    query = (
+        f"SELECT {', '.join(f'grid_rows.{column}' for column in columns)} "
+        f"FROM ({spec['source']}) AS grid_rows"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else '')
+        + f" ORDER BY {', '.join(order_by)}"
+    )
+    return query, params
+
+def _grid_export(grid, format, state=None):
+    """Export a registered grid in any export format, limited to the grid's current view"""
+    spec = GRID_EXPORTS.get(grid)
+    if not spec:
+        return jsonify({'error': f'Unknown grid: {grid}'}), 404
+    try:
+        query, params = _grid_export_query(spec, state or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        return _export_query(query, spec['name'], spec['sheet_name'], format, params, tables=spec['tables'])
+    except Exception as e:
+        logger.error(f"Error exporting {grid}: {e}")
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/export/<grid>/<format>', methods=['GET', 'POST'])
+def api_grid_export(grid, format):
+    """
+    API endpoint to export what a grid currently shows. The grid state ({"filterModel": ...,
+    "sortModel": [...], "columns": [...], "quickFilterText": "..."}) comes as a JSON body, or
+    as a "state" form field / query parameter so plain form posts and links can download.
+    """
+    import json
+
+    state = request.get_json(silent=True)
+    if state is None:
+        raw_state = request.values.get('state')
+        try:
+            state = json.loads(raw_state) if raw_state else {}
+        except ValueError:
+            return jsonify({'error': 'state must be JSON'}), 400
+    if not isinstance(state, dict):
+        return jsonify({'error': 'state must be a JSON object'}), 400
+    return _grid_export(grid, format, state)
+
+# ============================================================================
+# == 4.13 ESTIMATE WORKBOOK ENDPOINTS =====================================
+# ============================================================================
+
+# Estimate workbooks: takeoffs of a plan option or job grouped by cost group and cost code,
+# with extended price subtotals. A summary sheet lists every cost code total and each cost
+# group gets its own sheet of line items. Batches run as background jobs; the workbooks of a
+# batch are rendered in parallel on the worker process pool and downloaded as one zip.
+ESTIMATE_JOB_WORKERS = int(os.getenv('ESTIMATE_JOB_WORKERS', '1'))
+ESTIMATE_JOB_MAX_QUEUED = int(os.getenv('ESTIMATE_JOB_MAX_QUEUED', '10'))
+ESTIMATE_JOB_MAX_TARGETS = int(os.getenv('ESTIMATE_JOB_MAX_TARGETS', '200'))  # Plan options/jobs per batch
+
+# Estimate scope -> request field, takeoff column and the query for each target's title rows
+ESTIMATE_SCOPES = {
+    'plan-option': {
+        'ids_field': 'plan_option_ids',
+        'column': 'plan_option_id',
+        'titles_sql': """
+            SELECT po.plan_option_id, pe.plan_full_name, po.option_name, po.option_description
+            FROM takeoff.plan_options po
+            LEFT JOIN takeoff.plan_elevations pe ON po.plan_elevation_id = pe.plan_elevation_id
+            WHERE po.plan_option_id = ANY(%s)
+        """,
+        'labels': ['Plan', 'Option', 'Description']
+    },
+    'job': {
+        'ids_field': 'job_ids',
+        'column': 'job_id',
+        'titles_sql': """
+            SELECT j.job_id, j.job_name, j.job_number, j.lot_number, j.customer_name
+            FROM takeoff.jobs j
+            WHERE j.job_id = ANY(%s)
+        """,
+        'labels': ['Job', 'Job Number', 'Lot', 'Customer']
+    }
+}
+
+# Line items of every target in one pass, in workbook order ({column} comes from ESTIMATE_SCOPES)
+ESTIMATE_LINES_SQL = """
+    SELECT
+        v.{column} AS estimate_target,
+        COALESCE(cg.cost_group_code, '') AS cost_group_code,
+        COALESCE(cg.cost_group_name, 'Unassigned') AS cost_group_name,
+        COALESCE(v.cost_code, '') AS cost_code,
+        cc.cost_code_description,
+        v.item_name,
+        v.item_description,
+        v.quantity_source,
+        -- The quantity extended_price is priced on (a formula's result, else the entered one)
+        v.calculated_quantity AS quantity,
+        v.unit_of_measure,
+        v.unit_price,
+        v.price_factor,
+        v.extended_price,
+        v.vendor_name,
+        v.room,
+        v.notes
+    FROM takeoff.comprehensive_takeoff_summary v
+    LEFT JOIN takeoff.cost_codes cc ON cc.cost_code = v.cost_code
+    LEFT JOIN takeoff.cost_groups cg ON cg.cost_group_id = cc.cost_group_id
+    WHERE v.{column} = ANY(%s)
+    ORDER BY v.{column}, cg.cost_group_code NULLS LAST, v.cost_code NULLS LAST, v.item_name, v.takeoff_id
+"""
+ESTIMATE_LINE_HEADERS = [
+    'Cost Code', 'Item', 'Description', 'Qty Source', 'Quantity', 'UOM',
+    'Unit Price', 'Price Factor', 'Extended Price', 'Vendor', 'Room', 'Notes'
+]
+
+def _estimate_sheet_name(name, used):
+    """Excel-safe, unique sheet name (max 31 characters, no []:*?/\\)"""
+    import re
+
+    base = re.sub(r'\s+', ' ', re.sub(r'[\[\]:*?/\\]', ' ', name)).strip()[:31] or 'Sheet'
+    candidate, number = base, 2
+    while candidate.lower() in used:
+        suffix = f' ({number})'
+        candidate, number = base[:31 - len(suffix)] + suffix, number + 1
+    used.add(candidate.lower())
+    return candidate
+
+def _render_estimate_workbook(path, title_rows, lines):
+    """
+    Process-pool worker: write one estimate workbook to path. lines are ESTIMATE_LINES_SQL
+    rows without the target column, already ordered by cost group and cost code. Returns
+    the line, cost group and extended price totals for the job report.
+    """
+    import itertools
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    money = '#,##0.00'
+    number = '#,##0.00##'
+    workbook = Workbook(write_only=True)
+
+    def cell(sheet, value, bold=False, number_format=None):
+        written = WriteOnlyCell(sheet, value=value)
+        if bold:
+            written.font = Font(bold=True)
+        if number_format and value is not None:
+            written.number_format = number_format
+        return written
+
+    def widths(sheet, values):
+        for position, width in enumerate(values, start=1):
+            sheet.column_dimensions[get_column_letter(position)].width = width
+
+    def total(rows):
+        return sum((row[11] or 0) for row in rows)
+
+    groups = [
+        (code, name, list(rows))
+        for (code, name), rows in itertools.groupby(lines, key=lambda row: (row[0], row[1]))
+    ]
+    grand_total = total(lines)
+
+    summary = workbook.create_sheet('Summary')
+    widths(summary, [16, 30, 14, 40, 12, 16])
+    summary.append([cell(summary, 'Estimate', bold=True)])
+    for label, value in title_rows:
+        summary.append([label, value])
+    summary.append(['Generated', datetime.now().strftime('%Y-%m-%d %H:%M')])
+    summary.append([])
+    summary.append([
+        cell(summary, header, bold=True)
+        for header in ['Cost Group', 'Cost Group Name', 'Cost Code', 'Cost Code Description', 'Line Items', 'Extended Price']
+    ])
+    for code, name, rows in groups:
+        for cost_code, code_rows in itertools.groupby(rows, key=lambda row: row[2]):
+            code_rows = list(code_rows)
+            summary.append([
+                code, name, cost_code, code_rows[0][3], len(code_rows),
+                cell(summary, total(code_rows), number_format=money)
+            ])
+        summary.append([
+            cell(summary, f'{code} {name} Subtotal'.strip(), bold=True), None, None, None,
+            cell(summary, len(rows), bold=True), cell(summary, total(rows), bold=True, number_format=money)
+        ])
+    summary.append([
+        cell(summary, 'Grand Total', bold=True), None, None, None,
+        cell(summary, len(lines), bold=True), cell(summary, grand_total, bold=True, number_format=money)
+    ])
+
+    used = {'summary'}
+    for code, name, rows in groups:
+        sheet = workbook.create_sheet(_estimate_sheet_name(f'{code} {name}'.strip(), used))
+        widths(sheet, [14, 28, 40, 14, 12, 8, 12, 12, 16, 24, 16, 30])
+        sheet.append([cell(sheet, f'{code} {name}'.strip(), bold=True)])
+        sheet.append([cell(sheet, header, bold=True) for header in ESTIMATE_LINE_HEADERS])
+        for cost_code, code_rows in itertools.groupby(rows, key=lambda row: row[2]):
+            code_rows = list(code_rows)
+            for row in code_rows:
+                sheet.append([
+                    row[2], row[4], row[5], row[6],
+                    cell(sheet, row[7], number_format=number), row[8],
+                    cell(sheet, row[9], number_format=money), cell(sheet, row[10], number_format=number),
+                    cell(sheet, row[11], number_format=money), row[12], row[13], row[14]
+                ])
+            sheet.append(
+                [cell(sheet, f'Subtotal {cost_code}'.strip(), bold=True)] + [None] * 7
+                + [cell(sheet, total(code_rows), bold=True, number_format=money)]
+            )
+        sheet.append(
+            [cell(sheet, 'Total', bold=True)] + [None] * 7
+            + [cell(sheet, total(rows), bold=True, number_format=money)]
+        )
+
+    workbook.save(path)
+    return {'line_items': len(lines), 'cost_groups': len(groups), 'extended_price': float(grand_total)}
+
+class EstimateJob(BackgroundJob):
+    """State of one background estimate batch and, once completed, its workbook or zip"""
+
+    def __init__(self, scope, ids):
+        super().__init__({'estimates_total': len(ids), 'estimates_rendered': 0})
+        self.scope = scope
+        self.ids = ids
+        self.workdir = tempfile.mkdtemp(prefix='estimate-')
+        self.output_path = None
+        self.output_name = None
+
+    def discard(self):
+        import shutil
+
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def to_dict(self):
+        return {
+            **super().to_dict(),
+            'scope': self.scope,
+            'ids': self.ids,
+            'result': self.result,
+            'download_url': url_for('api_download_estimate_job', job_id=self.job_id) if self.status == 'completed' else None
+        }
+
+estimate_jobs = JobRegistry('Estimate job', ESTIMATE_JOB_WORKERS, ESTIMATE_JOB_MAX_QUEUED, 'estimate-job')
+
+def _estimate_lines(conn, scope, ids):
+    """Yield (target id, line rows) for every target with takeoffs, from one server-side cursor"""
+    import itertools
+
+    cursor = conn.cursor(name='estimate_lines')
+    cursor.itersize = EXPORT_FETCH_SIZE
+    try:
+        cursor.execute(ESTIMATE_LINES_SQL.format(column=ESTIMATE_SCOPES[scope]['column']), (ids,))
+        for target, rows in itertools.groupby(cursor, key=lambda row: row[0]):
+            yield target, [row[1:] for row in rows]
+    finally:
+        cursor.close()
+
+def _run_estimate_job(job):
+    """Worker body: read every target's takeoffs in one query, render workbooks in parallel, package"""
+    import re
+    import zipfile
+
+    spec = ESTIMATE_SCOPES[job.scope]
+    conn = None
+    pending = {}
+    status, error = 'failed', None
+    try:
+        if job.cancel_requested.is_set():
+            status = 'cancelled'
+            return
+        job.start()
+
+        conn = psycopg2.connect(**DB_CONFIG)
+        with conn.cursor() as cursor:
+            cursor.execute(spec['titles_sql'], (job.ids,))
+            titles = {row[0]: row[1:] for row in cursor.fetchall()}
+        missing = [target for target in job.ids if target not in titles]
+        targets = [target for target in job.ids if target in titles]
+        if not targets:
+            raise ValueError(f'No {job.scope.replace("-", " ")}s found for ids: {", ".join(map(str, job.ids))}')
+
+        names, used = {}, set()
+        for target in targets:
+            name = re.sub(r'[^\w.-]+', '_', ' '.join(str(part) for part in titles[target][:2] if part)).strip('_')
+            name = name or f'{job.scope}_{target}'
+            while name.lower() in used:
+                name = f'{name}_{target}'
+            used.add(name.lower())
+            names[target] = name
+
+        pool = _get_import_parse_pool()
+
+        def render(target, lines):
+            title_rows = list(zip(spec['labels'], titles[target]))
+            path = os.path.join(job.workdir, f'{names[target]}.xlsx')
+            pending[target] = pool.submit(_render_estimate_workbook, path, title_rows, lines)
+
+        # Each workbook starts rendering as soon as its rows have been read; a target
+        # without takeoffs still gets a workbook (an empty summary)
+        for target, lines in _estimate_lines(conn, job.scope, targets):
+            render(target, lines)
+        for target in targets:
+            if target not in pending:
+                render(target, [])
+
+        estimates = []
+        for target in targets:
+            if job.cancel_requested.is_set():
+                status = 'cancelled'
+                return
+            estimate = pending.pop(target).result()
+            estimates.append({job.scope.replace('-', '_') + '_id': target, 'file': f'{names[target]}.xlsx', **estimate})
+            job.progress['estimates_rendered'] += 1
+
+        if len(targets) == 1:
+            job.output_name = f'{names[targets[0]]}_estimate.xlsx'
+            job.output_path = os.path.join(job.workdir, f'{names[targets[0]]}.xlsx')
+        else:
+            job.output_name = f'estimates_{datetime.now().strftime("%Y%m%d_%H%M%S")}.zip'
+            job.output_path = os.path.join(job.workdir, 'estimates.zip')
+            # Workbooks are already deflated, so they are stored as is
+            with zipfile.ZipFile(job.output_path, 'w', zipfile.ZIP_STORED) as archive:
+                for estimate in estimates:
+                    archive.write(os.path.join(job.workdir, estimate['file']), estimate['file'])
+
+        job.result = {
+            'estimates': estimates,
+            'missing_ids': missing,
+            'extended_price': sum(estimate['extended_price'] for estimate in estimates)
+        }
+        status = 'completed'
+    except Exception as e:
+        logger.error(f"Error in estimate job {job.job_id}: {e}")
+        error = str(e)
+    finally:
+        for future in pending.values():
+            future.cancel()
+        if conn:
+            conn.close()
+        if status != 'completed':
+            job.discard()
+        estimate_jobs.finish(job, status, error)
+
+@app.route('/api/estimate-jobs', methods=['POST'])
+def api_submit_estimate_job():
+    """
+    API endpoint to queue estimate workbooks for plan options ({"plan_option_ids": [...]}) or
+    jobs ({"job_ids": [...]}); returns the job id immediately. One id downloads as a single
+    workbook, several as a zip with one workbook each.
+    """
+    data = request.get_json(silent=True) or {}
+    scopes = [scope for scope, spec in ESTIMATE_SCOPES.items() if data.get(spec['ids_field'])]
+    if len(scopes) != 1:
+        return jsonify({'success': False, 'message': 'Provide either plan_option_ids or job_ids'}), 400
+    scope = scopes[0]
+    try:
+        ids = list(dict.fromkeys(int(value) for value in _as_list(data[ESTIMATE_SCOPES[scope]['ids_field']])))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Ids must be integers'}), 400
+    if len(ids) > ESTIMATE_JOB_MAX_TARGETS:
+        return jsonify({'success': False, 'message': f'At most {ESTIMATE_JOB_MAX_TARGETS} estimates per job'}), 400
+
+    job = EstimateJob(scope, ids)
+    if not estimate_jobs.submit(job, _run_estimate_job):
+        job.discard()
+        return jsonify({'success': False, 'message': 'Too many estimates in progress, try again later'}), 429
+
+    return jsonify({
+        'success': True,
+        'job_id': job.job_id,
+        'status': job.status,
+        'status_url': url_for('api_estimate_job', job_id=job.job_id)
+    }), 202
+
+@app.route('/api/estimate-jobs')
+def api_estimate_jobs():
+    """API endpoint to list recent estimate jobs (newest first)"""
+    return jsonify([job.to_dict() for job in estimate_jobs.list()])
+
+@app.route('/api/estimate-jobs/<job_id>')
+def api_estimate_job(job_id):
+    """API endpoint to get an estimate job's progress and, once finished, its totals"""
+    job = estimate_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Estimate job not found'}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/api/estimate-jobs/<job_id>/download')
+def api_download_estimate_job(job_id):
+    """API endpoint to download a completed estimate job's workbook (one estimate) or zip"""
+    from flask import send_file
+
+    job = estimate_jobs.get(job_id)
+    if not job:
+        return jsonify({'error': 'Estimate job not found'}), 404
+    if job.status != 'completed':
+        return jsonify({'error': f'Estimate job is {job.status}'}), 409
+    mimetype = EXPORT_MIMETYPES['excel'] if job.output_name.endswith('.xlsx') else 'application/zip'
+    return send_file(job.output_path, mimetype=mimetype, as_attachment=True, download_name=job.output_name)
+
+@app.route('/api/estimate-jobs/<job_id>/cancel', methods=['POST'])
+def api_cancel_estimate_job(job_id):
+    """API endpoint to cancel an estimate job; workbooks not yet rendered are skipped"""
+    return estimate_jobs.cancel(job_id)
+
+# ============================================================================
+# == 4.14 SERVER-SIDE ROW MODEL ENDPOINTS ==================================
+# ============================================================================
+
+GRID_ROWS_MAX_BLOCK = int(os.getenv('GRID_ROWS_MAX_BLOCK', '1000'))  # Rows per server-side block request
+
+# AG-Grid aggregation functions -> SQL, with the column types each accepts
+GRID_AGG_FUNCTIONS = {
+    'sum': ('SUM', ('number',)),
+    'avg': ('AVG', ('number',)),
+    'min': ('MIN', ('number', 'date', 'text')),
+    'max': ('MAX', ('number', 'date', 'text')),
+    'count': ('COUNT', ('number', 'date', 'text', 'bool'))
+}
+
+def _grid_column_id(column, known):
+    """Field of an AG-Grid column descriptor ({"id": ..., "field": ...}); must be registered"""
+    field = column.get('field') or column.get('id') if isinstance(column, dict) else None
+    if field not in known:
+        raise ValueError(f'Unknown column: {field}')
+    return field
+
+def _grid_rows_query(spec, block):
+    """
+    Build (query, params, limit) for one AG-Grid server-side row model block request.
+    Groups whose keys are all in groupKeys are opened: their keys filter the rows. Below the
+    last row group column the block holds rows; otherwise it holds the groups of the next
+    row group column, as its value (text, matching the keys sent back), childCount and the
+    valueCols aggregates. One row beyond endRow is fetched to tell whether more follow.
+
+    Row blocks are ordered by the sortModel, then the grid's default order, which ends in a
+    unique column. Each row block also selects those sort values as text, and the response
+    returns the last row's as lastKey. A block request carrying the previous block's lastKey
+    as afterKey (same sort and filters) seeks past it instead of skipping startRow rows, so
+    deep blocks cost the same as the first. Without afterKey, and for group blocks (a group
+    column has few distinct values), startRow is an OFFSET.
+    Returns (query, params, start_row, limit, key_columns): key_columns are the aliases of
+    the sort values in each row, empty for group blocks.
+    """
+    known = spec['columns']
+    try:
+        start_row = int(block.get('startRow') or 0)
+        end_row = int(block.get('endRow') or start_row + 100)
+    except (TypeError, ValueError):
+        raise ValueError('startRow and endRow must be integers')
+    if start_row < 0 or end_row <= start_row:
+        raise ValueError('endRow must be greater than startRow')
+    if end_row - start_row > GRID_ROWS_MAX_BLOCK:
+        raise ValueError(f'Blocks are limited to {GRID_ROWS_MAX_BLOCK} rows')
+    if block.get('pivotMode') and block.get('pivotCols'):
+        raise ValueError('Pivot mode is not supported')
+
+    group_columns = [_grid_column_id(column, known) for column in block.get('rowGroupCols') or []]
+    group_keys = block.get('groupKeys') or []
+    if len(group_keys) > len(group_columns):
+        raise ValueError('More groupKeys than rowGroupCols')
+
+    params = []
+    conditions = _grid_conditions(spec, block, params)
+    for column, key in zip(group_columns, group_keys):
+        conditions.append(f'grid_rows.{column}::text IS NOT DISTINCT FROM %s')
+        params.append(None if key is None else str(key))
+    sort_model = block.get('sortModel') or []
+    limit = end_row - start_row
+
+    if len(group_keys) < len(group_columns):
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+        column = group_columns[len(group_keys)]
+        select = [f'grid_rows.{column}::text AS {column}', 'COUNT(*) AS "childCount"']
+        aggregates = {}
+        for value_column in block.get('valueCols') or []:
+            field = _grid_column_id(value_column, known)
+            function, types = GRID_AGG_FUNCTIONS.get(value_column.get('aggFunc') or 'sum', (None, ()))
+            if known[field] not in types:
+                raise ValueError(f"Cannot aggregate {field} with {value_column.get('aggFunc')}")
+            aggregates[field] = f'{function}(grid_rows.{field})'
+        select += [f'{expression} AS {field}' for field, expression in aggregates.items() if field != column]
+        order_by = []
+        for sort in sort_model:
+            # The auto group column sorts the groups themselves
+            if str(sort.get('colId')).startswith('ag-Grid-AutoColumn') or sort.get('colId') == column:
+                order_by.append(f"1 {'DESC' if sort.get('sort') == 'desc' else 'ASC'}")
+            elif sort.get('colId') in aggregates:
+                order_by.append(f"{aggregates[sort['colId']]} {'DESC' if sort.get('sort') == 'desc' else 'ASC'}")
+        order_by.append('1')
+        query = (
+            f"SELECT {', '.join(select)} FROM ({spec['source']}) AS grid_rows{where} "
+            f"GROUP BY 1 ORDER BY {', '.join(order_by)}"
+        )
+        return f"{query} LIMIT %s OFFSET %s", params + [limit + 1, start_row], start_row, limit, []
+
+    columns = _grid_visible_columns(block.get('columns'), known)
+    order_terms = []
+    for sort in sort_model:
+        if isinstance(sort, dict) and str(sort.get('colId')).startswith('ag-Grid-AutoColumn'):
+            continue
+        _grid_sort(sort, known)
+        order_terms.append((sort['colId'], sort.get('sort') == 'desc'))
+    order_terms += [(column, False) for column in spec['order_by']]
+    key_columns = [f'_key_{position}' for position in range(len(order_terms))]
+
+    after_key = block.get('afterKey')
+    if after_key is not None:
+        if (not isinstance(after_key, list) or len(after_key) != len(order_terms)
+                or not all(value is None or isinstance(value, str) for value in after_key)):
+            raise ValueError("afterKey must be the previous block's lastKey, with the same sortModel")
+        # Rows after the key in the ORDER BY below, where NULLs sort after every value (ASC
+        # NULLS LAST, DESC NULLS FIRST): the first term that differs decides
+        alternatives = []
+        for position, (column, descending) in enumerate(order_terms):
+            value = after_key[position]
+            if value is None and not descending:
+                continue  # Nothing sorts after NULL in ascending order
+            terms, term_params = [], []
+            for (equal_column, _), equal_value in zip(order_terms[:position], after_key):
+                if equal_value is None:
+                    terms.append(f'grid_rows.{equal_column} IS NULL')
+                else:
+                    terms.append(f'grid_rows.{equal_column} = %s')
+                    term_params.append(equal_value)
+            if value is None:
+                terms.append(f'grid_rows.{column} IS NOT NULL')
+            elif descending:
+                terms.append(f'grid_rows.{column} < %s')
+                term_params.append(value)
+            else:
+                terms.append(f'(grid_rows.{column} > %s OR grid_rows.{column} IS NULL)')
+                term_params.append(value)
+            alternatives.append(f"({' AND '.join(terms)})")
+            params += term_params
+        conditions.append(f"({' OR '.join(alternatives) or 'FALSE'})")
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ''
+    select = [f'grid_rows.{column}' for column in columns] + [
+        f'grid_rows.{column}::text AS {alias}' for (column, _), alias in zip(order_terms, key_columns)
+    ]
+    order_by = [f"grid_rows.{column} {'DESC' if descending else 'ASC'}" for column, descending in order_terms]
+    query = (
+        f"SELECT {', '.join(select)} "
+        f"FROM ({spec['source']}) AS grid_rows{where} ORDER BY {', '.join(order_by)}"
+    )
+    if after_key is not None:
+        return f"{query} LIMIT %s", params + [limit + 1], start_row, limit, key_columns
+    return f"{query} LIMIT %s OFFSET %s", params + [limit + 1, start_row], start_row, limit, key_columns
+
+@app.route('/api/grid/<grid>/rows', methods=['POST'])
+def api_grid_rows(grid):
+    """
+    API endpoint for AG-Grid's server-side row model on any registered grid. The body is the
+    datasource's request (startRow, endRow, sortModel, filterModel, rowGroupCols, groupKeys,
+    valueCols, and afterKey to seek past the previous row block); the response holds only that
+    block's rows, lastRow once the last block is reached (null while more rows follow) and,
+    for row blocks, the lastKey to send as the next block's afterKey.
+    """
+    spec = GRID_EXPORTS.get(grid)
+    if not spec:
+        return jsonify({'error': f'Unknown grid: {grid}'}), 404
+    block = request.get_json(silent=True)
+    if not isinstance(block, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    try:
+        query, params, start_row, limit, key_columns = _grid_rows_query(spec, block)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    conn = None
+    cursor = None
+    try:
+        conn = psycopg2.connect(**DB_CONFIG)
+        cursor = conn.cursor(cursor_factory=RealDictCursor)
+        cursor.execute(query, params)
+        rows = [dict(record) for record in cursor.fetchall()]
+        last_row = start_row + len(rows) if len(rows) <= limit else None
+        rows = rows[:limit]
+        response = {'rows': rows, 'lastRow': last_row}
+        if key_columns:
+            response['lastKey'] = [rows[-1][alias] for alias in key_columns] if rows else None
+            for row in rows:
+                for alias in key_columns:
+                    del row[alias]
+        return jsonify(response)
+    except Exception as e:
+        logger.error(f"Error getting {grid} rows: {e}")
+        return jsonify({'error': str(e)}), 500
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+
+# ============================================================================
+# == 4.15 TAKEOFF ROLLUP ENDPOINTS =========================================
+# ============================================================================
+
+ROLLUP_CACHE_SIZE = int(os.getenv('ROLLUP_CACHE_SIZE', '256'))  # Rollup results kept in memory
+
+# Comprehensive takeoff rows with their cost group; filters use the grid's column names
+TAKEOFF_ROLLUP_SPEC = {
+    'source': """
+        SELECT s.*, cg.cost_group_code, cg.cost_group_name
+        FROM takeoff.comprehensive_takeoff_summary s
+        LEFT JOIN takeoff.cost_codes cc ON cc.cost_code = s.cost_code
+        LEFT JOIN takeoff.cost_groups cg ON cg.cost_group_id = cc.cost_group_id
+    """,
+    'columns': {
+        **GRID_EXPORTS['comprehensive-takeoff-analysis']['columns'],
+        'cost_group_code': 'text', 'cost_group_name': 'text'
+    },
+    'tables': GRID_EXPORTS['comprehensive-takeoff-analysis']['tables'] + ['cost_groups']
+}
+TAKEOFF_ROLLUP_DIMENSIONS = (
+    'plan_full_name', 'option_name', 'cost_group_code', 'cost_group_name', 'cost_code',
+    'item_name', 'vendor_name', 'job_number', 'job_name', 'room'
+)
+TAKEOFF_ROLLUP_MEASURES = ('extended_price', 'quantity', 'calculated_quantity')
+TAKEOFF_ROLLUP_DEFAULT_GROUPS = ['plan_full_name', 'option_name', 'cost_group_code', 'cost_code']
+
+rollup_cache = OrderedDict()  # (query, params, data versions) -> response, least recently used first
+rollup_cache_lock = threading.Lock()
+
+def _takeoff_rollup_query(body):
+    """
+    Build (query, params, group_by, measures) for a takeoff rollup. groupBy lists the levels,
+    outermost first; without groupingSets every prefix of it is totalled (ROLLUP, down to the
+    grand total), otherwise exactly the listed sets, each a subset of groupBy. filterModel and
+    quickFilterText filter the rows as in the comprehensive grid.
+    """
+    group_by = body.get('groupBy') or TAKEOFF_ROLLUP_DEFAULT_GROUPS
+    measures = body.get('values') or ['extended_price']
+    if not isinstance(group_by, list) or not isinstance(measures, list):
+        raise ValueError('groupBy and values must be lists')
+    for column in group_by:
+        if column not in TAKEOFF_ROLLUP_DIMENSIONS:
+            raise ValueError(f'Cannot group by {column}; use {", ".join(TAKEOFF_ROLLUP_DIMENSIONS)}')
+    for column in measures:
+        if column not in TAKEOFF_ROLLUP_MEASURES:
+            raise ValueError(f'Cannot total {column}; use {", ".join(TAKEOFF_ROLLUP_MEASURES)}')
+    if len(set(group_by)) != len(group_by):
+        raise ValueError('groupBy lists a column twice')
+
+    grouping_sets = body.get('groupingSets')
+    if grouping_sets is None:
+        grouping_sets = [group_by[:level] for level in range(len(group_by), -1, -1)]
+    elif not isinstance(grouping_sets, list) or not all(
+        isinstance(grouping_set, list) and set(grouping_set) <= set(group_by) for grouping_set in grouping_sets
+    ):
+        raise ValueError('groupingSets must be lists of groupBy columns')
+    elif not grouping_sets:
+        raise ValueError('groupingSets must list at least one set ([] is the grand total)')
+
+    params = []
+    conditions = _grid_conditions(TAKEOFF_ROLLUP_SPEC, body, params)
+    select = [f'grid_rows.{column}' for column in group_by]
+    if group_by:
+        select.append(f"GROUPING({', '.join(f'grid_rows.{column}' for column in group_by)}) AS grouping_id")
+    select.append('COUNT(*) AS row_count')
+    select += [f'SUM(grid_rows.{column}) AS {column}' for column in measures]
+    sets = ', '.join(
+        '(' + ', '.join(f'grid_rows.{column}' for column in grouping_set) + ')'
+        for grouping_set in grouping_sets
+    )
+    # Each group's subtotal follows its detail rows; the grand total comes last
+    order_by = [
+        term for column in group_by
+        for term in (f'GROUPING(grid_rows.{column})', f'grid_rows.{column}')
+    ]
+    query = (
+        f"SELECT {', '.join(select)} FROM ({TAKEOFF_ROLLUP_SPEC['source']}) AS grid_rows"
+        + (f" WHERE {' AND '.join(conditions)}" if conditions else '')
+        + (f" GROUP BY GROUPING SETS ({sets})" if group_by else '')
+        + (f" ORDER BY {', '.join(order_by)}" if order_by else '')
+    )
+    return query, params, group_by, measures
+
+def _takeoff_rollup(body):
+    """Run a rollup; returns (response, cached). Results are reused until a data version changes."""
+    import json
+
+    query, params, group_by, measures = _takeoff_rollup_query(body)
+    versions = _data_versions(TAKEOFF_ROLLUP_SPEC['tables']) if ROLLUP_CACHE_SIZE else None
+    key = json.dumps([' '.join(query.split()), params, sorted(versions.items())], default=str) if versions else None
+    if key:
+        with rollup_cache_lock:
+            if key in rollup_cache:
+                rollup_cache.move_to_end(key)
+                return rollup_cache[key], True
+
+    conn = psycopg2.connect(**DB_CONFIG)
+    try:
+        with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+            cursor.execute(query, params)
+            records = cursor.fetchall()
+    finally:
+        conn.close()
+
+    rows = []
+    for record in records:
+        row = dict(record)
+        grouping_id = row.pop('grouping_id', 0)
+        # Columns totalled over (bit set, first column highest) are null in the row
+        row['group_level'] = sum(1 for position in range(len(group_by)) if not grouping_id >> (len(group_by) - 1 - position) & 1)
+        for column in measures:
+            row[column] = float(row[column]) if row[column] is not None else None
+        rows.append(row)
+    response = {'groupBy': group_by, 'values': measures, 'rows': rows}
+
+    if key:
+        with rollup_cache_lock:
+            rollup_cache[key] = response
+            while len(rollup_cache) > ROLLUP_CACHE_SIZE:
+                rollup_cache.popitem(last=False)
+    return response, False
+
+@app.route('/api/comprehensive-takeoff-analysis/rollup', methods=['POST'])
+def api_comprehensive_takeoff_rollup():
+    """
+    API endpoint for subtotals of the comprehensive takeoff analysis at every grouping level in
+    one GROUPING SETS query, e.g. {"groupBy": ["plan_full_name", "option_name", "cost_group_code",
+    "cost_code"], "values": ["extended_price"], "filterModel": {...}}. Each row carries its group
+    columns, group_level (how many of groupBy it is grouped by; 0 is the grand total),
+    row_count and the summed values.
+    """
+    body = request.get_json(silent=True)
+    if body is None:
+        body = {}
+    if not isinstance(body, dict):
+        return jsonify({'error': 'Request body must be a JSON object'}), 400
+    try:
+        response, cached = _takeoff_rollup(body)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error computing takeoff rollup: {e}")
+        return jsonify({'error': str(e)}), 500
+    return jsonify({**response, 'cached': cached})
+
 # ============================================================================
 # == 5. MAIN APP RUN BLOCK =================================================
 # ============================================================================